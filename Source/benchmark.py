@@ -0,0 +1,310 @@
+"""
+가상 데이터로 파이프라인 주요 단계의 처리 시간을 측정하고, 실행 간 비교할 수 있도록 결과를 JSON으로 저장합니다.
+
+    python -m Source.benchmark --devices 6 --months 2 --hz 1 --repeat 3 --label 기준
+    python -m Source.benchmark --devices 6 --months 2 --hz 1 --compare latest
+
+측정 단계: load_and_merge_device_data / add_physics_power / parse_and_save_trips / generate_trip_report
+모든 단계는 한 프로세스에서 순서대로 실행되므로 병렬 처리와 무관한 단계별 처리량을 비교합니다.
+함께 시작 시간(새 인터프리터에서 main import까지)과 spawn 방식 워커 풀의 기동 시간도 측정합니다.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from Source import config, data_loader, file_manifest, physics_power, report_generator, synthetic_data, trip_catalog, trip_parser
+
+STAGES = ["load_and_merge", "physics", "parse_and_save_trips", "report"]
+
+
+def make_bench_config(work_dir, parse_cache=False, trip_backend=None):
+    """
+    config 모듈을 복사하여 모든 경로를 work_dir 아래로 바꾼 설정 객체를 만듭니다.
+    실제 데이터/결과 폴더는 건드리지 않습니다.
+    """
+    work_dir = Path(work_dir)
+    bench_config = types.SimpleNamespace(**{k: v for k, v in vars(config).items() if k.isupper()})
+
+    def _rebase(value):
+        if isinstance(value, Path):
+            try:
+                return work_dir / value.relative_to(config.BASE_DIR)
+            except ValueError:
+                return value
+        return value
+
+    bench_config.BASE_DIR = work_dir
+    for name, value in vars(bench_config).items():
+        if isinstance(value, dict):
+            setattr(bench_config, name, {k: _rebase(v) for k, v in value.items()})
+    bench_config.PARSE_CACHE["enabled"] = parse_cache
+    if trip_backend is not None:
+        bench_config.TRIP_OUTPUT["backend"] = trip_backend
+    return bench_config
+
+
+def _prepare_dataset(bench_config, fleet, months, args):
+    """같은 규모/시드의 데이터가 이미 있으면 다시 만들지 않습니다."""
+    spec = {"fleet": fleet, "months": months, "hz": args.hz, "seed": args.seed}
+    spec_path = bench_config.BASE_DIR / "dataset.json"
+    if spec_path.exists() and json.loads(spec_path.read_text(encoding='utf-8')).get("spec") == spec:
+        logging.info(f"기존 가상 데이터를 재사용합니다: {bench_config.BASE_DIR}")
+        return json.loads(spec_path.read_text(encoding='utf-8'))["summary"]
+
+    for key in ("raw_bms_data", "raw_gps_data"):
+        shutil.rmtree(bench_config.PATHS[key], ignore_errors=True)
+    started = time.perf_counter()
+    summary = synthetic_data.generate_dataset(bench_config, fleet, months, args.hz, seed=args.seed)
+    summary["generate_seconds"] = round(time.perf_counter() - started, 2)
+    spec_path.parent.mkdir(parents=True, exist_ok=True)
+    spec_path.write_text(json.dumps({"spec": spec, "summary": summary}, ensure_ascii=False, indent=1), encoding='utf-8')
+    return summary
+
+
+def _clear_outputs(bench_config):
+    for key in ("output_trip", "output_trip_parquet", "cache", "state"):
+        shutil.rmtree(bench_config.PATHS[key], ignore_errors=True)
+    if bench_config.PATHS["trip_catalog"].exists():
+        bench_config.PATHS["trip_catalog"].unlink()
+
+
+def run_once(bench_config, fleet):
+    """전체 단말기를 한 번 처리하고 단계별 {초, 행 수}를 반환합니다."""
+    _clear_outputs(bench_config)
+    timings = {stage: {"seconds": 0.0, "rows": 0} for stage in STAGES}
+    device_ids = [device_id for ids in fleet.values() for device_id in ids]
+    manifest = file_manifest.refresh_manifest(bench_config, device_ids, full_rescan=True)
+    trips = 0
+
+    for car_model, ids in fleet.items():
+        params = bench_config.VEHICLE_PARAMS.get(car_model)
+        for device_id in ids:
+            device_files = file_manifest.lookup_device_files(manifest, device_id)
+
+            started = time.perf_counter()
+            df = data_loader.load_and_merge_device_data(device_id, bench_config, device_files)
+            timings["load_and_merge"]["seconds"] += time.perf_counter() - started
+            if df is None or df.empty:
+                continue
+            timings["load_and_merge"]["rows"] += len(df)
+
+            started = time.perf_counter()
+            if params:
+                df = physics_power.add_physics_power(df, params)
+            timings["physics"]["seconds"] += time.perf_counter() - started
+            timings["physics"]["rows"] += len(df)
+
+            started = time.perf_counter()
+            saved_trips = trip_parser.parse_and_save_trips(df, car_model, device_id, bench_config)
+            trip_catalog.replace_device_trips(car_model, device_id, 1, saved_trips, bench_config)
+            timings["parse_and_save_trips"]["seconds"] += time.perf_counter() - started
+            timings["parse_and_save_trips"]["rows"] += len(df)
+            trips += len(saved_trips)
+
+    started = time.perf_counter()
+    report_generator.generate_trip_report(bench_config)
+    timings["report"]["seconds"] += time.perf_counter() - started
+    timings["report"]["rows"] = trips
+    return timings, trips
+
+
+def _startup_probe(_):
+    """워커에서 실행: _init_worker가 기록한 초기화 시간/준비 시각. 작업이 워커마다 하나씩 가도록 잠시 기다립니다."""
+    import main
+    time.sleep(0.2)
+    return os.getpid(), main._worker_state.get("init_seconds"), main._worker_state.get("ready")
+
+
+def measure_startup(repeat, processes):
+    """
+    시작 시간을 측정합니다.
+    - import_main_s: 새 인터프리터를 띄워 main 모듈 import까지 (메뉴 표시 직전, 중앙값)
+    - pool_ready_s: spawn 방식 워커 풀 생성부터 모든 워커의 _init_worker 완료까지
+    - worker_init_s: 워커 하나의 _init_worker 시간 (처리 모듈 import, 설정 읽기, 평균)
+    """
+    root = Path(__file__).resolve().parent.parent
+    import_seconds = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import main"], cwd=root, check=True, capture_output=True)
+        import_seconds.append(time.perf_counter() - started)
+
+    import main
+    started = time.time()
+    with multiprocessing.get_context("spawn").Pool(processes, initializer=main._init_worker, initargs=({},)) as pool:
+        probes = {pid: (init, ready) for pid, init, ready in pool.map(_startup_probe, range(processes), chunksize=1)}
+    return {
+        "import_main_s": round(statistics.median(import_seconds), 4),
+        "pool_ready_s": round(max(ready for _, ready in probes.values()) - started, 4),
+        "worker_init_s": round(statistics.mean(init for init, _ in probes.values()), 4),
+        "processes": processes,
+        "workers_seen": len(probes),
+    }
+
+
+def _summarize(runs):
+    """반복 실행 결과의 단계별 최솟값/중앙값과 처리량(중앙값 기준 행/초)."""
+    summary = {}
+    for stage in STAGES:
+        seconds = [run[stage]["seconds"] for run in runs]
+        rows = runs[0][stage]["rows"]
+        median = statistics.median(seconds)
+        summary[stage] = {
+            "median_s": round(median, 4),
+            "min_s": round(min(seconds), 4),
+            "runs_s": [round(s, 4) for s in seconds],
+            "rows": rows,
+            "rows_per_s": round(rows / median, 1) if median > 0 else None,
+        }
+    return summary
+
+
+def _environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=Path(__file__).resolve().parent, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        "git_commit": commit,
+        "python": platform.python_version(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+    }
+
+
+def _find_previous(results_dir, scale, exclude):
+    """같은 규모(단말기 수 x 개월 수 x Hz)로 측정한 가장 최근 결과 파일."""
+    candidates = []
+    for path in results_dir.glob("bench_*.json"):
+        if path == exclude:
+            continue
+        try:
+            result = json.loads(path.read_text(encoding='utf-8'))
+        except (OSError, json.JSONDecodeError):
+            continue
+        if result.get("scale") == scale:
+            candidates.append((result["timestamp"], path))
+    return max(candidates)[1] if candidates else None
+
+
+def compare_results(current, previous):
+    """단계별 중앙값을 이전 결과와 비교하여 로그로 출력합니다."""
+    if previous["scale"] != current["scale"]:
+        logging.warning(f"규모가 달라 비교 결과가 정확하지 않을 수 있습니다: {previous['scale']} → {current['scale']}")
+    logging.info(f"이전 결과와 비교 ({previous.get('label') or previous['timestamp']} → {current.get('label') or current['timestamp']}):")
+    for stage in STAGES:
+        before = previous["stages"].get(stage, {}).get("median_s")
+        after = current["stages"][stage]["median_s"]
+        if not before:
+            logging.info(f"  - {stage}: {after:.3f}초 (이전 결과 없음)")
+            continue
+        change = (after - before) / before * 100
+        marker = "🔺" if change > 5 else ("✅" if change < -5 else "  ")
+        logging.info(f"  {marker} {stage}: {before:.3f}초 → {after:.3f}초 ({change:+.1f}%)")
+    for key in ("import_main_s", "pool_ready_s"):
+        before = previous.get("startup", {}).get(key)
+        after = current["startup"][key]
+        if before:
+            change = (after - before) / before * 100
+            marker = "🔺" if change > 5 else ("✅" if change < -5 else "  ")
+            logging.info(f"  {marker} {key}: {before:.3f}초 → {after:.3f}초 ({change:+.1f}%)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="가상 데이터로 파이프라인 단계별 처리 시간을 측정합니다.")
+    parser.add_argument("--devices", type=int, default=3, help="가상 단말기 수")
+    parser.add_argument("--months", type=int, default=1, help="단말기당 개월 수")
+    parser.add_argument("--hz", type=float, default=1.0, help="BMS 샘플링 주파수 (Hz)")
+    parser.add_argument("--start-month", default="2023-01")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3, help="반복 측정 횟수 (중앙값 사용)")
+    parser.add_argument("--label", default="", help="결과 파일에 남길 이름 (예: 브랜치/변경 내용)")
+    parser.add_argument("--work-dir", type=Path, default=None,
+                        help="가상 데이터와 출력을 둘 폴더. 지정하면 실행 후에도 남겨 두고 다음 실행에서 데이터를 재사용합니다.")
+    parser.add_argument("--parse-cache", action="store_true", help="파싱 캐시 사용 (기본: 매번 CSV 파싱)")
+    parser.add_argument("--trip-backend", choices=["csv", "parquet"], default=None)
+    parser.add_argument("--startup-processes", type=int, default=2, help="기동 시간을 측정할 spawn 워커 수")
+    parser.add_argument("--results-dir", type=Path, default=config.BENCHMARK_SETTINGS["results_dir"])
+    parser.add_argument("--compare", default=None,
+                        help="비교할 이전 결과 JSON 경로, 또는 'latest'(같은 규모의 가장 최근 결과)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+
+    work_dir = args.work_dir or Path(tempfile.mkdtemp(prefix="bms_bench_"))
+    bench_config = make_bench_config(work_dir, args.parse_cache, args.trip_backend)
+    fleet = synthetic_data.make_fleet(args.devices)
+    months = synthetic_data.month_range(args.start_month, args.months)
+    scale = {"devices": args.devices, "months": args.months, "hz": args.hz}
+
+    try:
+        dataset = _prepare_dataset(bench_config, fleet, months, args)
+        runs = []
+        for i in range(args.repeat):
+            # 측정 중에는 Trip 저장 로그가 결과를 가리지 않도록 경고 이상만 출력
+            logging.getLogger().setLevel(logging.WARNING)
+            timings, trips = run_once(bench_config, fleet)
+            logging.getLogger().setLevel(logging.INFO)
+            runs.append(timings)
+            logging.info(f"[{i + 1}/{args.repeat}] " + ", ".join(f"{stage} {timings[stage]['seconds']:.2f}초" for stage in STAGES)
+                         + f" (Trip {trips}개)")
+    finally:
+        logging.getLogger().setLevel(logging.INFO)
+        if args.work_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    timestamp = datetime.now()
+    result = {
+        "label": args.label,
+        "timestamp": timestamp.isoformat(timespec='seconds'),
+        "scale": scale,
+        "settings": {"parse_cache": args.parse_cache, "trip_backend": bench_config.TRIP_OUTPUT["backend"],
+                     "repeat": args.repeat, "seed": args.seed},
+        "dataset": dataset,
+        "environment": _environment(),
+        "stages": _summarize(runs),
+        "startup": measure_startup(args.repeat, args.startup_processes),
+    }
+    args.results_dir.mkdir(parents=True, exist_ok=True)
+    result_path = args.results_dir / f"bench_{timestamp:%Y%m%d_%H%M%S}.json"
+    result_path.write_text(json.dumps(result, ensure_ascii=False, indent=1), encoding='utf-8')
+
+    logging.info(f"벤치마크 결과 (단말기 {args.devices}대 x {args.months}개월 x {args.hz}Hz, BMS {dataset['rows']:,}행):")
+    for stage, stats in result["stages"].items():
+        logging.info(f"  - {stage}: 중앙값 {stats['median_s']:.3f}초, 최소 {stats['min_s']:.3f}초, {stats['rows_per_s'] or 0:,.0f}행/초")
+    startup = result["startup"]
+    logging.info(f"  - 시작: main import {startup['import_main_s']:.3f}초, spawn 워커 {startup['workers_seen']}개 준비 "
+                 f"{startup['pool_ready_s']:.3f}초 (워커 초기화 평균 {startup['worker_init_s']:.3f}초)")
+    logging.info(f"🎉 결과 저장: {result_path}")
+
+    if args.compare:
+        previous_path = _find_previous(args.results_dir, scale, result_path) if args.compare == "latest" else Path(args.compare)
+        if previous_path is None:
+            logging.warning("비교할 같은 규모의 이전 결과가 없습니다.")
+        else:
+            compare_results(result, json.loads(previous_path.read_text(encoding='utf-8')))
+    return result
+
+
+if __name__ == "__main__":
+    main()
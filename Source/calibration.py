@@ -0,0 +1,268 @@
+"""
+저장된 Trip의 측정 전력(Power_data)에 맞추어 물리식 파라미터(Ca/Cb/Cc, eff, aux_power, hvac_power)를 보정합니다.
+
+    python -m Source.calibration --car NiroEV --car EV6
+
+물리식(physics_power.add_physics_power)은 파라미터를 계수로 하는 샘플별 기저 함수의 합입니다.
+    P = (Ca·v + Cb·v² + Cc·v³ + M·D⁺ + M·G) / eff + M·D⁻·eff·re_brake + aux + idle·[v≤0.5] + hvac·|22-T|
+    (G: 경사 저항 항, PHYSICS_OPTIONS["grade"]가 켜져 있을 때만)
+따라서 Trip 파일을 한 번 읽어 Trip별 기저 에너지 합(Trip 수 x 기저 수 배열)만 만들어 두면,
+후보 파라미터 조합 수천~수만 개의 Trip별 에너지를 (조합 x 기저) @ (기저 x Trip) 행렬곱으로 한꺼번에 계산할 수 있습니다.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import logging
+import os
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from Source import config, physics_power, trip_catalog
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 백엔드로 저장된 Trip을 읽을 때만 필요합니다.
+    pq = None
+
+# 기저 함수 순서 (_parameter_matrix의 계수 순서와 같아야 합니다)
+BASIS = ["v", "v2", "v3", "accel", "decel", "const", "idle", "hvac", "grade"]
+SAMPLE_COLUMNS = ['time', 'speed', 'acceleration', 'ext_temp', 'Power_data']
+_J_PER_KWH = 3.6e6
+
+
+def _basis_energy(df, starts, inertia_factor, gravity=None):
+    """
+    Trip이 연속으로 이어진 데이터프레임에서 Trip별 기저 에너지 합(J)과 측정 에너지(J)를 계산합니다.
+    starts: 각 Trip의 첫 행 위치
+    gravity: 경사 저항 항을 계산할 때의 중력 가속도 (None이면 경사 항은 0)
+    반환값: (Trip 수 x len(BASIS) 배열, Trip 수 배열)
+    """
+    time_ns = pd.to_datetime(df['time']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    dt = np.diff(time_ns, prepend=time_ns[0]) / 1e9
+    dt[starts] = 0.0
+
+    v = df['speed'].to_numpy(dtype=np.float64)
+    a = df['acceleration'].to_numpy(dtype=np.float64)
+    ext_temp = df['ext_temp'].to_numpy(dtype=np.float64)
+    measured = np.add.reduceat(np.nan_to_num(df['Power_data'].to_numpy(dtype=np.float64) * dt), starts)
+
+    # 물리식 결과가 NaN인 샘플은 Trip 에너지 합에서 빠지므로(nan_to_num) 기저 합에서도 제외
+    dt = np.where(np.isnan(v) | np.isnan(a) | np.isnan(ext_temp), 0.0, dt)
+    v, a, ext_temp = np.nan_to_num(v), np.nan_to_num(a), np.nan_to_num(ext_temp)
+
+    inertia_av = (1 + inertia_factor) * a * v
+    exp_term = np.exp(physics_power.DECEL_EXP_COEF / np.maximum(np.abs(a), physics_power.MIN_ABS_ACCEL))
+    basis = np.zeros((len(v), len(BASIS)))
+    basis[:, 0] = v
+    basis[:, 1] = v**2
+    basis[:, 2] = v**3
+    basis[:, 3] = np.where(a >= 0, inertia_av, 0.0)
+    basis[:, 4] = np.where(a < 0, inertia_av / exp_term, 0.0)
+    basis[:, 5] = 1.0
+    basis[:, 6] = v <= 0.5
+    basis[:, 7] = np.abs(physics_power.TARGET_TEMP - ext_temp)
+    if gravity is not None and 'altitude' in df.columns:
+        # Trip 첫 행은 고도 변화 0, 시간 간격 0은 1초로 보는 물리식과 같은 규칙
+        altitude_diff = np.diff(df['altitude'].to_numpy(dtype=np.float64), prepend=np.nan)
+        altitude_diff[starts] = 0.0
+        distance = v * np.where(dt == 0, 1.0, dt)
+        basis[:, 8] = gravity * physics_power.grade_sine(np.nan_to_num(altitude_diff), distance) * v
+    basis *= dt[:, None]
+    return np.add.reduceat(basis, starts, axis=0), measured
+
+
+def _file_basis_energy(task):
+    """Trip 파일 하나(CSV: Trip 1개, Parquet 파트: Trip 여러 개)의 (기저 에너지, 측정 에너지). 읽지 못하면 (None, None)."""
+    path, backend, inertia_factor, gravity = task
+    try:
+        if backend == "parquet":
+            columns = ['trip_id'] + SAMPLE_COLUMNS
+            if gravity is not None and 'altitude' in pq.read_schema(path).names:
+                columns.append('altitude')
+            df = pq.read_table(path, columns=columns).to_pandas()
+            trip_ids = df['trip_id'].to_numpy()
+            is_start = np.concatenate(([True], trip_ids[1:] != trip_ids[:-1]))
+            starts = np.flatnonzero(is_start)
+        else:
+            wanted = SAMPLE_COLUMNS + (['altitude'] if gravity is not None else [])
+            df = pd.read_csv(path, usecols=lambda col: col in wanted, encoding='utf-8-sig')
+            starts = np.array([0])
+    except (OSError, ValueError) as e:
+        logging.warning(f"Trip 파일을 읽을 수 없어 보정에서 제외합니다: {path}. 오류: {e}")
+        return None, None
+    if df.empty:
+        return None, None
+    return _basis_energy(df, starts, inertia_factor, gravity)
+
+
+def load_trip_energy(config, car_model, processes=None, pool=None):
+    """
+    카탈로그에 기록된 차종의 Trip 파일을 모두 읽어 Trip별 기저 에너지 합과 측정 에너지를 모읍니다.
+    pool: 재사용할 프로세스 풀 (없으면 processes개로 새로 만들고 끝나면 닫음)
+    반환값: (Trip 수 x len(BASIS) 배열, 측정 에너지(J) 배열) 또는 Trip이 없으면 (None, None)
+    """
+    catalog_df = trip_catalog.load_catalog(config, [car_model])
+    if catalog_df is None or catalog_df.empty:
+        logging.warning(f"[{car_model}] Trip 카탈로그에 기록된 Trip이 없습니다. 먼저 파이프라인을 실행하세요.")
+        return None, None
+    files = catalog_df[['path', 'backend']].dropna().drop_duplicates()
+    if (files['backend'] == "parquet").any() and pq is None:
+        logging.error("Parquet Trip 저장소를 읽으려면 pyarrow가 필요합니다. (pip install pyarrow)")
+        return None, None
+
+    gravity = config.GRAVITY if config.PHYSICS_OPTIONS.get("grade", False) else None
+    tasks = [(path, backend, config.INERTIA_FACTOR, gravity) for path, backend in files.itertuples(index=False)]
+    sums, measured = [], []
+    with Pool(processes=processes or os.cpu_count()) if pool is None else contextlib.nullcontext(pool) as pool:
+        for file_sums, file_measured in pool.imap(_file_basis_energy, tasks, chunksize=16):
+            if file_sums is not None:
+                sums.append(file_sums)
+                measured.append(file_measured)
+    if not sums:
+        return None, None
+    return np.ascontiguousarray(np.concatenate(sums)), np.concatenate(measured)
+
+
+def build_grid(base_params, grid_scales):
+    """
+    기존 파라미터에 배율 후보를 곱해 모든 조합을 만듭니다.
+    반환값: {파라미터: 조합 수 길이의 배열} (보정하지 않는 파라미터는 기존 값)
+    """
+    names = list(grid_scales)
+    combos = np.array(list(itertools.product(*(grid_scales[name] for name in names))), dtype=np.float64)
+    grid = {name: np.full(len(combos), float(value)) for name, value in base_params.items()}
+    for i, name in enumerate(names):
+        grid[name] = base_params[name] * combos[:, i]
+    grid["eff"] = np.minimum(grid["eff"], 1.0)
+    return grid
+
+
+def _parameter_matrix(grid, select=slice(None)):
+    """파라미터 조합을 BASIS 순서의 계수 행렬(조합 수 x len(BASIS))로 바꿉니다."""
+    eff = grid["eff"][select]
+    mass = grid["mass"][select] + grid["load"][select]
+    return np.column_stack([
+        grid["Ca"][select] / eff,
+        grid["Cb"][select] / eff,
+        grid["Cc"][select] / eff,
+        mass / eff,
+        mass * eff * (grid["re_brake"][select] == 1),
+        grid["aux_power"][select],
+        grid["idle_power"][select],
+        grid["hvac_power"][select] * grid["hvac_eff"][select],
+        mass / eff,
+    ])
+
+
+def score_grid(grid, sums, measured, batch_elements):
+    """
+    조합별 Trip 에너지 상대 오차의 RMS와 평균(편향)을 계산합니다.
+    (조합 x Trip) 오차 행렬이 batch_elements 원소를 넘지 않도록 조합을 나누어 계산합니다.
+    반환값: (RMS 배열, 편향 배열)
+    """
+    n_combos = len(grid["eff"])
+    batch = max(1, batch_elements // max(len(measured), 1))
+    rms = np.empty(n_combos)
+    bias = np.empty(n_combos)
+    sums_t = np.ascontiguousarray(sums.T)
+    for lo in range(0, n_combos, batch):
+        select = slice(lo, min(lo + batch, n_combos))
+        rel_err = (_parameter_matrix(grid, select) @ sums_t - measured) / measured
+        rms[select] = np.sqrt(np.mean(rel_err**2, axis=1))
+        bias[select] = rel_err.mean(axis=1)
+    return rms, bias
+
+
+def calibrate_car(config, car_model, settings, processes=None, pool=None):
+    """차종 하나의 파라미터를 보정합니다. 반환값: 결과 딕셔너리 또는 보정할 수 없으면 None."""
+    base_params = config.VEHICLE_PARAMS.get(car_model)
+    if not base_params:
+        logging.warning(f"[{car_model}] 차량 파라미터가 없어 보정을 건너뜁니다.")
+        return None
+
+    sums, measured = load_trip_energy(config, car_model, processes, pool)
+    if sums is None:
+        return None
+    usable = measured >= settings["min_trip_kwh"] * _J_PER_KWH
+    sums, measured = sums[usable], measured[usable]
+    if len(measured) == 0:
+        logging.warning(f"[{car_model}] 측정 에너지가 {settings['min_trip_kwh']}kWh 이상인 Trip이 없어 보정을 건너뜁니다.")
+        return None
+
+    base_rms, base_bias = score_grid({k: np.array([float(v)]) for k, v in base_params.items()}, sums, measured,
+                                     settings["batch_elements"])
+    grid = build_grid(base_params, settings["grid_scales"])
+    rms, bias = score_grid(grid, sums, measured, settings["batch_elements"])
+
+    top = np.argsort(rms, kind='stable')[:settings["top_n"]]
+    names = list(settings["grid_scales"])
+    best = dict(base_params, **{name: float(grid[name][top[0]]) for name in names})
+    logging.info(f"✅ [{car_model}] Trip {len(measured):,}개 x 조합 {len(rms):,}개: 에너지 상대 오차(RMS) "
+                 f"{base_rms[0] * 100:.1f}% → {rms[top[0]] * 100:.1f}% (편향 {bias[top[0]] * 100:+.1f}%)")
+    return {
+        "params": best,
+        "n_trips": int(len(measured)),
+        "n_candidates": int(len(rms)),
+        "rms_rel_error": float(rms[top[0]]),
+        "bias_rel_error": float(bias[top[0]]),
+        "base_rms_rel_error": float(base_rms[0]),
+        "base_bias_rel_error": float(base_bias[0]),
+        "top": [
+            {**{name: float(grid[name][i]) for name in names},
+             "rms_rel_error": float(rms[i]), "bias_rel_error": float(bias[i])}
+            for i in top
+        ],
+    }
+
+
+def run_calibration(config, car_models, processes=None, pool=None):
+    """
+    선택한 차종을 보정하고 결과를 VEHICLE_PARAMS와 같은 형식의 JSON 파일로 저장합니다.
+    pool: Trip 파일을 읽을 때 재사용할 프로세스 풀 (메인 메뉴의 워커 풀)
+    """
+    settings = config.CALIBRATION_SETTINGS
+    results = {}
+    for car_model in car_models:
+        result = calibrate_car(config, car_model, settings, processes, pool)
+        if result is not None:
+            results[car_model] = result
+    if not results:
+        logging.warning("보정 결과가 없어 파라미터 파일을 저장하지 않습니다.")
+        return None
+
+    output_path = settings["output"]
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "grid_scales": settings["grid_scales"],
+        "min_trip_kwh": settings["min_trip_kwh"],
+        "VEHICLE_PARAMS": {car_model: result["params"] for car_model, result in results.items()},
+        "fit": {car_model: {k: v for k, v in result.items() if k != "params"} for car_model, result in results.items()},
+    }
+    tmp_path = output_path.with_name(output_path.name + '.tmp')
+    tmp_path.write_text(json.dumps(payload, ensure_ascii=False, indent=1), encoding='utf-8')
+    os.replace(tmp_path, output_path)
+    logging.info(f"🎉 보정된 차량 파라미터 저장: {output_path}")
+    return payload
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="저장된 Trip의 측정 에너지에 맞추어 물리식 파라미터를 보정합니다.")
+    parser.add_argument("--car", action="append", dest="cars", default=None,
+                        help="보정할 차종 (여러 번 지정 가능, 기본: VEHICLE_PARAMS의 모든 차종)")
+    parser.add_argument("--processes", type=int, default=None, help="Trip 파일을 읽을 프로세스 수 (기본: CPU 코어 수)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    return run_calibration(config, args.cars or list(config.VEHICLE_PARAMS), args.processes)
+
+
+if __name__ == "__main__":
+    main()
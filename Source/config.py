@@ -10,7 +10,12 @@ PATHS = {
     "raw_bms_data": BASE_DIR / "Data/GSmbiz/BMS_Data",
     "raw_gps_data": BASE_DIR / "Data/GSmbiz/gps_altitude",
     "output_trip": BASE_DIR / "Processed_Data/Trips",
+    "output_trip_parquet": BASE_DIR / "Processed_Data/TripStore",  # Parquet Trip 저장소 (TRIP_OUTPUT 참고)
     "output_report": BASE_DIR / "Processed_Data",
+    "cache": BASE_DIR / "Processed_Data/Cache",
+    "state": BASE_DIR / "Processed_Data/State",    # 증분 실행용 단말기별 마지막 실행 상태
+    "trip_catalog": BASE_DIR / "Processed_Data/trip_catalog.sqlite",  # Trip별 지표 카탈로그 (리포트/분석용)
+    "run_journal": BASE_DIR / "Processed_Data/State/run_journal.jsonl",  # 마지막 실행의 단말기 완료 기록 (이어서 실행용)
 }
 
 # --- 2. 물리 모델 상수 (Physics Constants) ---
@@ -59,4 +64,191 @@ VEHICLE_PARAMS = {
         "Ca": 23.290 * 4.44822, "Cb": 0.23788 * 4.44822 * 2.237, "Cc": 0.019822 * 4.44822 * (2.237**2),
         "aux_power": 250, "hvac_power": 350, "idle_power": 0, "hvac_eff": 0.81
     },
-}
\ No newline at end of file
+}
+
+# --- 5. 원본 파일 매니페스트 (Raw File Manifest) ---
+# 전체 원본 트리를 한 번만 병렬 스캔하여 경로/단말기/연월/크기/수정시각을 기록합니다.
+# 이후 실행에서는 디렉토리 수정시각(mtime)이 바뀐 폴더만 다시 읽습니다.
+MANIFEST_SETTINGS = {
+    "path": PATHS["cache"] / "raw_manifest.json",  # 매니페스트 저장 경로
+    "scan_workers": 16,                             # 디렉토리 병렬 스캔 스레드 수
+}
+
+# --- 6. 파싱 캐시 (Parsed File Cache) ---
+# 한 번 파싱한 원본 CSV를 (경로 + 크기 + 수정시각) 키로 Parquet에 저장해 두고,
+# 이후 실행에서는 필요한 열만 읽습니다. 원본 파일마다 최신 캐시 하나만 남깁니다. pyarrow가 필요합니다.
+PARSE_CACHE = {
+    "enabled": True,
+    "dir": PATHS["cache"] / "parsed",
+    "compression": "zstd",
+}
+
+# --- 7. 원본 읽기 설정 (Ingestion Settings) ---
+# 열 선언과 dtype은 Source/schema.py에 있습니다.
+INGEST_SETTINGS = {
+    "engine": "c",      # 'c' 또는 'pyarrow' (pyarrow 미설치 시 'c'로 대체)
+    "downcast": True,   # 숫자 열을 float32/int8로 읽어 워커 메모리 사용량 절감
+    "merge_sorted": True,  # 파일별로 정렬 후 시간이 겹치는 파일끼리만 병합/중복 제거 (전체 정렬 대신)
+}
+
+# --- 8. 스트리밍 처리 (Bounded-memory Streaming) ---
+# 원본 BMS 용량이 기준 이상인 단말기는 전체 이력을 합치지 않고 월 단위 청크로 처리합니다.
+# 최대 메모리는 단말기 이력 전체가 아닌 한 달 분량(+ 진행 중인 Trip 하나)으로 제한됩니다.
+STREAMING_SETTINGS = {
+    "enabled": True,
+    "min_device_bytes": 2 * 1024**3,  # 2GB 이상인 단말기부터 스트리밍 (0이면 모든 단말기)
+}
+
+# --- 9. Trip 저장 방식 (Trip Output Backend) ---
+# 'csv'    : Trip 하나당 CSV 파일 하나 (기존 방식, output_trip)
+# 'parquet': 차종/단말기/연월로 파티션된 Parquet 데이터셋 (output_trip_parquet, pyarrow 필요)
+#            메뉴에서 기존 CSV 레이아웃으로 내보낼 수 있습니다.
+TRIP_OUTPUT = {
+    "backend": "csv",
+    "compression": "zstd",
+    "batch_rows": 500_000,  # 워커가 Trip을 모았다가 한 번에 기록하는 행 수
+}
+
+# --- 10. 작업 스케줄링 (Size-aware Scheduling) ---
+# 단말기를 원본 용량이 큰 순서로 워커에 배분하고, 아주 큰 단말기는 연월 구간(샤드)으로 나누어 병렬 처리합니다.
+# 샤드 경계에 걸친 Trip은 부모 프로세스가 이어 붙인 뒤 Trip 번호를 최종 번호로 다시 매깁니다. (전체 실행에서만 사용)
+SCHEDULER_SETTINGS = {
+    "shard_min_bytes": 8 * 1024**3,     # 이 용량 이상인 단말기를 샤드로 분할 (0이면 분할하지 않음)
+    "target_shard_bytes": 2 * 1024**3,  # 샤드 하나의 목표 원본 용량
+    "staging_dir": PATHS["cache"] / "shards",  # 샤드가 임시 번호로 Trip을 저장하는 폴더
+}
+
+# --- 11. 실행 텔레메트리 (Run Telemetry) ---
+# 단말기(샤드) 작업마다 단계별 소요 시간, 입출력 행 수, 읽은/쓴 바이트, 최대 메모리를 JSON Lines로 기록합니다.
+# 실행이 끝나면 가장 오래 걸린 단말기와 단계별 합계를 로그로 요약합니다.
+TELEMETRY = {
+    "enabled": True,
+    "dir": PATHS["output_report"] / "Telemetry",  # run_<실행시각>.jsonl
+    "summary_top_n": 5,                           # 요약에 표시할 느린 단말기 수
+}
+
+# --- 12. 벤치마크 (Benchmark) ---
+# python -m Source.benchmark 로 가상 데이터를 만들어 주요 단계의 처리 시간을 측정합니다.
+BENCHMARK_SETTINGS = {
+    "results_dir": PATHS["output_report"] / "Benchmarks",  # 실행 간 비교를 위한 결과 JSON 저장 위치
+}
+
+# --- 13. GPS 시간 범위 색인 (GPS Time-range Index) ---
+# 단말기별로 GPS 파일 → [최소 시각, 최대 시각] 색인과 시간순으로 정렬된 열 기반 저장본(Parquet)을 만들어 두고,
+# GPS 병합 때 BMS 시간 범위와 겹치는 파일/행만 읽습니다. 원본 파일의 크기/수정 시각이 바뀌면 해당 파일만 다시 색인합니다.
+# pyarrow가 없으면 정렬 저장본 없이 색인으로 파일만 골라 원본 CSV를 읽습니다.
+GPS_INDEX = {
+    "enabled": True,
+    "dir": PATHS["cache"] / "gps_index",  # <단말기>/index.json, <단말기>/<키>.parquet
+    "compression": "zstd",
+}
+
+# --- 14. 물리식 파라미터 보정 (Physics Parameter Calibration) ---
+# python -m Source.calibration (또는 메뉴 5번): 카탈로그의 Trip 파일을 한 번 읽어 Trip별 측정 에너지(Power_data)와
+# 물리식 에너지의 상대 오차(RMS)가 가장 작은 파라미터 조합을 찾아 JSON으로 저장합니다. (VEHICLE_PARAMS는 바꾸지 않음)
+CALIBRATION_SETTINGS = {
+    # VEHICLE_PARAMS 값에 곱할 배율 후보. 모든 조합(아래 기본값은 5x5x5x5x4x4 = 10,000개)을 평가합니다.
+    "grid_scales": {
+        "Ca": [0.6, 0.8, 1.0, 1.2, 1.4],
+        "Cb": [0.6, 0.8, 1.0, 1.2, 1.4],
+        "Cc": [0.6, 0.8, 1.0, 1.2, 1.4],
+        "eff": [0.9, 0.95, 1.0, 1.05, 1.1],  # 1.0을 넘는 효율은 1.0으로 제한
+        "aux_power": [0.5, 1.0, 1.5, 2.0],
+        "hvac_power": [0.5, 1.0, 1.5, 2.0],
+    },
+    "min_trip_kwh": 0.5,               # 측정 에너지가 이보다 작은 Trip은 상대 오차가 커서 제외
+    "batch_elements": 20_000_000,      # 한 번에 계산하는 (조합 x Trip) 원소 수 상한 (float64 기준 약 160MB)
+    "top_n": 10,                       # 결과 파일에 남길 상위 조합 수
+    "output": PATHS["output_report"] / "Calibration" / "vehicle_params_calibrated.json",
+}
+
+# --- 15. 물리식 계산 옵션 (Physics Kernel Options) ---
+PHYSICS_OPTIONS = {
+    "backend": "auto",    # auto(numba → numexpr → numpy 순서로 설치된 것) | numpy | numexpr | numba
+    "dtype": "float64",   # "float32"로 바꾸면 계산 메모리가 절반 (Power_phys 유효 숫자 약 7자리)
+    "grade": False,       # 고도 변화로 경사 저항(F)을 계산하여 더함 (altitude가 있는 구간만)
+    "block_rows": 65536,  # numpy 백엔드가 한 번에 계산하는 행 수 (임시 배열 크기)
+}
+
+# --- 16. 여러 노드 분산 실행 (Multi-node Execution) ---
+# python main.py --cars ... --queue <큐 이름> 으로 여러 노드가 공유 드라이브의 작업 큐에서 단말기를 하나씩 가져가 처리합니다.
+# 노드별 카탈로그(trip_catalog.<노드>.sqlite)는 python main.py --merge 로 기본 카탈로그에 합친 뒤 리포트를 만듭니다.
+WORK_QUEUE = {
+    "dir": PATHS["state"] / "queue",   # <큐 이름>/<차종>__<단말기>.claim|.done
+    "stale_claim_seconds": 6 * 3600,   # 다른 호스트의 처리 중 표시를 만료로 보는 시간 (같은 호스트는 프로세스 종료 시 바로 회수)
+}
+
+# --- 17. 입출력 겹치기 (Overlapped I/O) ---
+# 워커 안에서 다음 원본 파일을 스레드로 미리 읽고 Trip 저장은 백그라운드 스레드에 맡겨, 계산과 디스크/네트워크 입출력을 겹칩니다.
+# 미리 읽은 데이터와 저장 대기 중인 Trip의 합계는 워커 프로세스마다 max_inflight_bytes로 제한합니다.
+IO_OVERLAP = {
+    "enabled": True,
+    "read_threads": 2,                     # 원본 파일 미리 읽기 스레드 수 (0이면 순서대로 읽음)
+    "read_ahead_files": 4,                 # 아직 처리하지 않은 채 미리 읽어 둘 최대 파일 수
+    "write_queue_depth": 8,                # 저장 대기열에 쌓아 둘 최대 Trip 수 (0이면 바로 저장)
+    "max_inflight_bytes": 512 * 1024**2,   # 미리 읽기(원본 파일 크기) + 저장 대기(Trip 메모리 크기) 합계 상한
+}
+
+# --- 18. 학습용 Trip 배열 저장소 (Memory-mapped Trip Arrays) ---
+# 차종별 전체 Trip을 채널별 고정 dtype 배열(.npy)과 Trip 시작 위치(offsets)로 묶어, 파싱 없이 메모리 맵으로 읽게 합니다.
+# python -m Source.trip_arrays --car NiroEV (또는 메뉴 7번). enabled면 파이프라인 실행이 끝날 때 선택한 차종을 다시 만듭니다.
+TRIP_ARRAYS = {
+    "enabled": False,
+    "dir": PATHS["output_report"] / "TripArrays",   # <차종>/<채널>.npy, time.npy, offsets.npy, index.json
+    "channels": [
+        'speed', 'acceleration', 'ext_temp', 'int_temp', 'soc', 'soh', 'altitude',
+        'pack_volt', 'pack_current', 'Power_data', 'Power_phys',
+    ],
+    "dtype": "float32",   # 채널 배열의 dtype (time은 항상 datetime64[ns])
+}
+
+# --- 19. 실시간 Trip 분할 (Live Watch Mode) ---
+# python -m Source.live_segmenter --car NiroEV (또는 메뉴 8번)으로 새로 들어오는 BMS/GPS 파일을 주기적으로 감시하여,
+# 추가된 행만 읽어 배치 실행과 같은 규칙(600초 간격, 충전 케이블 변경, TRIP_THRESHOLDS)으로 Trip을 닫는 즉시 저장합니다.
+# 단말기마다 마지막 샘플/열린 Trip의 누적 지표만 메모리에 두고, 열린 Trip의 행은 state_dir에 조각으로 모아 둡니다.
+LIVE_WATCH = {
+    "poll_seconds": 30,                             # 감시 주기 (처리할 추가분이 남아 있으면 기다리지 않고 바로 이어서 읽음)
+    "close_after_seconds": 900,                     # 새 행 없이 이 시간이 지나면 열린 Trip을 닫음 (600초 간격 + 파일 도착 지연 여유)
+    "max_read_bytes": 64 * 1024**2,                 # 단말기 하나가 한 번에 읽을 최대 추가분 크기
+    "state_dir": PATHS["state"] / "live",           # <차종>/<단말기>.json (파일별 읽은 위치, 마지막 샘플, 열린 Trip), <단말기>.open/
+    "output_root": PATHS["output_report"] / "LiveTrips",  # 실시간 Trip 저장 위치 (TRIP_OUTPUT 백엔드), live_trips.jsonl
+}
+
+# --- 20. 일자/외기온도별 합산 지표 (Daily Rollups) ---
+# 워커가 Trip을 저장할 때 Trip별로 일자 x 외기온도 구간 단위의 주행거리/주행·정지 시간/측정·물리식 에너지 합계를 계산하여
+# Trip 카탈로그(trip_rollups 테이블)에 기록합니다. 리포트의 월별/외기온도별 전비 시트는 Trip 파일 대신 이 합계를 읽습니다.
+ROLLUPS = {
+    "enabled": True,
+    "temp_band_width": 5,   # 외기온도 구간 폭 (°C)
+}
+
+# --- 21. 로컬 DEM 고도 보정 (Elevation Tiles) ---
+# GPS 병합 시 위경도로 로컬 DEM 타일(SRTM .hgt, 예: N37E127.hgt)의 지형 고도를 쌍선형 보간하여 고도 열에 반영합니다.
+# 켜면 고도(altitude) 파일이 없는 단말기도 GPS 파일이 있으면 GPS를 병합해 고도를 얻습니다. 네트워크 호출은 없으며 타일이 없는 범위는 비워 둡니다.
+# PHYSICS_OPTIONS["grade"]로 경사 저항을 켤 때 고도 잡음을 줄이려면 "replace"를 사용합니다.
+ELEVATION = {
+    "enabled": False,
+    "dir": BASE_DIR / "Data/DEM",      # .hgt 타일 폴더
+    "mode": "fill",                      # "fill": 비어 있는 고도만 채움, "replace": DEM 고도를 우선 사용
+    "max_tiles": 16,                     # 메모리 맵으로 열어 둘 최근 타일 수 (LRU)
+}
+
+# --- 22. 리포트 출력 (Report Output) ---
+# Trip_report.xlsx는 쓰기 전용(write-only) 통합 문서로 행 단위로 바로 기록합니다.
+# 시트의 표들은 분석 도구에서 바로 읽을 수 있도록 아래 형식의 사본으로도 저장합니다. (Parquet은 pyarrow 필요)
+REPORT_OUTPUT = {
+    "companions": ["parquet", "csv"],   # 표 사본 형식 (빈 리스트면 저장하지 않음)
+    "companion_dir": PATHS["output_report"] / "Report",
+}
+
+# --- 23. 물리식 검증 (Physics Validation) ---
+# python -m Source.validation (또는 메뉴 9번): 카탈로그의 Trip 파일을 프로세스 풀에서 읽어 물리식 전력(Power_phys)과
+# 측정 전력(Power_data)의 Trip별/차종별 오차와 속도 x 외기온도 구간별 편향/RMSE를 계산합니다.
+# 차종별 요약과 구간별 표는 Trip 리포트의 '물리식_검증' 시트로도 들어갑니다.
+VALIDATION_SETTINGS = {
+    "speed_bin_kmh": 10,               # 속도 구간 폭 (km/h)
+    "temp_band_width": 5,              # 외기온도 구간 폭 (°C)
+    "min_trip_kwh": 0.5,               # Trip별 에너지 오차(%) 통계에 포함할 최소 측정 에너지
+    "files_per_task": 64,              # 프로세스 풀 작업 하나가 읽는 Trip 파일 수
+    "output_dir": PATHS["output_report"] / "Validation",
+}
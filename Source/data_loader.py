@@ -1,43 +1,272 @@
+import io
 import logging
 import glob
+import itertools
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
-from pathlib import Path
+from Source import elevation, file_manifest, gps_index, io_overlap, parse_cache, schema, telemetry
 
-def _read_csv_with_fallback_encodings(file_path):
+try:
+    import pyarrow  # noqa: F401  (pd.read_csv의 engine='pyarrow' 사용 가능 여부 확인)
+    _HAS_PYARROW = True
+except ImportError:
+    _HAS_PYARROW = False
+
+# BMS 행에 붙일 GPS 행의 최대 시각 차이 (merge_asof nearest)
+GPS_MERGE_TOLERANCE = pd.Timedelta(seconds=2)
+
+
+def _read_csv(file_path, encoding, engine, column_schema, downcast):
+    """
+    단일 엔진/인코딩으로 CSV를 읽습니다.
+    column_schema가 주어지면 선언된 열만(usecols) 선언된 dtype으로 읽습니다.
+    file_path 대신 bytes(헤더 포함 CSV 내용)를 넘기면 메모리에서 읽습니다. (실시간 감시 모드의 추가분 읽기)
+    """
+    def source():
+        return io.BytesIO(file_path) if isinstance(file_path, bytes) else file_path
+
+    kwargs = {"encoding": encoding, "engine": engine}
+    if engine == 'c':
+        kwargs["low_memory"] = False
+    if column_schema is None:
+        return pd.read_csv(source(), **kwargs)
+
+    # 원본 헤더에는 공백이 섞여 있을 수 있으므로, 헤더만 먼저 읽어 실제 열 이름에 스키마를 매핑
+    raw_columns = pd.read_csv(source(), nrows=0, encoding=encoding).columns
+    usecols = [col for col in raw_columns if str(col).strip() in column_schema]
+    dtypes = schema.read_dtypes(column_schema, downcast)
+    try:
+        df = pd.read_csv(source(), usecols=usecols, dtype={col: dtypes[col.strip()] for col in usecols}, **kwargs)
+    except (UnicodeDecodeError, pd.errors.ParserError):
+        raise
+    except (ValueError, TypeError):
+        # 숫자 열에 문자열이 섞여 있으면 dtype 지정 없이 읽은 뒤 finalize_dtypes에서 강제 변환
+        df = pd.read_csv(source(), usecols=usecols, **kwargs)
+    df.columns = df.columns.str.strip()
+    return schema.finalize_dtypes(df, column_schema, downcast)
+
+
+def _read_csv_with_fallback_encodings(file_path, column_schema=None, engine='c', downcast=True):
     """ CSV 파싱 에러에 더 안정적으로 대응하도록 수정된 함수."""
+    label = f"<메모리 CSV {len(file_path)} bytes>" if isinstance(file_path, bytes) else file_path
     try:
-        # 1. 가장 빠른 C 엔진으로 시도
-        return pd.read_csv(file_path, encoding='utf-8', low_memory=False)
+        # 1. 가장 빠른 엔진(C 또는 pyarrow)으로 시도
+        return _read_csv(file_path, 'utf-8', engine, column_schema, downcast)
     except UnicodeDecodeError:
         try:
             # 2. 인코딩 문제일 경우, 다른 인코딩으로 재시도
-            logging.warning(f"UTF-8 디코딩 실패. ISO-8859-1로 재시도: {file_path}")
-            return pd.read_csv(file_path, encoding='iso-8859-1', low_memory=False)
+            logging.warning(f"UTF-8 디코딩 실패. ISO-8859-1로 재시도: {label}")
+            return _read_csv(file_path, 'iso-8859-1', engine, column_schema, downcast)
         except Exception as e:
-            logging.error(f"파일 읽기 실패(ISO-8859-1): {file_path}. 오류: {e}")
+            logging.error(f"파일 읽기 실패(ISO-8859-1): {label}. 오류: {e}")
             return None
     except pd.errors.ParserError as e:
         # 3. ✅ C 엔진 파싱 에러 발생 시, 느리지만 안정적인 파이썬 엔진으로 재시도
-        logging.warning(f"C 파서 오류 발생. Python 엔진으로 재시도: {file_path}. 오류: {e}")
+        logging.warning(f"C 파서 오류 발생. Python 엔진으로 재시도: {label}. 오류: {e}")
         try:
-            return pd.read_csv(file_path, encoding='utf-8', engine='python')
+            return _read_csv(file_path, 'utf-8', 'python', column_schema, downcast)
         except Exception as py_e:
-            logging.error(f"Python 엔진으로도 파일 읽기 최종 실패: {file_path}. 오류: {py_e}")
+            logging.error(f"Python 엔진으로도 파일 읽기 최종 실패: {label}. 오류: {py_e}")
             return None
     except Exception as e:
-        logging.error(f"예상치 못한 오류로 파일 읽기 실패: {file_path}. 오류: {e}")
+        logging.error(f"예상치 못한 오류로 파일 읽기 실패: {label}. 오류: {e}")
+        return None
+
+def _find_device_files(device_id, config, device_files=None):
+    """
+    단말기의 BMS 파일 레코드 목록을 반환합니다.
+    매니페스트 조회 결과(device_files)가 주어지면 디렉토리를 탐색하지 않습니다.
+    """
+    with telemetry.stage("discovery") as counter:
+        if device_files is not None:
+            records = device_files["bms"]
+        else:
+            base_path = config.PATHS["raw_bms_data"]
+            pattern = f'**/*{device_id}*.csv'
+            records = [file_manifest.make_record(f, device_id) for f in base_path.glob(pattern)]
+        counter.rows_out = len(records)  # discovery 단계의 출력 행 수는 찾은 파일 수
+    return records
+
+
+def _read_engine(config):
+    """설정된 read_csv 엔진. pyarrow가 없으면 C 엔진을 사용합니다."""
+    engine = config.INGEST_SETTINGS.get("engine", "c")
+    if engine == "pyarrow" and not _HAS_PYARROW:
+        return "c"
+    return engine
+
+
+def _kind_schema(kind):
+    if kind == "bms":
+        return schema.BMS_SCHEMA, schema.BMS_TIME_FORMATS
+    return schema.GPS_SCHEMA, schema.GPS_TIME_FORMATS
+
+
+def _load_raw_file(record, kind, config):
+    """
+    원본 CSV 하나를 스키마에 맞게 읽고 시간 파싱까지 마친 데이터프레임을 반환합니다.
+    파싱 캐시가 있으면 CSV 대신 캐시에서 필요한 열만 읽습니다.
+    """
+    column_schema, time_formats = _kind_schema(kind)
+    downcast = config.INGEST_SETTINGS.get("downcast", True)
+    try:
+        # 매니페스트의 크기/수정시각은 이어 쓰기를 놓칠 수 있으므로 캐시 키와 읽기 크기는 지금 stat한 값으로 정합니다.
+        # 캐시 읽기와 저장에 같은 값을 써서, 읽는 도중 추가된 행이 이전 내용의 캐시 키로 저장되지 않게 합니다.
+        record = file_manifest.restat(record)
+    except OSError as e:
+        logging.error(f"파일 읽기 실패: {record['path']}. 오류: {e}")
         return None
+    # 스키마 버전/다운캐스트 여부가 바뀌면 다른 캐시 항목을 사용
+    variant = f"{kind}-v{schema.SCHEMA_VERSION}-{'f32' if downcast else 'f64'}"
+
+    with telemetry.stage("csv_read") as counter:
+        use_cache = parse_cache.is_enabled(config)
+        if use_cache:
+            df = parse_cache.read_cached(record, config, list(column_schema), variant)
+            if df is not None:
+                counter.bytes = parse_cache.cache_path_for(record, config, variant).stat().st_size
+                counter.rows_out = len(df)
+                return df
+
+        df = _read_csv_with_fallback_encodings(record["path"], column_schema, _read_engine(config), downcast)
+        counter.bytes = record["size"]
+        if df is None:
+            return None
+
+        if 'time' in df.columns:
+            # 파일마다 샘플로 형식을 한 번 결정하고 전체 열은 한 번만 변환
+            df['time'] = schema.parse_time(df['time'], time_formats, record["path"])
+
+        if use_cache:
+            parse_cache.write_cached(df, record, config, variant)
+        counter.rows_out = len(df)
+    return df
 
-def _find_device_files(device_id, config):
-    base_path = config.PATHS["raw_bms_data"]
-    pattern = f'**/*{device_id}*.csv'
-    return list(base_path.glob(pattern))
 
-def _preprocess_dataframe(df, device_id):
+def load_raw_bytes(data, kind, config, label):
+    """
+    헤더 줄을 포함한 CSV 내용(bytes)을 _load_raw_file과 같은 방식으로 읽습니다. (파싱 캐시는 사용하지 않음)
+    label: 로그에 표시할 원본 파일 경로
+    """
+    column_schema, time_formats = _kind_schema(kind)
+    with telemetry.stage("csv_read") as counter:
+        df = _read_csv_with_fallback_encodings(data, column_schema, _read_engine(config),
+                                               config.INGEST_SETTINGS.get("downcast", True))
+        counter.bytes = len(data)
+        if df is None:
+            return None
+        if 'time' in df.columns:
+            df['time'] = schema.parse_time(df['time'], time_formats, label)
+        counter.rows_out = len(df)
+    return df
+
+
+def _time_sorted_file(df):
+    """파일 하나의 행을 시간순으로 정렬합니다. 원본 파일은 대부분 이미 정렬되어 있어 확인만 합니다."""
+    if df['time'].hasnans:
+        df = df[df['time'].notna()]
+    if not df['time'].is_monotonic_increasing:
+        # 같은 시각의 행은 파일 안의 순서를 유지 (중복 제거 시 첫 행을 남기기 위함)
+        df = df.sort_values('time', kind='stable')
+    return df
+
+
+def _overlap_windows(files):
+    """
+    파일 둘 이상이 함께 덮는 시간 구간 [시작, 끝] 목록 (시간순, 서로 겹치지 않음).
+    시작 시각 순으로 훑으면 각 파일이 앞 파일들과 겹치는 구간은 [파일 시작, min(파일 끝, 앞 파일들의 최대 끝)]입니다.
+    """
+    windows = []
+    max_end = None
+    for df in sorted(files, key=lambda df: df['time'].iloc[0]):
+        start, end = df['time'].iloc[0], df['time'].iloc[-1]
+        if max_end is not None and start <= max_end:
+            hi = min(end, max_end)
+            if windows and start <= windows[-1][1]:
+                windows[-1][1] = max(windows[-1][1], hi)
+            else:
+                windows.append([start, hi])
+        max_end = end if max_end is None else max(max_end, end)
+    return windows
+
+
+def _merge_sorted_files(df_list):
+    """
+    파일별로 정렬한 데이터를 시간순으로 합치고 중복 시각을 제거합니다.
+    여러 파일이 함께 덮는 시간 구간(겹침 창)의 행만 파일 순서대로 모아 정렬된 구간들을 병합하고
+    (numpy의 stable 정렬은 정렬된 구간을 찾아 병합하는 timsort), 나머지 행은 파일에서 잘라 그대로 이어 붙이므로
+    전체 이력을 다시 정렬하지 않습니다. 같은 시각의 행은 파일 순서/행 순서상 첫 행을 남겨,
+    전체를 이어 붙인 뒤 drop_duplicates + sort_values 한 결과와 같습니다.
+    """
+    columns = list(dict.fromkeys(col for df in df_list for col in df.columns))
+    files = [df for df in (_time_sorted_file(df) for df in df_list) if not df.empty]
+    if not files:
+        return pd.concat([df.iloc[:0] for df in df_list], ignore_index=True)
+
+    windows = _overlap_windows(files)
+    pieces = []                                  # 겹침 창 밖의 파일 조각 (서로 시간이 겹치지 않음)
+    window_parts = [[] for _ in windows]         # 겹침 창별 파일 조각 (파일 순서)
+    for df in files:
+        times = df['time'].to_numpy()
+        bounds = np.array(windows, dtype=times.dtype).reshape(-1, 2)
+        starts = np.searchsorted(times, bounds[:, 0], side='left')
+        ends = np.searchsorted(times, bounds[:, 1], side='right')
+        prev = 0
+        for w, (lo, hi) in enumerate(zip(starts, ends)):
+            if lo > prev:
+                pieces.append(df.iloc[prev:lo])
+            if hi > lo:
+                window_parts[w].append(df.iloc[lo:hi])
+            prev = max(prev, hi)
+        if prev < len(df):
+            pieces.append(df.iloc[prev:])
+    for parts in window_parts:
+        if len(parts) == 1:
+            pieces.append(parts[0])
+        elif parts:
+            merged = pd.concat(parts, ignore_index=True)
+            # 같은 시각이면 앞 파일의 행이 먼저 오도록 안정 병합
+            pieces.append(merged.take(np.argsort(merged['time'].to_numpy(), kind='stable')))
+
+    pieces.sort(key=lambda piece: piece['time'].iloc[0])
+    # 정렬된 조각 안에서만 중복 시각이 생기며, 인접한 행끼리만 비교하면 됩니다.
+    for k, piece in enumerate(pieces):
+        times = piece['time'].to_numpy()
+        duplicated = times[1:] == times[:-1]
+        if duplicated.any():
+            pieces[k] = piece[np.concatenate(([True], ~duplicated))]
+
+    merged = pd.concat(pieces, ignore_index=True) if len(pieces) > 1 else pieces[0].reset_index(drop=True)
+    if list(merged.columns) != columns:
+        merged = merged[columns]
+    return merged
+
+
+def _combine_files(df_list, config):
+    """
+    파일별 데이터프레임을 하나로 합칩니다. 반환값: (데이터프레임, 시간순 정렬/중복 제거 완료 여부)
+    모든 파일의 시간이 파싱되어 있으면 정렬 병합(_merge_sorted_files), 아니면 이어 붙이기만 합니다.
+    """
+    if config.INGEST_SETTINGS.get("merge_sorted", True) and all(
+        'time' in df.columns and pd.api.types.is_datetime64_any_dtype(df['time']) for df in df_list
+    ):
+        return _merge_sorted_files(df_list), True
+    return pd.concat(df_list, ignore_index=True), False
+
+
+def _preprocess_dataframe(df, device_id, presorted=False):
     """
     여러 시간 형식을 처리하도록 개선된 데이터프레임 전처리 함수
+    presorted: 이미 시간순으로 정렬되고 중복 시각이 제거된 데이터 (_merge_sorted_files)
     """
+    with telemetry.stage("preprocess", rows_in=len(df)) as counter:
+        df = _preprocess_rows(df, device_id, presorted)
+        counter.rows_out = len(df) if df is not None else 0
+    return df
+
+
+def _preprocess_rows(df, device_id, presorted=False):
     df.columns = df.columns.str.strip()
     required_cols = ['time', 'emobility_spd', 'pack_volt', 'pack_current']
 
@@ -46,32 +275,19 @@ def _preprocess_dataframe(df, device_id):
         logging.warning(f"[{device_id}] 필수 열이 누락되어 처리할 수 없습니다. (누락된 열: {missing_cols})")
         return None
 
-    df['device_id'] = device_id
+    df['device_id'] = pd.Series(device_id, index=df.index, dtype='category')
 
-    possible_formats = ['%y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S']
-    
-    temp_time_col = df['time'].copy()
+    # 파일 단위 로딩(_load_raw_file)에서 이미 변환된 경우 다시 파싱하지 않습니다.
+    if not pd.api.types.is_datetime64_any_dtype(df['time']):
+        df['time'] = schema.parse_time(df['time'], schema.BMS_TIME_FORMATS, device_id)
 
-    success = False
-    for fmt in possible_formats:
-        try:
-            df['time'] = pd.to_datetime(temp_time_col, format=fmt, errors='raise')
-            success = True
-            break
-        except ValueError:
-
-            continue
-
-    if not success:
-        logging.warning(f"[{device_id}] 정의된 시간 형식으로 변환 실패. 'coerce' 옵션으로 마지막 시도.")
-        df['time'] = pd.to_datetime(df['time'], errors='coerce')
-    
     df = df.dropna(subset=['time'])
     if df.empty:
         logging.warning(f"[{device_id}] 유효한 시간 데이터를 찾을 수 없어 처리할 수 없습니다.")
         return None
 
-    df = df.drop_duplicates(subset=['time', 'device_id']).sort_values('time').reset_index(drop=True)
+    if not presorted:
+        df = df.drop_duplicates(subset=['time', 'device_id']).sort_values('time').reset_index(drop=True)
     df['time_diff'] = df['time'].diff().dt.total_seconds()
     df['speed'] = df['emobility_spd'] * 0.27778
     df['acceleration'] = df['speed'].diff() / df['time_diff']
@@ -81,28 +297,73 @@ def _preprocess_dataframe(df, device_id):
     return df
 
 
-def _merge_gps_data(bms_df, device_id, config):
-    gps_path = config.PATHS["raw_gps_data"]
-    pattern = str(gps_path / device_id / '**' / '*.csv')
-    gps_files = glob.glob(pattern, recursive=True)
-        
+def _merge_gps_data(bms_df, device_id, config, gps_files=None):
+    """BMS 데이터에 가장 가까운 시각(±2초)의 GPS 고도/위경도를 붙입니다."""
+    with telemetry.stage("gps_merge", rows_in=len(bms_df)) as counter:
+        merged_df = _merge_gps_rows(bms_df, device_id, config, gps_files)
+        counter.rows_out = len(merged_df)
+    return merged_df
+
+
+def _load_gps_span(bms_df, device_id, config, gps_files):
+    """
+    BMS 시간 범위(±병합 허용 오차)와 겹치는 GPS 행만 읽습니다.
+    GPS 색인이 꺼져 있으면 단말기의 GPS 파일을 모두 읽어 합칩니다. 읽을 수 있는 GPS 데이터가 없으면 None.
+    """
+    if not config.GPS_INDEX.get("enabled", True):
+        gps_dfs = [df for df in (_load_raw_file(r, "gps", config) for r in gps_files) if df is not None]
+        return pd.concat(gps_dfs, ignore_index=True) if gps_dfs else None
+
+    start = bms_df['time'].min() - GPS_MERGE_TOLERANCE
+    end = bms_df['time'].max() + GPS_MERGE_TOLERANCE
+    entries = gps_index.refresh_index(device_id, gps_files, config, lambda r: _load_raw_file(r, "gps", config))
+    if all(entry["rows"] == 0 for _, entry in entries):
+        return None
+    gps_dfs = []
+    for record, entry in gps_index.overlapping(entries, start, end):
+        df = gps_index.read_range(entry, device_id, start, end, config)
+        if df is None:
+            df = _load_raw_file(record, "gps", config)
+            if df is None or 'time' not in df.columns:
+                continue
+            df = df[df['time'].between(start, end)]
+        gps_dfs.append(df)
+    if not gps_dfs:
+        # 겹치는 GPS가 없어도 BMS 고도 보간은 그대로 하도록 빈 프레임으로 병합합니다.
+        return pd.DataFrame({col: pd.Series(dtype='datetime64[ns]' if col == 'time' else 'float64')
+                             for col in gps_index.GPS_COLUMNS})
+    return pd.concat(gps_dfs, ignore_index=True)
+
+
+def _merge_gps_rows(bms_df, device_id, config, gps_files):
+    if gps_files is None:
+        gps_path = config.PATHS["raw_gps_data"]
+        pattern = str(gps_path / device_id / '**' / '*.csv')
+        gps_files = [file_manifest.make_record(f, device_id) for f in glob.glob(pattern, recursive=True)]
+
     if not gps_files:
         logging.warning(f"[{device_id}] 병합할 GPS 파일이 없습니다. BMS 데이터만 사용합니다.")
         if 'altitude' not in bms_df.columns:
              bms_df['altitude'] = pd.NA
         return bms_df.assign(lat=pd.NA, lng=pd.NA)
 
-    gps_dfs = [_read_csv_with_fallback_encodings(f) for f in gps_files]
-    full_gps_df = pd.concat([df for df in gps_dfs if df is not None], ignore_index=True)
+    full_gps_df = _load_gps_span(bms_df, device_id, config, gps_files)
 
-    if full_gps_df.empty or 'time' not in full_gps_df.columns:
+    if full_gps_df is None or 'time' not in full_gps_df.columns:
         logging.warning(f"[{device_id}] GPS 데이터가 비어있거나 유효하지 않습니다.")
         if 'altitude' not in bms_df.columns:
              bms_df['altitude'] = pd.NA
         return bms_df.assign(lat=pd.NA, lng=pd.NA)
 
-    full_gps_df['time'] = pd.to_datetime(full_gps_df['time'], errors='coerce', format='%Y-%m-%d %H:%M:%S')
-    full_gps_df = full_gps_df.dropna(subset=['time']).sort_values('time')
+    if not pd.api.types.is_datetime64_any_dtype(full_gps_df['time']):
+        full_gps_df['time'] = schema.parse_time(full_gps_df['time'], schema.GPS_TIME_FORMATS, device_id)
+    full_gps_df = full_gps_df.dropna(subset=['time'])
+    # GPS 색인 저장소에서 읽은 데이터는 이미 시간순이므로 다시 정렬하지 않습니다.
+    if not full_gps_df['time'].is_monotonic_increasing:
+        full_gps_df = full_gps_df.sort_values('time')
+    if full_gps_df['time'].dtype != bms_df['time'].dtype:
+        # 읽은 경로(CSV/파싱 캐시/GPS 색인)에 따라 시간 단위(us/ns)가 다를 수 있어 BMS 쪽에 맞춥니다.
+        full_gps_df['time'] = full_gps_df['time'].astype(bms_df['time'].dtype)
 
     cols_to_merge = ['time']
     if 'altitude' in full_gps_df.columns: cols_to_merge.append('altitude')
@@ -111,7 +372,7 @@ def _merge_gps_data(bms_df, device_id, config):
 
     merged_df = pd.merge_asof(
         bms_df.sort_values('time'), full_gps_df[cols_to_merge],
-        on='time', direction='nearest', tolerance=pd.Timedelta(seconds=2),
+        on='time', direction='nearest', tolerance=GPS_MERGE_TOLERANCE,
         suffixes=('', '_gps')
     )
 
@@ -120,6 +381,11 @@ def _merge_gps_data(bms_df, device_id, config):
     if 'lat_gps' in merged_df.columns: merged_df['lat'] = merged_df['lat_gps']
     if 'lng_gps' in merged_df.columns: merged_df['lng'] = merged_df['lng_gps']
 
+    if elevation.is_enabled(config) and 'lat' in merged_df.columns and 'lng' in merged_df.columns:
+        # GPS 고도가 없거나 잡음이 큰 구간을 로컬 DEM 타일의 지형 고도로 채웁니다. (ELEVATION)
+        altitude = merged_df['altitude'] if 'altitude' in merged_df.columns else np.nan
+        merged_df['altitude'] = elevation.apply_to_altitude(altitude, merged_df['lat'], merged_df['lng'], config)
+
     if 'altitude' in merged_df.columns:
         merged_df['altitude'] = merged_df['altitude'].interpolate(method='linear').bfill().ffill()
     
@@ -127,28 +393,147 @@ def _merge_gps_data(bms_df, device_id, config):
     return merged_df
 
 
-def load_and_merge_device_data(device_id, config):
-    """특정 단말기의 모든 데이터를 로드, 병합, 전처리하고 GPS 데이터를 결합합니다."""
-    data_files = _find_device_files(device_id, config)
+def load_and_merge_device_data(device_id, config, device_files=None):
+    """
+    특정 단말기의 모든 데이터를 로드, 병합, 전처리하고 GPS 데이터를 결합합니다.
+    device_files: file_manifest.lookup_device_files()의 결과. 없으면 디렉토리를 직접 탐색합니다.
+    """
+    data_files = _find_device_files(device_id, config, device_files)
     if not data_files:
         return None
 
-    df_list = [_read_csv_with_fallback_encodings(f) for f in tqdm(data_files, desc=f"[{device_id}] 파일 로딩", leave=False)]
-    
-    df_full = pd.concat([df for df in df_list if df is not None], ignore_index=True)
-    
+    # 앞 파일을 받아 모으는 동안 뒤 파일들은 스레드에서 미리 읽습니다. (IO_OVERLAP)
+    loaded = io_overlap.prefetch(data_files, lambda r: _load_raw_file(r, "bms", config), config)
+    df_list = [df for _, df in tqdm(loaded, total=len(data_files), desc=f"[{device_id}] 파일 로딩", leave=False)]
+    df_list = [df for df in df_list if df is not None]
+    if not df_list:
+        logging.warning(f"[{device_id}] 파일들은 존재하지만, 읽을 수 있는 데이터가 없습니다.")
+        return None
+
+    df_full, presorted = _combine_files(df_list, config)
+
     if df_full.empty:
         logging.warning(f"[{device_id}] 파일들은 존재하지만, 읽을 수 있는 데이터가 없습니다.")
         return None
 
-    df_processed = _preprocess_dataframe(df_full, device_id)
+    df_processed = _preprocess_dataframe(df_full, device_id, presorted)
 
     if df_processed is None:
         return None
 
-    has_altitude_file = any('altitude' in Path(f).name for f in data_files)
-    
-    if has_altitude_file:
-        return _merge_gps_data(df_processed, device_id, config)
+    gps_files = device_files["gps"] if device_files is not None else None
+    if should_merge_gps(device_id, data_files, gps_files, config):
+        return _merge_gps_data(df_processed, device_id, config, gps_files)
     else:
-        return df_processed
\ No newline at end of file
+        return df_processed
+
+def should_merge_gps(device_id, data_files, gps_files, config):
+    """
+    GPS를 병합할지 결정합니다. 고도(altitude) 파일이 있는 단말기는 항상 병합하고,
+    ELEVATION이 켜져 있으면 GPS 파일이 있는 모든 단말기를 병합해 DEM 고도를 붙입니다.
+    gps_files가 None이면 GPS 디렉토리 존재 여부로 판단합니다.
+    """
+    if any(r["has_altitude"] for r in data_files):
+        return True
+    if not elevation.is_enabled(config):
+        return False
+    if gps_files is None:
+        return (config.PATHS["raw_gps_data"] / device_id).is_dir()
+    return bool(gps_files)
+
+
+def _group_files_by_month(data_files):
+    """BMS 파일 레코드를 연월 순서의 그룹으로 묶습니다. 연월을 모르는 파일이 있으면 None."""
+    if any(r["month"] is None for r in data_files):
+        return None
+    groups = {}
+    for r in data_files:
+        groups.setdefault(r["month"], []).append(r)
+    return [groups[month] for month in sorted(groups)]
+
+
+def _gps_files_near_month(gps_files, month):
+    """해당 월과 앞뒤 한 달의 GPS 파일만 고릅니다. (월 경계의 merge_asof 허용 오차 대비)"""
+    period = pd.Period(month, freq='M')
+    months = {str(period - 1), str(period), str(period + 1)}
+    return [r for r in gps_files if r["month"] is None or r["month"] in months]
+
+
+def _stitch_chunk_edge(df, prev_sample):
+    """
+    이전 청크의 마지막 샘플을 이어받아 첫 행의 time_diff/acceleration을 전체 이력으로 처리했을 때와
+    같게 맞춥니다. 이전 청크와 겹치는(이미 처리한 시각 이하의) 행은 제거합니다.
+    """
+    if prev_sample is None:
+        return df
+    df = df[df['time'] > prev_sample['time']].reset_index(drop=True)
+    if df.empty:
+        return df
+    time_diff = (df['time'].iloc[0] - prev_sample['time']).total_seconds()
+    acceleration = (df['speed'].iloc[0] - prev_sample['speed']) / time_diff
+    df.loc[0, 'time_diff'] = time_diff
+    df.loc[0, 'acceleration'] = 0 if pd.isna(acceleration) else acceleration
+    return df
+
+
+def iter_device_chunks(device_id, config, device_files=None):
+    """
+    단말기 데이터를 월 단위 청크로 시간 순서대로 로드/전처리/GPS 병합하여 하나씩 반환합니다.
+    전체 이력을 한 번에 합치지 않으므로 최대 메모리는 한 달 분량으로 제한됩니다.
+    청크 사이에는 time_diff/acceleration 계산에 필요한 마지막 샘플만 이어받으며,
+    이전 청크보다 이른 시각의 행(월 파일 간 중복)은 제거됩니다.
+    """
+    data_files = _find_device_files(device_id, config, device_files)
+    if not data_files:
+        return
+
+    file_groups = _group_files_by_month(data_files)
+    if file_groups is None:
+        logging.warning(f"[{device_id}] 연월을 알 수 없는 파일이 있어 전체 데이터를 한 번에 처리합니다.")
+        df = load_and_merge_device_data(device_id, config, device_files)
+        if df is not None:
+            yield df
+        return
+
+    all_gps_files = device_files["gps"] if device_files is not None else None
+    merge_gps = should_merge_gps(device_id, data_files, all_gps_files, config)
+
+    # 월 경계와 관계없이 파일 순서대로 미리 읽어, 이번 달 청크를 계산/저장하는 동안 다음 달 파일을 읽어 둡니다.
+    loaded = io_overlap.prefetch([r for group in file_groups for r in group],
+                                 lambda r: _load_raw_file(r, "bms", config), config)
+    try:
+        yield from _iter_month_chunks(file_groups, loaded, device_id, config, merge_gps, all_gps_files)
+    finally:
+        loaded.close()
+
+
+def _iter_month_chunks(file_groups, loaded, device_id, config, merge_gps, all_gps_files):
+    prev_sample = None
+    for group in tqdm(file_groups, desc=f"[{device_id}] 월별 처리", leave=False):
+        df_list = [df for _, df in itertools.islice(loaded, len(group)) if df is not None]
+        if not df_list:
+            continue
+
+        gps_files = _gps_files_near_month(all_gps_files, group[0]["month"]) if all_gps_files is not None else None
+        df_chunk = prepare_chunk(df_list, device_id, config, prev_sample, merge_gps, gps_files)
+        if df_chunk is None:
+            continue
+        prev_sample = {"time": df_chunk['time'].iloc[-1], "speed": df_chunk['speed'].iloc[-1]}
+        yield df_chunk
+
+
+def prepare_chunk(df_list, device_id, config, prev_sample, merge_gps, gps_files=None):
+    """
+    파일별 데이터프레임 목록을 합쳐 전처리하고, 이전 청크의 마지막 샘플(prev_sample)에 이어 붙인 뒤
+    merge_gps이면 GPS를 병합합니다. 남는 행이 없으면 None을 반환합니다.
+    """
+    df_chunk, presorted = _combine_files(df_list, config)
+    df_chunk = _preprocess_dataframe(df_chunk, device_id, presorted)
+    if df_chunk is None:
+        return None
+    df_chunk = _stitch_chunk_edge(df_chunk, prev_sample)
+    if df_chunk.empty:
+        return None
+    if merge_gps:
+        df_chunk = _merge_gps_data(df_chunk, device_id, config, gps_files)
+    return df_chunk
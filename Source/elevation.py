@@ -0,0 +1,110 @@
+import logging
+import math
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# 로컬 DEM 타일로 위경도 배열의 고도를 한 번에 조회합니다. (네트워크 호출 없음)
+# 타일은 SRTM .hgt 형식(1°x1°, 빅엔디언 int16, 북쪽 행부터, 1201x1201 또는 3601x3601)이며,
+# 파일 이름은 타일 남서쪽 모서리 기준입니다. 예) N37E127.hgt: 위도 37~38°, 경도 127~128°
+# 타일은 메모리 맵으로 열어 조회한 점 주변의 페이지만 읽고, 최근에 쓴 타일 ELEVATION["max_tiles"]개만 열어 둡니다.
+VOID_VALUE = -32768
+
+_cache = OrderedDict()   # {(타일 폴더, 위도, 경도): memmap 또는 None(타일 없음)}
+_cache_lock = threading.Lock()
+
+
+def is_enabled(config):
+    return config.ELEVATION.get("enabled", False)
+
+
+def tile_name(lat_deg, lng_deg):
+    """타일 남서쪽 모서리(정수 위도/경도)의 .hgt 파일 이름."""
+    return f"{'N' if lat_deg >= 0 else 'S'}{abs(lat_deg):02d}{'E' if lng_deg >= 0 else 'W'}{abs(lng_deg):03d}.hgt"
+
+
+def _open_tile(tile_dir, lat_deg, lng_deg):
+    path = os.path.join(tile_dir, tile_name(lat_deg, lng_deg))
+    try:
+        size = os.path.getsize(path)
+    except FileNotFoundError:
+        logging.warning(f"DEM 타일이 없어 해당 범위의 고도는 비워 둡니다: {path}")
+        return None
+    n = math.isqrt(size // 2)
+    if n * n * 2 != size or n < 2:
+        logging.warning(f"DEM 타일 크기가 .hgt 형식과 맞지 않습니다: {path} ({size} bytes)")
+        return None
+    return np.memmap(path, dtype='>i2', mode='r', shape=(n, n))
+
+
+def _get_tile(config, lat_deg, lng_deg):
+    """LRU 캐시에서 타일을 꺼냅니다. 캐시가 가득 차면 가장 오래 쓰지 않은 타일의 메모리 맵을 닫습니다."""
+    key = (str(config.ELEVATION["dir"]), lat_deg, lng_deg)
+    with _cache_lock:
+        if key in _cache:
+            _cache.move_to_end(key)
+            return _cache[key]
+        tile = _open_tile(key[0], lat_deg, lng_deg)
+        _cache[key] = tile
+        while len(_cache) > config.ELEVATION.get("max_tiles", 16):
+            _cache.popitem(last=False)
+        return tile
+
+
+def _bilinear(tile, lat, lng, lat_deg, lng_deg):
+    """타일 하나에 속한 점들의 고도를 주변 네 격자점으로 쌍선형 보간합니다. 빈 값(void)이 섞이면 NaN."""
+    last = tile.shape[0] - 1
+    row = (lat_deg + 1 - lat) * last
+    col = (lng - lng_deg) * last
+    r0 = np.clip(np.floor(row).astype(np.int64), 0, last - 1)
+    c0 = np.clip(np.floor(col).astype(np.int64), 0, last - 1)
+    fr = (row - r0)[:, None]
+    fc = (col - c0)[:, None]
+
+    # 네 모서리를 한 번의 인덱싱으로 읽음: [좌상, 우상, 좌하, 우하]
+    corners = tile[np.stack([r0, r0, r0 + 1, r0 + 1], axis=1), np.stack([c0, c0 + 1, c0, c0 + 1], axis=1)]
+    corners = corners.astype(np.float64)
+    corners[corners == VOID_VALUE] = np.nan
+    top = corners[:, [0]] * (1 - fc) + corners[:, [1]] * fc
+    bottom = corners[:, [2]] * (1 - fc) + corners[:, [3]] * fc
+    return (top * (1 - fr) + bottom * fr)[:, 0]
+
+
+def lookup(lat, lng, config):
+    """
+    위경도 배열의 지형 고도(m)를 반환합니다. 타일이 없거나 위경도가 없는 점은 NaN입니다.
+    점들을 타일별로 묶어 타일마다 한 번씩 벡터 연산으로 보간하므로, 점 수와 관계없이 Python 반복은 타일 수만큼입니다.
+    """
+    lat = np.asarray(lat, dtype=np.float64)
+    lng = np.asarray(lng, dtype=np.float64)
+    result = np.full(lat.shape, np.nan)
+    valid = np.isfinite(lat) & np.isfinite(lng) & (np.abs(lat) < 90) & (np.abs(lng) <= 180)
+    if not valid.any():
+        return result
+
+    idx = np.flatnonzero(valid)
+    lat_v, lng_v = lat[idx], lng[idx]
+    tile_keys = np.stack([np.floor(lat_v), np.floor(lng_v)], axis=1).astype(np.int64)
+    unique_keys, inverse = np.unique(tile_keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    for i, (lat_deg, lng_deg) in enumerate(unique_keys):
+        tile = _get_tile(config, int(lat_deg), int(lng_deg))
+        if tile is None:
+            continue
+        in_tile = np.flatnonzero(inverse == i)
+        result[idx[in_tile]] = _bilinear(tile, lat_v[in_tile], lng_v[in_tile], int(lat_deg), int(lng_deg))
+    return result
+
+
+def apply_to_altitude(altitude, lat, lng, config):
+    """
+    GPS 병합 결과의 고도 열에 DEM 고도를 반영합니다.
+    ELEVATION["mode"]: "fill"이면 비어 있는 고도만 채우고, "replace"이면 DEM 고도를 우선 사용합니다. (잡음이 큰 GPS 고도 대체)
+    """
+    dem = lookup(lat, lng, config)
+    altitude = np.asarray(altitude, dtype=np.float64)
+    if config.ELEVATION.get("mode", "fill") == "replace":
+        return np.where(np.isnan(dem), altitude, dem)
+    return np.where(np.isnan(altitude), dem, altitude)
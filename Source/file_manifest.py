@@ -0,0 +1,283 @@
+import json
+import logging
+import os
+import re
+import socket
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+MANIFEST_VERSION = 1
+
+# 파일명 또는 상위 폴더명에서 연월(YYYY-MM / YYYYMM / YYYY/MM)을 추출하기 위한 패턴
+_MONTH_PATTERN = re.compile(r'(20\d{2})[-_]?(0[1-9]|1[0-2])(?!\d)')
+_TOKEN_SPLIT = re.compile(r'[^0-9A-Za-z]+')
+
+
+def _extract_month(rel_path):
+    """상대 경로(파일명 우선, 이후 상위 폴더)에서 'YYYY-MM' 형식의 연월을 찾습니다."""
+    parts = rel_path.replace('\\', '/').split('/')
+    for part in reversed(parts):
+        match = _MONTH_PATTERN.search(part)
+        if match:
+            return f"{match.group(1)}-{match.group(2)}"
+    # 'YYYY/MM/' 처럼 연도와 월이 서로 다른 폴더로 나뉜 경우
+    for year, month in zip(parts, parts[1:]):
+        if re.fullmatch(r'20\d{2}', year) and re.fullmatch(r'0[1-9]|1[0-2]', month):
+            return f"{year}-{month}"
+    return None
+
+
+def _resolve_bms_device(file_name, known_ids):
+    """BMS 파일명을 토큰으로 분리하여 알려진 단말기 ID와 매칭합니다."""
+    stem = os.path.splitext(file_name)[0]
+    for token in _TOKEN_SPLIT.split(stem):
+        if token in known_ids:
+            return token
+    # 토큰 경계가 다른 경우를 위한 부분 문자열 매칭 (기존 glob '*{device_id}*' 와 동일한 의미)
+    for device_id in known_ids:
+        if device_id in stem:
+            return device_id
+    return None
+
+
+def _scan_directory(dir_path, previous):
+    """
+    단일 디렉토리를 스캔합니다.
+    디렉토리 mtime이 이전 스캔과 같으면 목록을 다시 읽지 않고 이전 결과를 재사용합니다.
+    """
+    mtime = os.stat(dir_path).st_mtime
+    if previous is not None and previous.get("mtime") == mtime:
+        return {"mtime": mtime, "subdirs": previous["subdirs"], "files": previous["files"]}, False
+
+    subdirs, files = [], []
+    with os.scandir(dir_path) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.name)
+            elif entry.name.lower().endswith('.csv'):
+                st = entry.stat()
+                files.append({"name": entry.name, "size": st.st_size, "mtime": st.st_mtime})
+    return {"mtime": mtime, "subdirs": sorted(subdirs), "files": sorted(files, key=lambda f: f["name"])}, True
+
+
+def _scan_tree(root, previous_dirs, max_workers):
+    """
+    루트 아래 모든 디렉토리를 스레드 풀로 병렬 스캔합니다.
+    반환값: ({상대경로: 디렉토리 정보}, 다시 읽은 디렉토리의 상대경로 집합)
+    """
+    dirs = {}
+    rescanned = set()
+    if not os.path.isdir(root):
+        logging.warning(f"스캔할 경로가 없습니다: {root}")
+        return dirs, rescanned
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = {executor.submit(_scan_directory, root, previous_dirs.get('.')): '.'}
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                rel = pending.pop(future)
+                try:
+                    info, changed = future.result()
+                except OSError as e:
+                    logging.warning(f"디렉토리 스캔 실패: {os.path.join(root, rel)}. 오류: {e}")
+                    continue
+                dirs[rel] = info
+                if changed:
+                    rescanned.add(rel)
+                for name in info["subdirs"]:
+                    child = name if rel == '.' else f"{rel}/{name}"
+                    pending[executor.submit(_scan_directory, os.path.join(root, child), previous_dirs.get(child))] = child
+    return dirs, rescanned
+
+
+def _annotate_files(dirs, kind, known_ids):
+    """파일 항목에 단말기 ID, 연월, altitude 여부를 채웁니다. 이미 해석된 항목은 건너뜁니다."""
+    for rel, info in dirs.items():
+        for entry in info["files"]:
+            rel_path = entry["name"] if rel == '.' else f"{rel}/{entry['name']}"
+            if "month" not in entry:
+                entry["month"] = _extract_month(rel_path)
+                entry["has_altitude"] = 'altitude' in entry["name"]
+            if entry.get("device_id") is None:
+                if kind == "gps":
+                    # GPS 트리는 '<gps_root>/<device_id>/**/*.csv' 구조
+                    entry["device_id"] = rel.split('/')[0] if rel != '.' else None
+                else:
+                    entry["device_id"] = _resolve_bms_device(entry["name"], known_ids)
+
+
+def _restat_latest_months(root, dirs, rescanned, max_workers):
+    """
+    월별 CSV에 행을 이어 쓰면 파일 크기/수정시각은 바뀌어도 디렉토리 mtime은 그대로입니다.
+    그래서 이번에 다시 읽지 않은 디렉토리에서도 단말기마다 가장 최근 연월 파일(연월을 알 수 없는 파일 포함)은
+    크기/수정시각을 다시 읽습니다. 반환값: 크기/수정시각이 바뀐 파일 수
+    """
+    latest = {}
+    for info in dirs.values():
+        for entry in info["files"]:
+            if entry.get("device_id") is not None and entry.get("month") is not None:
+                latest[entry["device_id"]] = max(latest.get(entry["device_id"], ''), entry["month"])
+
+    targets = []
+    for rel, info in dirs.items():
+        if rel in rescanned:
+            continue
+        for entry in info["files"]:
+            device_id = entry.get("device_id")
+            if device_id is not None and (entry.get("month") is None or entry["month"] == latest.get(device_id)):
+                targets.append((entry, os.path.join(root, entry["name"] if rel == '.' else f"{rel}/{entry['name']}")))
+    if not targets:
+        return 0
+
+    def restat(target):
+        entry, path = target
+        try:
+            st = os.stat(path)
+        except OSError as e:
+            logging.warning(f"파일 상태 확인 실패: {path}. 오류: {e}")
+            return False
+        changed = (entry["size"], entry["mtime"]) != (st.st_size, st.st_mtime)
+        entry["size"], entry["mtime"] = st.st_size, st.st_mtime
+        return changed
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(restat, targets))
+
+
+def make_record(path, device_id=None):
+    """매니페스트 없이 찾은 파일을 매니페스트 레코드와 같은 형태로 만듭니다."""
+    path = str(path)
+    st = os.stat(path)
+    name = os.path.basename(path)
+    return {
+        "path": path,
+        "device_id": device_id,
+        "month": _extract_month(path),
+        "size": st.st_size,
+        "mtime": st.st_mtime,
+        "has_altitude": 'altitude' in name,
+    }
+
+
+def restat(record):
+    """
+    레코드의 크기/수정시각을 지금 파일 기준으로 다시 읽은 사본을 반환합니다.
+    매니페스트 값은 디렉토리 mtime 기준으로 재사용되므로, 내용을 읽기 직전에는 이 값으로 판단합니다.
+    """
+    st = os.stat(record["path"])
+    return {**record, "size": st.st_size, "mtime": st.st_mtime}
+
+
+def restat_device_files(device_files):
+    """
+    lookup_device_files() 결과의 모든 레코드를 restat()으로 다시 읽습니다. 그 사이 삭제된 파일은 목록에서 뺍니다.
+    실행 상태의 원본 파일 지문은 이 값으로 비교/기록하여, 제자리에서 커진 파일을 변경으로 판단합니다.
+    """
+    refreshed = {}
+    for kind, records in device_files.items():
+        refreshed[kind] = []
+        for record in records:
+            try:
+                refreshed[kind].append(restat(record))
+            except FileNotFoundError:
+                continue
+    return refreshed
+
+
+def load_manifest(config):
+    """저장된 매니페스트를 읽습니다. 없거나 손상되었으면 None을 반환합니다."""
+    manifest_path = config.MANIFEST_SETTINGS["path"]
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"매니페스트를 읽을 수 없어 새로 생성합니다: {manifest_path}. 오류: {e}")
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+
+def save_manifest(manifest, config):
+    """매니페스트를 임시 파일에 쓴 뒤 교체하여 원자적으로 저장합니다."""
+    manifest_path = config.MANIFEST_SETTINGS["path"]
+    manifest_path.parent.mkdir(parents=True, exist_ok=True)
+    to_save = {k: v for k, v in manifest.items() if not k.startswith('_')}
+    # 여러 노드가 같은 매니페스트를 갱신할 수 있으므로 임시 파일 이름을 호스트/프로세스별로 구분합니다.
+    tmp_path = manifest_path.with_name(f"{manifest_path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(to_save, f, ensure_ascii=False)
+    os.replace(tmp_path, manifest_path)
+
+
+def refresh_manifest(config, known_device_ids, full_rescan=False):
+    """
+    BMS/GPS 원본 트리의 매니페스트를 갱신하여 반환합니다.
+    디렉토리 mtime이 바뀌지 않은 폴더는 다시 읽지 않으므로, 두 번째 실행부터는
+    디렉토리 stat 비용과 단말기별 최근 연월 파일의 stat 비용만 발생합니다.
+    이전 달 파일의 내용만 바뀐 경우(제자리 재추출 등)는 full_rescan=True(--rescan)가 필요합니다.
+    """
+    previous = None if full_rescan else load_manifest(config)
+    known_ids = set(known_device_ids)
+    max_workers = config.MANIFEST_SETTINGS.get("scan_workers", 16)
+
+    manifest = {"version": MANIFEST_VERSION, "roots": {}}
+    for kind, path_key in (("bms", "raw_bms_data"), ("gps", "raw_gps_data")):
+        root = str(config.PATHS[path_key])
+        prev_root = (previous or {}).get("roots", {}).get(kind, {})
+        previous_dirs = prev_root.get("dirs", {}) if prev_root.get("root") == root else {}
+
+        dirs, rescanned = _scan_tree(root, previous_dirs, max_workers)
+        _annotate_files(dirs, kind, known_ids)
+        grown = _restat_latest_months(root, dirs, rescanned, max_workers)
+        manifest["roots"][kind] = {"root": root, "dirs": dirs}
+
+        file_count = sum(len(info["files"]) for info in dirs.values())
+        logging.info(f"매니페스트 갱신 ({kind}): 디렉토리 {len(dirs)}개 중 {len(rescanned)}개 재스캔, "
+                     f"파일 {file_count}개 (최근 연월 파일 중 {grown}개 변경)")
+
+    save_manifest(manifest, config)
+    return manifest
+
+
+def _build_index(manifest):
+    """단말기 ID별 파일 목록 인덱스를 만듭니다. (메모리에만 유지)"""
+    index = {"bms": {}, "gps": {}, "unmatched_bms": []}
+    for kind, root_info in manifest["roots"].items():
+        root = root_info["root"]
+        for rel, info in root_info["dirs"].items():
+            for entry in info["files"]:
+                rel_path = entry["name"] if rel == '.' else f"{rel}/{entry['name']}"
+                record = {
+                    "path": os.path.join(root, rel_path),
+                    "device_id": entry.get("device_id"),
+                    "month": entry.get("month"),
+                    "size": entry["size"],
+                    "mtime": entry["mtime"],
+                    "has_altitude": entry.get("has_altitude", False),
+                }
+                if record["device_id"] is not None:
+                    index[kind].setdefault(record["device_id"], []).append(record)
+                elif kind == "bms":
+                    index["unmatched_bms"].append(record)
+    for kind in ("bms", "gps"):
+        for records in index[kind].values():
+            records.sort(key=lambda r: (r["month"] or '', r["path"]))
+    return index
+
+
+def lookup_device_files(manifest, device_id):
+    """
+    매니페스트에서 단말기의 BMS/GPS 파일 목록을 찾습니다.
+    반환값: {"bms": [파일 레코드...], "gps": [파일 레코드...]}
+    """
+    index = manifest.get("_index")
+    if index is None:
+        index = manifest["_index"] = _build_index(manifest)
+
+    bms_files = list(index["bms"].get(device_id, []))
+    # 매니페스트 생성 시 알려지지 않았던 단말기는 파일명 부분 일치로 보완
+    bms_files.extend(r for r in index["unmatched_bms"] if device_id in os.path.basename(r["path"]))
+    return {"bms": bms_files, "gps": list(index["gps"].get(device_id, []))}
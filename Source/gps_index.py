@@ -0,0 +1,123 @@
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow가 없으면 정렬된 저장소 없이 시간 범위 색인만 사용합니다.
+    pa = None
+    pq = None
+
+INDEX_VERSION = 1
+GPS_COLUMNS = ['time', 'altitude', 'lat', 'lng']
+
+
+def _device_dir(device_id, config):
+    return config.GPS_INDEX["dir"] / device_id
+
+
+def _store_name(record):
+    key_src = f"{os.path.abspath(record['path'])}|{record['size']}|{record['mtime']}|v{INDEX_VERSION}"
+    return hashlib.sha1(key_src.encode('utf-8')).hexdigest() + ".parquet"
+
+
+def load_index(device_id, config):
+    """단말기 GPS 색인 {원본 경로: {size, mtime, min_time, max_time, rows, store}}. 없으면 빈 딕셔너리."""
+    index_path = _device_dir(device_id, config) / "index.json"
+    try:
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"[{device_id}] GPS 색인을 읽을 수 없어 다시 만듭니다. 오류: {e}")
+        return {}
+    if index.get("version") != INDEX_VERSION:
+        return {}
+    return index["files"]
+
+
+def _save_index(device_id, files, config):
+    index_path = _device_dir(device_id, config) / "index.json"
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = index_path.with_name(f"{index_path.name}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"version": INDEX_VERSION, "files": files}, f, ensure_ascii=False)
+    os.replace(tmp_path, index_path)
+
+
+def _write_store(df, store_path, config):
+    store_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = store_path.with_name(f"{store_path.name}.{os.getpid()}.tmp")
+    pq.write_table(pa.Table.from_pandas(df, preserve_index=False), tmp_path,
+                   compression=config.GPS_INDEX.get("compression", "zstd"))
+    os.replace(tmp_path, store_path)
+
+
+def _build_entry(record, df, device_id, config):
+    """파싱된 GPS 파일을 시간순으로 정렬해 저장하고 색인 항목을 만듭니다."""
+    entry = {"size": record["size"], "mtime": record["mtime"], "min_time": None, "max_time": None, "rows": 0, "store": None}
+    if df is None or 'time' not in df.columns:
+        return entry
+    df = df[[col for col in GPS_COLUMNS if col in df.columns]].dropna(subset=['time'])
+    if df.empty:
+        return entry
+    df = df.sort_values('time', kind='stable').reset_index(drop=True)
+    entry.update(min_time=df['time'].iloc[0].isoformat(), max_time=df['time'].iloc[-1].isoformat(), rows=len(df))
+    if pq is not None:
+        store_name = _store_name(record)
+        _write_store(df, _device_dir(device_id, config) / store_name, config)
+        entry["store"] = store_name
+    return entry
+
+
+def refresh_index(device_id, gps_files, config, load_fn):
+    """
+    GPS 파일 레코드 중 색인에 없거나 바뀐(크기/수정시각) 파일만 읽어 색인과 정렬 저장소를 갱신합니다.
+    load_fn(record): 원본 GPS 파일 하나를 읽어 시간이 변환된 데이터프레임을 반환하는 함수
+    반환값: [(레코드, 색인 항목), ...]
+    """
+    files = load_index(device_id, config)
+    changed = False
+    for record in gps_files:
+        entry = files.get(record["path"])
+        if entry is not None and (entry["size"], entry["mtime"]) == (record["size"], record["mtime"]):
+            if entry["store"] is None or pq is None or (_device_dir(device_id, config) / entry["store"]).exists():
+                continue
+        if entry is not None and entry.get("store"):
+            # 원본이 바뀐 파일의 이전 저장본은 삭제
+            old_store = _device_dir(device_id, config) / entry["store"]
+            if old_store.exists():
+                old_store.unlink()
+        files[record["path"]] = _build_entry(record, load_fn(record), device_id, config)
+        changed = True
+    if changed:
+        _save_index(device_id, files, config)
+    return [(record, files[record["path"]]) for record in gps_files]
+
+
+def overlapping(entries, start, end):
+    """[start, end] 시간 범위와 겹치는 (레코드, 항목)만 최소 시각 순서로 반환합니다."""
+    selected = [
+        (record, entry) for record, entry in entries
+        if entry["min_time"] is not None
+        and pd.Timestamp(entry["min_time"]) <= end and pd.Timestamp(entry["max_time"]) >= start
+    ]
+    return sorted(selected, key=lambda item: item[1]["min_time"])
+
+
+def read_range(entry, device_id, start, end, config):
+    """정렬 저장소에서 [start, end] 범위의 행만 읽습니다. 저장소가 없으면 None."""
+    if entry["store"] is None or pq is None:
+        return None
+    store_path = _device_dir(device_id, config) / entry["store"]
+    try:
+        table = pq.read_table(store_path, filters=[('time', '>=', start), ('time', '<=', end)])
+    except (OSError, pa.ArrowInvalid) as e:
+        logging.warning(f"[{device_id}] GPS 저장소 읽기 실패, 원본을 다시 읽습니다: {store_path}. 오류: {e}")
+        return None
+    return table.to_pandas()
@@ -0,0 +1,99 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from Source import telemetry
+
+# 워커 프로세스 안에서 원본 파일 미리 읽기와 Trip 저장 대기열이 함께 쓰는 메모리 한도.
+# 한도를 넘으면 미리 읽기는 멈추고 저장기는 대기열이 비워질 때까지 기다립니다.
+
+
+class ByteBudget:
+    """진행 중인 입출력 데이터 크기의 합계 상한. share()로 사용자(미리 읽기/저장 대기열)별 몫을 만들어 씁니다."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def share(self):
+        return _BudgetShare(self)
+
+
+class _BudgetShare:
+    """한도를 쓰는 사용자 하나의 몫. 자기 몫이 하나도 없으면 한도와 관계없이 허용하여 서로 기다리며 멈추지 않게 합니다."""
+
+    def __init__(self, budget):
+        self._budget = budget
+        self.held = 0
+
+    def acquire(self, nbytes, block=True):
+        budget = self._budget
+        with budget._cond:
+            while self.held and budget.used + nbytes > budget.limit:
+                if not block:
+                    return False
+                budget._cond.wait()
+            self.held += nbytes
+            budget.used += nbytes
+        return True
+
+    def release(self, nbytes):
+        budget = self._budget
+        with budget._cond:
+            self.held -= nbytes
+            budget.used -= nbytes
+            budget._cond.notify_all()
+
+
+_budget = None
+
+
+def shared_budget(config):
+    """워커 프로세스의 입출력 메모리 한도 (IO_OVERLAP["max_inflight_bytes"])."""
+    global _budget
+    limit = config.IO_OVERLAP.get("max_inflight_bytes", 512 * 1024**2)
+    if _budget is None or _budget.limit != limit:
+        _budget = ByteBudget(limit)
+    return _budget
+
+
+def prefetch(records, load_fn, config):
+    """
+    records(매니페스트 레코드) 순서대로 (레코드, load_fn(레코드))를 반환합니다.
+    앞 파일의 결과를 처리하는 동안 뒤 파일들을 스레드 풀에서 미리 읽습니다.
+    미리 읽는 파일 수는 read_ahead_files, 크기는 원본 파일 크기 기준으로 입출력 메모리 한도 안으로 제한합니다.
+    """
+    settings = config.IO_OVERLAP
+    threads = settings.get("read_threads", 0) if settings.get("enabled", True) else 0
+    if threads <= 0 or len(records) <= 1:
+        for record in records:
+            yield record, load_fn(record)
+        return
+
+    share = shared_budget(config).share()
+    depth = max(1, settings.get("read_ahead_files", threads))
+    pending = deque()  # [(레코드, future)] 파일 순서대로
+    next_index = 0
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix="prefetch") as pool:
+        try:
+            while pending or next_index < len(records):
+                while next_index < len(records) and len(pending) < depth:
+                    record = records[next_index]
+                    if not share.acquire(record["size"], block=False):
+                        break
+                    pending.append((record, pool.submit(load_fn, record)))
+                    next_index += 1
+                record, future = pending.popleft()
+                try:
+                    with telemetry.stage("io_wait"):
+                        result = future.result()
+                finally:
+                    # 읽기가 실패해도 한도를 돌려줍니다. (워커 풀 재사용 시 다음 단말기의 미리 읽기가 줄어들지 않도록)
+                    share.release(record["size"])
+                yield record, result
+        finally:
+            # 소비자가 중간에 멈추면 아직 시작하지 않은 읽기는 취소합니다.
+            for record, future in pending:
+                future.cancel()
+                share.release(record["size"])
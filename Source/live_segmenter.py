@@ -0,0 +1,443 @@
+"""
+새로 들어오는 텔레메트리를 감시하면서 닫힌 Trip을 바로 저장합니다. (실시간 감시 모드)
+
+    python -m Source.live_segmenter --car NiroEV --car EV6
+    python -m Source.live_segmenter --car NiroEV --once --from-start
+
+LIVE_WATCH["poll_seconds"]마다 원본 트리를 다시 확인하여, 단말기별로 BMS 파일에서 마지막으로 읽은 위치 이후에
+추가된 완성된 줄만 읽습니다. 추가분은 배치 실행과 같은 전처리/GPS 병합/물리식 계산을 거쳐 열린 Trip에 이어 붙이며,
+분할 규칙도 trip_parser와 같습니다.
+    - 이전 샘플과의 간격이 600초를 넘거나 충전 케이블 상태가 바뀌면 열린 Trip을 닫고 새 Trip을 엽니다.
+    - 닫힌 Trip은 trip_parser.parse_and_save_trips로 TRIP_THRESHOLDS를 검증하여 저장합니다.
+    - 새 행 없이 LIVE_WATCH["close_after_seconds"]가 지나면 열린 Trip을 닫습니다. (다음 Trip 시작 시각은 None)
+
+단말기마다 메모리에 두는 것은 마지막 샘플(시각/속도/충전 케이블)과 열린 Trip의 누적 지표(충전 포함 여부,
+가속도 초과 여부, 연속 정지 시간)뿐입니다. 열린 Trip의 행은 <state_dir>/<차종>/<단말기>.open/<순번>/ 아래에
+조각 파일로 모으고, 충전/가속도/정지 조건으로 이미 무효가 된 Trip은 더 모으지 않습니다.
+상태는 매 주기 저장되므로 중단 후 다시 실행하면 이어서 감시합니다. (저장 직전에 멈췄다면 그 주기의 추가분을 다시 읽습니다.)
+
+배치 실행과 다른 점: 이미 처리한 시각 이하로 늦게 도착한 행은 버리고, GPS 병합과 고도 보간은 한 번에 읽은 추가분 안에서만 합니다.
+실시간 Trip은 LIVE_WATCH["output_root"]에 따로 저장하고 live_trips.jsonl에 한 줄씩 기록합니다.
+정식 결과(Trip 카탈로그/리포트)는 지금처럼 배치 실행(main.py)으로 만듭니다.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+from Source import config, data_loader, file_manifest, physics_power, trip_parser, trip_store
+from Source.vehicle_config import vehicle_dict
+
+STATE_VERSION = 1
+
+
+def _device_state_path(car_model, device_id, config):
+    return config.LIVE_WATCH["state_dir"] / car_model / f"{device_id}.json"
+
+
+def _spool_root(car_model, device_id, config):
+    return config.LIVE_WATCH["state_dir"] / car_model / f"{device_id}.open"
+
+
+def _new_state():
+    return {
+        "version": STATE_VERSION,
+        "started": False,
+        "files": {},            # {BMS 파일 경로: {"offset": 읽은 바이트 수, "header": 헤더 줄(latin-1)}}
+        "last_sample": None,    # {"time_ns", "speed", "cable", "altitude"}
+        "last_arrival": None,   # 마지막으로 새 행을 읽은 시각 (epoch 초)
+        "open": None,           # 열린 Trip의 누적 지표 (_open_trip)
+        "next_seq": 1,          # 다음에 열 Trip의 조각 폴더 순번
+        "next_trip_no": 1,      # 다음에 저장할 실시간 Trip 번호
+    }
+
+
+def load_device_state(car_model, device_id, config):
+    """단말기의 감시 상태를 읽습니다. 없거나 형식이 다르면 새 상태를 반환합니다."""
+    state_path = _device_state_path(car_model, device_id, config)
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return _new_state()
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"[{device_id}] 실시간 감시 상태를 읽지 못해 새로 시작합니다: {e}")
+        return _new_state()
+    return state if state.get("version") == STATE_VERSION else _new_state()
+
+
+def _save_device_state(state, car_model, device_id, config):
+    state_path = _device_state_path(car_model, device_id, config)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = state_path.with_name(state_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False)
+    os.replace(tmp_path, state_path)
+
+
+def _float_or_none(value):
+    return None if pd.isna(value) else float(value)
+
+
+# --- 1. 추가분 읽기 ---
+
+def _read_header(f):
+    f.seek(0)
+    line = f.readline()
+    return line if line.endswith(b'\n') else None
+
+
+def _read_appended(path, file_state, size, limit, settled):
+    """
+    file_state["offset"] 이후에 추가된 완성된 줄을 최대 limit 바이트까지 읽어, 헤더 줄을 붙인 CSV 내용을 반환합니다.
+    settled: 파일이 한동안 바뀌지 않았으면 줄바꿈 없이 끝난 마지막 줄도 완성된 것으로 읽습니다.
+    읽은 만큼 file_state["offset"]을 옮기며, 읽을 줄이 없으면 None을 반환합니다.
+    """
+    with open(path, 'rb') as f:
+        header = file_state["header"].encode('latin-1') if file_state["header"] is not None else None
+        if header is None:
+            header = _read_header(f)
+            if header is None:
+                return None
+            file_state["header"] = header.decode('latin-1')
+        offset = max(file_state["offset"], len(header))
+        f.seek(offset)
+        data = f.read(min(limit, size - offset))
+
+    if not (settled and offset + len(data) >= size):
+        data = data[:data.rfind(b'\n') + 1]
+    file_state["offset"] = offset + len(data)
+    if not data:
+        return None
+    if not data.endswith(b'\n'):
+        data += b'\n'
+    return header + data
+
+
+def _active_records(records, files, last_sample):
+    """
+    다시 확인할 파일: 처음 보는 파일과, 마지막 샘플의 앞 달 이후의 파일(연월을 모르면 항상).
+    지난 달 파일에 행이 추가되는 일은 없다고 보고 매 주기 stat하지 않습니다.
+    """
+    if last_sample is None:
+        return records
+    since_month = str(pd.Timestamp(last_sample["time_ns"]).to_period('M') - 1)
+    return [r for r in records if r["path"] not in files or r["month"] is None or r["month"] >= since_month]
+
+
+def _read_new_rows(device_id, bms_records, state, config):
+    """
+    BMS 파일들의 추가분을 읽어 파일별 데이터프레임 목록을 반환합니다.
+    반환값: (데이터프레임 목록, 아직 읽지 않은 추가분이 남았는지)
+    """
+    settings = config.LIVE_WATCH
+    budget = settings["max_read_bytes"]
+    files = state["files"]
+    now = time.time()
+    df_list, pending = [], False
+    for record in sorted(_active_records(bms_records, files, state["last_sample"]),
+                         key=lambda r: (r["month"] or '', r["path"])):
+        path = record["path"]
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            files.pop(path, None)
+            continue
+        file_state = files.setdefault(path, {"offset": 0, "header": None})
+        if st.st_size < file_state["offset"]:
+            logging.warning(f"[{device_id}] 파일이 줄어들어 처음부터 다시 읽습니다: {path}")
+            file_state.update(offset=0, header=None)
+        if st.st_size <= file_state["offset"]:
+            continue
+
+        # 읽을 크기 상한에 걸린 파일은 다음 주기를 기다리지 않고 이어서 읽습니다.
+        # 그 뒤 파일을 먼저 읽으면 남은 행이 이미 처리한 시각보다 이르게 되어 버려지므로 여기서 멈춥니다.
+        before = file_state["offset"]
+        pending = budget < st.st_size - before
+        data = _read_appended(path, file_state, st.st_size, budget,
+                              settled=now - st.st_mtime > settings["poll_seconds"])
+        if data is not None:
+            df = data_loader.load_raw_bytes(data, "bms", config, path)
+            if df is not None and not df.empty:
+                df_list.append(df)
+        if pending:
+            break
+        budget -= file_state["offset"] - before
+    return df_list, pending
+
+
+def _refresh_gps_records(gps_records, state):
+    """감시 중인 달의 GPS 파일은 크기/수정시각을 다시 읽어 GPS 색인이 추가분을 반영하게 합니다."""
+    refreshed = []
+    for record in _active_records(gps_records, {}, state["last_sample"]):
+        try:
+            refreshed.append({**record, **file_manifest.make_record(record["path"], record["device_id"])})
+        except FileNotFoundError:
+            continue
+    return refreshed
+
+
+# --- 2. 열린 Trip 누적 ---
+
+def _open_trip(seq):
+    return {
+        "seq": seq, "pieces": 0, "rows": 0, "rejected": False,
+        # 한 번 참이 되면 Trip이 끝날 때까지 무효인 조건만 누적합니다. (시간/거리/에너지는 닫을 때 검증)
+        "charging": False, "acc_exceeded": False,
+        "idle_run": 0.0, "max_idle": 0.0, "prev_stopped": False,
+    }
+
+
+def _trip_starts(df, last_sample):
+    """
+    각 행이 새 Trip의 시작인지 여부. trip_parser._find_trip_boundaries와 같은 규칙을 이전 샘플에 이어서 적용합니다.
+    (600초 초과 간격, 충전 케이블 상태 변경 - 값이 없는 행이 끼어도 변경으로 봄)
+    """
+    time_ns = df['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    if 'chrg_cable_conn' in df.columns:
+        cable = df['chrg_cable_conn'].to_numpy(dtype=np.float64)
+    else:
+        cable = np.full(len(df), np.nan)
+    if last_sample is None:
+        prev_ns, prev_cable = time_ns[0], np.nan
+    else:
+        prev_ns = last_sample["time_ns"]
+        prev_cable = np.nan if last_sample["cable"] is None else last_sample["cable"]
+
+    gaps = np.diff(time_ns, prepend=prev_ns) / 1e9 > trip_parser.TRIP_GAP_SECONDS
+    cable_changes = ~(np.diff(cable, prepend=prev_cable) == 0)
+    return gaps | cable_changes
+
+
+def _accumulate(open_trip, piece, last_sample, config):
+    """열린 Trip에 이어 붙는 행들로 누적 지표를 갱신하고, 이미 무효가 되었는지 반환합니다."""
+    thresholds = config.TRIP_THRESHOLDS
+    time_ns = piece['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    # 구간 내 time_diff (Trip 첫 행은 0) - trip_parser._evaluate_segments와 같은 계산
+    prev_ns = last_sample["time_ns"] if open_trip["rows"] else time_ns[0]
+    time_diff = np.diff(time_ns, prepend=prev_ns) / 1e9
+    speed = piece['speed'].to_numpy(dtype=np.float64)
+
+    if 'chrg_cable_conn' in piece.columns:
+        open_trip["charging"] |= bool((piece['chrg_cable_conn'].to_numpy(dtype=np.float64) == 1).any())
+    acceleration = np.abs(piece['acceleration'].to_numpy(dtype=np.float64))
+    open_trip["acc_exceeded"] |= bool((acceleration > thresholds["max_abs_acceleration"]).any())
+
+    # 연속 정지 시간: 이전 조각의 마지막 행부터 이어진 정지 구간(run 0)에는 이어받은 누적 시간을 더합니다.
+    is_stopped = speed < trip_parser.IDLE_SPEED
+    prev_stopped = np.concatenate(([open_trip["prev_stopped"]], is_stopped[:-1]))
+    run_id = np.cumsum(is_stopped & ~prev_stopped)
+    run_totals = np.bincount(run_id[is_stopped], weights=time_diff[is_stopped], minlength=int(run_id[-1]) + 1)
+    run_totals[0] += open_trip["idle_run"]
+    open_trip["max_idle"] = max(open_trip["max_idle"], float(run_totals.max()))
+    open_trip["idle_run"] = float(run_totals[run_id[-1]]) if is_stopped[-1] else 0.0
+    open_trip["prev_stopped"] = bool(is_stopped[-1])
+    open_trip["rows"] += len(piece)
+
+    return (open_trip["charging"] or open_trip["acc_exceeded"]
+            or open_trip["max_idle"] >= thresholds["max_idle_duration_seconds"])
+
+
+def _append_piece(state, piece, car_model, device_id, config):
+    open_trip = state["open"]
+    if open_trip["rejected"]:
+        return
+    spool_dir = _spool_root(car_model, device_id, config) / str(open_trip["seq"])
+    if _accumulate(open_trip, piece, state["last_sample"], config):
+        # 이미 무효인 Trip은 행을 더 모으지 않습니다. (조각 폴더는 상태 저장 후 정리)
+        open_trip["rejected"] = True
+        return
+    spool_dir.mkdir(parents=True, exist_ok=True)
+    piece.to_pickle(spool_dir / f"part-{open_trip['pieces']:06d}.pkl")
+    open_trip["pieces"] += 1
+
+
+def _close_trip(state, next_cut, car_model, device_id, config):
+    """열린 Trip을 닫고, 검증을 통과하면 저장합니다. 반환값: 저장된 Trip 정보 목록"""
+    open_trip, state["open"] = state["open"], None
+    if open_trip["rejected"] or open_trip["pieces"] == 0:
+        return []
+
+    spool_dir = _spool_root(car_model, device_id, config) / str(open_trip["seq"])
+    trip_df = pd.concat([pd.read_pickle(spool_dir / f"part-{i:06d}.pkl") for i in range(open_trip["pieces"])],
+                        ignore_index=True)
+    trip_no = state["next_trip_no"]
+    writer = trip_store.open_trip_writer(car_model, device_id, config, trip_no, root=config.LIVE_WATCH["output_root"])
+    try:
+        saved_trips = trip_parser.parse_and_save_trips(trip_df, car_model, device_id, config, trip_no, next_cut, writer)
+    except BaseException:
+        writer.close(raise_error=False)
+        raise
+    writer.close()
+    state["next_trip_no"] += len(saved_trips)
+    return saved_trips
+
+
+def _segment_rows(state, df, car_model, device_id, config):
+    """새 행을 Trip 경계로 나누어 열린 Trip에 이어 붙이고, 경계에서 닫힌 Trip을 저장합니다."""
+    saved_trips = []
+    starts = _trip_starts(df, state["last_sample"])
+    if state["open"] is None:
+        starts[0] = True
+    cut_positions = np.flatnonzero(starts).tolist()
+    for lo, hi in zip([0] + cut_positions, cut_positions + [len(df)]):
+        if lo == hi:
+            continue
+        if starts[lo]:
+            if state["open"] is not None:
+                saved_trips += _close_trip(state, df['time'].iloc[lo], car_model, device_id, config)
+            state["open"] = _open_trip(state["next_seq"])
+            state["next_seq"] += 1
+        piece = df.iloc[lo:hi].reset_index(drop=True)
+        _append_piece(state, piece, car_model, device_id, config)
+        state["last_sample"] = {
+            "time_ns": int(piece['time'].iloc[-1].value),
+            "speed": _float_or_none(piece['speed'].iloc[-1]),
+            "cable": _float_or_none(piece['chrg_cable_conn'].iloc[-1]) if 'chrg_cable_conn' in piece.columns else None,
+            "altitude": _float_or_none(piece['altitude'].iloc[-1]) if 'altitude' in piece.columns else None,
+        }
+    return saved_trips
+
+
+def _cleanup_spool(state, car_model, device_id, config):
+    """상태를 저장한 뒤, 열린 Trip이 아닌 조각 폴더(닫혔거나 무효가 된 Trip)를 지웁니다."""
+    spool_root = _spool_root(car_model, device_id, config)
+    if not spool_root.exists():
+        return
+    keep = None
+    if state["open"] is not None and not state["open"]["rejected"]:
+        keep = str(state["open"]["seq"])
+    for spool_dir in spool_root.iterdir():
+        if spool_dir.name != keep:
+            shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def _record_trips(saved_trips, config):
+    if not saved_trips:
+        return
+    log_path = config.LIVE_WATCH["output_root"] / "live_trips.jsonl"
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'a', encoding='utf-8') as f:
+        for record in saved_trips:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            logging.info(f"🎉 실시간 Trip 저장: {record['trip_id']} ({record['start']} ~ {record['end']}, "
+                         f"{record['distance_m'] / 1000:.1f} km)")
+
+
+# --- 3. 단말기 감시 ---
+
+def poll_device(car_model, device_id, device_files, config, from_start=False):
+    """
+    단말기 하나의 추가분을 처리합니다.
+    from_start: 처음 감시하는 단말기의 기존 파일도 처음부터 읽습니다. (기본은 감시 시작 이후 추가분만)
+    반환값: (이번에 저장한 Trip 정보 목록, 아직 읽지 않은 추가분이 남았는지)
+    """
+    state = load_device_state(car_model, device_id, config)
+    if not state["started"]:
+        state["started"] = True
+        if not from_start:
+            # 감시 시작 시점의 기존 데이터는 배치 실행의 몫으로 보고 건너뜁니다.
+            for record in device_files["bms"]:
+                state["files"][record["path"]] = {"offset": record["size"], "header": None}
+            _save_device_state(state, car_model, device_id, config)
+            return [], False
+
+    df_list, pending = _read_new_rows(device_id, device_files["bms"], state, config)
+    df = None
+    if df_list:
+        last = state["last_sample"]
+        prev_sample = None if last is None else {
+            "time": pd.Timestamp(last["time_ns"]), "speed": np.nan if last["speed"] is None else last["speed"],
+        }
+        merge_gps = data_loader.should_merge_gps(device_id, device_files["bms"], device_files["gps"], config)
+        gps_files = _refresh_gps_records(device_files["gps"], state) if merge_gps else None
+        df = data_loader.prepare_chunk(df_list, device_id, config, prev_sample, merge_gps, gps_files)
+        if df is not None and 'altitude' in df.columns and last is not None and last.get("altitude") is not None:
+            # 추가분에 GPS가 없으면 배치 실행의 ffill처럼 마지막 고도를 이어 씁니다.
+            df['altitude'] = df['altitude'].fillna(last["altitude"])
+
+    saved_trips = []
+    if df is not None:
+        params = config.VEHICLE_PARAMS.get(car_model)
+        if params:
+            df = physics_power.add_physics_power(df, params)
+        state["last_arrival"] = time.time()
+        saved_trips += _segment_rows(state, df, car_model, device_id, config)
+    elif (not pending and state["open"] is not None and state["last_arrival"] is not None
+          and time.time() - state["last_arrival"] >= config.LIVE_WATCH["close_after_seconds"]):
+        # 새 행이 한동안 없으면 데이터가 끊긴 것으로 보고 Trip을 닫습니다.
+        saved_trips += _close_trip(state, None, car_model, device_id, config)
+
+    _save_device_state(state, car_model, device_id, config)
+    _cleanup_spool(state, car_model, device_id, config)
+    _record_trips(saved_trips, config)
+    return saved_trips, pending
+
+
+def watch(car_models, config, once=False, from_start=False):
+    """
+    선택한 차종의 단말기를 주기적으로 감시합니다. Ctrl+C로 멈추면 다음 실행에서 이어서 감시합니다.
+    once: 지금까지 도착한 추가분을 모두 처리한 뒤 종료합니다.
+    반환값: 저장한 실시간 Trip 수
+    """
+    devices = [(car_model, device_id) for car_model in car_models for device_id in vehicle_dict.get(car_model, [])]
+    if not devices:
+        logging.warning("감시할 단말기가 없습니다.")
+        return 0
+    all_device_ids = [device_id for _, device_id in devices]
+    poll_seconds = config.LIVE_WATCH["poll_seconds"]
+    logging.info(f"실시간 감시 시작: 단말기 {len(devices)}개, 주기 {poll_seconds}초")
+
+    total = 0
+    try:
+        while True:
+            poll_started = time.monotonic()
+            manifest = file_manifest.refresh_manifest(config, all_device_ids)
+            pending = False
+            for car_model, device_id in devices:
+                device_files = file_manifest.lookup_device_files(manifest, device_id)
+                try:
+                    saved_trips, more = poll_device(car_model, device_id, device_files, config, from_start)
+                except Exception as e:
+                    logging.error(f"❌ [{car_model} - {device_id}] 실시간 처리 중 오류: {e}", exc_info=True)
+                    continue
+                total += len(saved_trips)
+                pending |= more
+            if pending:
+                continue
+            if once:
+                break
+            time.sleep(max(0.0, poll_seconds - (time.monotonic() - poll_started)))
+    except KeyboardInterrupt:
+        logging.info("실시간 감시를 멈춥니다. 다음 실행에서 이어서 감시합니다.")
+    logging.info(f"실시간 감시 종료: Trip {total}개 저장")
+    return total
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="새로 들어오는 BMS/GPS 파일을 감시하여 닫힌 Trip을 바로 저장합니다.")
+    parser.add_argument("--car", action="append", dest="cars", default=None,
+                        help="감시할 차종 (여러 번 지정 가능, 기본: 모든 차종)")
+    parser.add_argument("--once", action="store_true", help="지금까지 도착한 추가분만 처리하고 종료")
+    parser.add_argument("--from-start", action="store_true",
+                        help="처음 감시하는 단말기의 기존 파일도 처음부터 읽음 (기본: 감시 시작 이후 추가분만)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    car_models = args.cars or list(vehicle_dict.keys())
+    unknown = [car for car in car_models if car not in vehicle_dict]
+    if unknown:
+        raise SystemExit(f"알 수 없는 차종: {', '.join(unknown)}")
+    return watch(car_models, config, args.once, args.from_start)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+import hashlib
+import logging
+import os
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow가 없으면 캐시 없이 CSV를 매번 파싱합니다.
+    pa = None
+    pq = None
+
+_warned_unavailable = False
+
+
+def is_enabled(config):
+    """캐시 사용 가능 여부 (설정 + pyarrow 설치 여부)."""
+    global _warned_unavailable
+    if not config.PARSE_CACHE.get("enabled", False):
+        return False
+    if pq is None:
+        if not _warned_unavailable:
+            logging.warning("pyarrow가 설치되어 있지 않아 파싱 캐시를 사용하지 않습니다. (pip install pyarrow)")
+            _warned_unavailable = True
+        return False
+    return True
+
+
+def cache_path_for(record, config, variant=""):
+    """
+    원본 파일마다 경로 해시로 폴더를 하나 두고, 크기 + 수정시각 + variant로 파일 이름을 정합니다. 내용이 바뀌면 이름도 바뀝니다.
+        <PARSE_CACHE["dir"]>/<경로 해시 앞 2자리>/<경로 해시>/<variant>-<크기/수정시각 해시>.parquet
+    record의 크기/수정시각은 매니페스트 값이 아니라 읽기 직전의 stat 값이어야 합니다. (file_manifest.restat)
+    variant: 같은 원본이라도 읽는 방식(스키마 버전 등)이 다르면 다른 캐시를 쓰도록 구분하는 값
+    """
+    path_key = hashlib.sha1(os.path.abspath(record['path']).encode('utf-8')).hexdigest()
+    content_key = hashlib.sha1(f"{record['size']}|{record['mtime']}".encode('utf-8')).hexdigest()[:16]
+    return config.PARSE_CACHE["dir"] / path_key[:2] / path_key / f"{variant}-{content_key}.parquet"
+
+
+def read_cached(record, config, columns=None, variant=""):
+    """
+    캐시된 파일을 읽습니다. 캐시가 없으면 None을 반환합니다.
+    columns가 주어지면 존재하는 열만 골라 읽습니다. (열 단위 projection)
+    """
+    cache_path = cache_path_for(record, config, variant)
+    if not cache_path.exists():
+        return None
+    try:
+        parquet_file = pq.ParquetFile(cache_path)
+        if columns is not None:
+            available = set(parquet_file.schema_arrow.names)
+            columns = [col for col in columns if col in available]
+        return parquet_file.read(columns=columns).to_pandas()
+    except Exception as e:
+        logging.warning(f"캐시 파일 읽기 실패, 원본을 다시 파싱합니다: {cache_path}. 오류: {e}")
+        return None
+
+
+def write_cached(df, record, config, variant=""):
+    """
+    파싱된 데이터프레임을 Parquet으로 저장합니다. 실패해도 파이프라인은 계속 진행됩니다.
+    같은 원본의 이전 캐시(이어 쓰기/재추출 전 내용, 다른 variant)는 저장 후 삭제하여 원본 파일마다 캐시를 하나만 둡니다.
+    """
+    cache_path = cache_path_for(record, config, variant)
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(f"{cache_path.name}.{os.getpid()}.tmp")
+    try:
+        try:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        except (pa.ArrowInvalid, pa.ArrowTypeError):
+            # 숫자/문자가 섞인 object 열은 문자열로 통일하여 저장
+            object_cols = df.select_dtypes(include='object').columns
+            df = df.astype({col: 'string' for col in object_cols})
+            table = pa.Table.from_pandas(df, preserve_index=False)
+        pq.write_table(table, tmp_path, compression=config.PARSE_CACHE.get("compression", "zstd"))
+        os.replace(tmp_path, cache_path)
+        for old_path in cache_path.parent.glob("*.parquet"):
+            if old_path != cache_path:
+                old_path.unlink(missing_ok=True)
+    except Exception as e:
+        logging.warning(f"캐시 저장 실패: {record['path']}. 오류: {e}")
+        if tmp_path.exists():
+            tmp_path.unlink()
@@ -1,41 +1,195 @@
-import pandas as pd
+import logging
+
 import numpy as np
 from Source import config
 
-def add_physics_power(df, params):
-    """데이터프레임에 물리식 기반 전력(Power_phys)을 계산하여 추가합니다."""
-    v = df['speed'].to_numpy()
-    a = df['acceleration'].to_numpy()
-    ext_temp = df['ext_temp'].to_numpy()
-    
-    # 항력, 구름저항 등
-    A = params["Ca"] * v / params["eff"]
-    B = params["Cb"] * v**2 / params["eff"]
-    C = params["Cc"] * v**3 / params["eff"]
-
-    # 가속/감속 저항
-    exp_term = np.exp(0.0411 / np.maximum(np.abs(a), 0.001))
-    total_mass = params["mass"] + params["load"]
-    D_positive = ((1 + config.INERTIA_FACTOR) * total_mass * a * v) / params["eff"]
-    D_negative = (((1 + config.INERTIA_FACTOR) * total_mass * a * v) / exp_term) * params["eff"]
-    D = np.where(a >= 0, D_positive, np.where(params["re_brake"] == 1, D_negative, 0))
-
-    # 공조 및 보조 전력
-    target_temp = 22
-    E_hvac = np.abs(target_temp - ext_temp) * params["hvac_power"] * params["hvac_eff"]
-    E = np.where(v <= 0.5, params["aux_power"] + params["idle_power"] + E_hvac, params["aux_power"] + E_hvac)
-    
-    # 경사 저항
-    # if 'altitude' in df.columns and df['altitude'].notna().any():
-    #     altitude_diff = df['altitude'].diff().fillna(0).to_numpy()
-    #     time_diff = df['time_diff'].replace(0, 1).to_numpy()
-    #     distance_diff = v * time_diff
-    #     with np.errstate(divide='ignore', invalid='ignore'):
-    #         slope = np.nan_to_num(np.arctan2(altitude_diff, distance_diff))
-    #     F = total_mass * config.GRAVITY * np.sin(slope) * v / params["eff"]
-    # else:
-    #     F = 0
-    
-    # df['Power_phys'] = A + B + C + D + E + F
-    df['Power_phys'] = A + B + C + D + E
-    return df
\ No newline at end of file
+try:
+    import numexpr
+except ImportError:  # 선택 사항: 설치되어 있으면 PHYSICS_OPTIONS["backend"]로 사용할 수 있습니다.
+    numexpr = None
+
+try:
+    import numba
+except ImportError:  # 선택 사항: 설치되어 있으면 PHYSICS_OPTIONS["backend"]로 사용할 수 있습니다.
+    numba = None
+
+# 공조 목표 온도 (°C)
+TARGET_TEMP = 22
+# 감속 시 회생 제동 효율 항: exp(-DECEL_EXP_COEF / max(|a|, MIN_ABS_ACCEL))
+DECEL_EXP_COEF = 0.0411
+MIN_ABS_ACCEL = 0.001
+
+
+def _coefficients(params, dtype):
+    """물리식의 스칼라 계수. 샘플별 계산에서 같은 곱셈/나눗셈을 반복하지 않도록 미리 묶어 둡니다."""
+    inv_eff = 1.0 / params["eff"]
+    inertia_mass = (1 + config.INERTIA_FACTOR) * (params["mass"] + params["load"])
+    coef = {
+        "Ca": params["Ca"] * inv_eff,
+        "Cb": params["Cb"] * inv_eff,
+        "Cc": params["Cc"] * inv_eff,
+        "accel": inertia_mass * inv_eff,
+        # 회생 제동을 사용하지 않으면 감속 구간 항은 0
+        "decel": inertia_mass * params["eff"] if params["re_brake"] == 1 else 0.0,
+        "aux": params["aux_power"],
+        "idle": params["idle_power"],
+        "hvac": params["hvac_power"] * params["hvac_eff"],
+    }
+    return {name: dtype.type(value) for name, value in coef.items()}
+
+
+def _numpy_kernel(v, a, ext_temp, coef, out, block_rows):
+    """
+    블록 단위로 전력을 계산해 out에 바로 씁니다. 임시 배열은 블록 크기만큼만 사용하며,
+    exp는 감속(a < 0) 샘플에만 계산합니다.
+    """
+    dtype = out.dtype
+    buf = np.empty(min(block_rows, len(out)), dtype=dtype)
+    for lo in range(0, len(out), block_rows):
+        hi = min(lo + block_rows, len(out))
+        vb, ab, tb, ob = v[lo:hi], a[lo:hi], ext_temp[lo:hi], out[lo:hi]
+        wb = buf[:hi - lo]
+
+        # 구름/공기 저항: ((Cc·v + Cb)·v + Ca)·v / eff
+        np.multiply(vb, coef["Cc"], out=ob)
+        ob += coef["Cb"]
+        ob *= vb
+        ob += coef["Ca"]
+        ob *= vb
+
+        # 가속/감속 저항: (1 + 관성계수)·질량·a·v
+        np.multiply(ab, vb, out=wb)
+        decel = ~(ab >= 0)
+        if decel.any():
+            # 감속: ·eff·exp(-0.0411 / max(|a|, 0.001)) (a가 NaN이면 원래 식과 같이 NaN)
+            idx = np.flatnonzero(decel)
+            a_neg = np.abs(ab[idx])
+            np.maximum(a_neg, MIN_ABS_ACCEL, out=a_neg)
+            np.divide(-DECEL_EXP_COEF, a_neg, out=a_neg)
+            np.exp(a_neg, out=a_neg)
+            if coef["decel"] == 0:
+                wb[idx] = 0
+            else:
+                wb[idx] *= a_neg * coef["decel"]
+            np.multiply(wb, coef["accel"], out=wb, where=~decel)
+        else:
+            wb *= coef["accel"]
+        ob += wb
+
+        # 공조 및 보조 전력: aux + hvac·|22 - T| (+ 정차 시 idle)
+        np.subtract(tb, TARGET_TEMP, out=wb)
+        np.abs(wb, out=wb)
+        wb *= coef["hvac"]
+        ob += wb
+        ob += coef["aux"]
+        if coef["idle"] != 0:
+            ob[vb <= 0.5] += coef["idle"]
+    return out
+
+
+def _numexpr_kernel(v, a, ext_temp, coef, out):
+    decel = (
+        f"a * v * decel * exp(-{DECEL_EXP_COEF} / where(abs(a) > {MIN_ABS_ACCEL}, abs(a), {MIN_ABS_ACCEL}))"
+        if coef["decel"] != 0 else "0"
+    )
+    expression = (
+        "((Cc * v + Cb) * v + Ca) * v"
+        f" + where(a >= 0, a * v * accel, {decel})"
+        f" + aux + hvac * abs(ext_temp - {TARGET_TEMP})"
+        " + where(v <= 0.5, idle, 0)"
+    )
+    numexpr.evaluate(expression, local_dict=dict(coef, v=v, a=a, ext_temp=ext_temp), out=out, casting='same_kind')
+    return out
+
+
+_numba_kernel = None
+
+
+def _get_numba_kernel():
+    """numba 커널은 처음 사용할 때 한 번만 컴파일합니다. (cache=True: 이후 실행은 디스크 캐시 사용)"""
+    global _numba_kernel
+    if _numba_kernel is None:
+        @numba.njit(cache=True)
+        def kernel(v, a, ext_temp, c_a, c_b, c_c, accel, decel, aux, idle, hvac, out):
+            for i in range(len(out)):
+                vi = v[i]
+                ai = a[i]
+                p = ((c_c * vi + c_b) * vi + c_a) * vi
+                if ai >= 0:
+                    p += ai * vi * accel
+                elif decel != 0:
+                    p += ai * vi * decel * np.exp(-DECEL_EXP_COEF / max(abs(ai), MIN_ABS_ACCEL))
+                p += aux + hvac * abs(ext_temp[i] - TARGET_TEMP)
+                if vi <= 0.5:
+                    p += idle
+                out[i] = p
+        _numba_kernel = kernel
+    return _numba_kernel
+
+
+def _resolve_backend(name):
+    if name == "auto":
+        return "numba" if numba is not None else ("numexpr" if numexpr is not None else "numpy")
+    if (name == "numba" and numba is None) or (name == "numexpr" and numexpr is None):
+        logging.warning(f"물리식 계산 백엔드 '{name}'이(가) 설치되어 있지 않아 NumPy로 계산합니다.")
+        return "numpy"
+    return name
+
+
+def grade_sine(altitude, distance):
+    """
+    경사각의 사인값 sin(arctan2(고도 변화, 이동 거리)) = Δh / √(Δh² + d²).
+    고도 변화와 거리가 모두 0이거나 결측이면 0 (평지)으로 봅니다.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sine = altitude / np.hypot(altitude, distance)
+    return np.nan_to_num(sine, nan=0.0, posinf=0.0, neginf=0.0, copy=False)
+
+
+def _add_grade_power(df, params, out, dtype):
+    """경사 저항 F = 질량·g·sin(경사)·v / eff 를 out에 더합니다. 고도 데이터가 없으면 더하지 않습니다."""
+    if 'altitude' not in df.columns or not df['altitude'].notna().any():
+        return
+    v = df['speed'].to_numpy(dtype=dtype)
+    altitude_diff = np.nan_to_num(np.diff(df['altitude'].to_numpy(dtype=dtype), prepend=np.nan), nan=0.0)
+    time_diff = df['time_diff'].to_numpy(dtype=dtype)
+    # 원래 식과 같이 time_diff가 0이면 1초로 봅니다.
+    distance = v * np.where(time_diff == 0, dtype.type(1), time_diff)
+    sine = grade_sine(altitude_diff, distance)
+    sine *= v
+    sine *= dtype.type((params["mass"] + params["load"]) * config.GRAVITY / params["eff"])
+    out += sine
+
+
+def add_physics_power(df, params, out=None, options=None):
+    """
+    데이터프레임에 물리식 기반 전력(Power_phys)을 계산하여 추가합니다.
+    out: 결과를 쓸 미리 할당된 배열 (길이 len(df), PHYSICS_OPTIONS["dtype"]). 없으면 새로 할당합니다.
+    options: 계산 옵션 (기본: config.PHYSICS_OPTIONS)
+    """
+    options = options or config.PHYSICS_OPTIONS
+    dtype = np.dtype(options.get("dtype", "float64"))
+    if out is None:
+        out = np.empty(len(df), dtype=dtype)
+
+    # 같은 dtype의 열은 복사하지 않고 그대로 사용
+    v = df['speed'].to_numpy(dtype=dtype)
+    a = df['acceleration'].to_numpy(dtype=dtype)
+    ext_temp = df['ext_temp'].to_numpy(dtype=dtype)
+    coef = _coefficients(params, dtype)
+
+    backend = _resolve_backend(options.get("backend", "auto"))
+    if backend == "numba":
+        _get_numba_kernel()(v, a, ext_temp, coef["Ca"], coef["Cb"], coef["Cc"], coef["accel"], coef["decel"],
+                            coef["aux"], coef["idle"], coef["hvac"], out)
+    elif backend == "numexpr":
+        _numexpr_kernel(v, a, ext_temp, coef, out)
+    else:
+        _numpy_kernel(v, a, ext_temp, coef, out, options.get("block_rows", 65536))
+
+    # 경사 저항 (고도 기반, PHYSICS_OPTIONS["grade"])
+    if options.get("grade", False):
+        _add_grade_power(df, params, out, dtype)
+
+    df['Power_phys'] = out
+    return df
@@ -1,42 +1,113 @@
+import itertools
 import os
+import numpy as np
 import pandas as pd
 from openpyxl import Workbook
-from openpyxl.styles import PatternFill, Border, Side, Alignment
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import NamedStyle, PatternFill, Border, Side, Alignment
+from openpyxl.utils import get_column_letter
 import logging
+from Source import trip_store, trip_catalog, validation
 
-def _apply_excel_styles(ws):
-    """Excel 시트에 공통 스타일을 적용하는 헬퍼 함수"""
+try:
+    import pyarrow  # noqa: F401  (리포트 표의 Parquet 사본 저장에 필요)
+except ImportError:  # pyarrow가 없으면 Parquet 사본 없이 CSV 사본만 저장합니다.
+    pyarrow = None
+
+# 리포트 시트 공통 스타일 이름 (통합 문서마다 한 번 등록하고, 셀에는 이름만 지정합니다)
+_HEADER_STYLE = "report_header"
+_BODY_STYLE = "report_body"
+
+
+def _register_styles(wb):
+    """머리글(헤더 행/첫 열)과 본문 셀 스타일을 이름 있는 스타일로 한 번만 등록합니다."""
     header_fill = PatternFill(start_color="DDEBF7", end_color="DDEBF7", fill_type="solid")
     border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
-    
-    for row in ws.iter_rows():
-        for cell in row:
-            cell.border = border
-            cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 헤더 행에 스타일 적용
-    for cell in ws[1]:
-        cell.fill = header_fill
-        
-    # 헤더 열(인덱스)에 스타일 적용
-    for row in ws.iter_rows(min_row=2):
-        row[0].fill = header_fill
-
-    # 열 너비 자동 조정
-    for column_cells in ws.columns:
-        # 셀 값의 길이를 계산할 때 NoneType을 고려하여 str로 변환
-        length = max(len(str(cell.value)) for cell in column_cells if cell.value is not None)
-        ws.column_dimensions[column_cells[0].column_letter].width = length + 4
+    center = Alignment(horizontal='center', vertical='center')
+    wb.add_named_style(NamedStyle(_BODY_STYLE, border=border, alignment=center))
+    wb.add_named_style(NamedStyle(_HEADER_STYLE, border=border, alignment=center, fill=header_fill))
 
 
-def generate_trip_report(config):
+def _table_frame(table):
+    """시트/사본에 쓸 표: 인덱스를 열로 풀고 열 이름을 문자열로 맞춥니다."""
+    frame = table.reset_index()
+    frame.columns = [str(c) for c in frame.columns]
+    return frame
+
+
+def _column_widths(frame):
+    """열마다 머리글과 값 중 가장 긴 글자 수 + 4. 셀을 하나씩 보지 않고 열 단위 문자열 연산으로 계산합니다."""
+    value_lengths = frame.apply(lambda column: column.dropna().astype(str).str.len().max()).fillna(0)
+    header_lengths = pd.Series([len(c) for c in frame.columns], index=frame.columns)
+    return (np.maximum(value_lengths, header_lengths) + 4).astype(int).tolist()
+
+
+def _styled_row(ws, values, header=False):
+    """한 행의 셀을 만듭니다. 헤더 행과 첫 열(인덱스)은 머리글 스타일, 나머지는 본문 스타일."""
+    cells = []
+    for i, value in enumerate(values):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = _HEADER_STYLE if header or i == 0 else _BODY_STYLE
+        cells.append(cell)
+    return cells
+
+
+def _write_sheet(wb, sheet_name, blocks):
     """
-    (최종 수정) 차종별 하위 폴더를 모두 탐색하고, 새로운 파일명 규칙에 따라
-    단말기별/월별 Trip 개수 리포트와 요약 리포트를 생성합니다.
+    쓰기 전용(write-only) 시트에 표들을 위에서부터 차례로 씁니다. 표 사이에는 빈 행 2개를 둡니다.
+    blocks: [(제목 또는 None, 표)]
+    쓰기 전용 시트는 행을 쓴 뒤에는 열 너비를 바꿀 수 없으므로 너비를 먼저 계산해 둡니다.
     """
-    trip_folder_path = config.PATHS["output_trip"]
-    report_output_path = config.PATHS["output_report"]
-    
+    ws = wb.create_sheet(sheet_name)
+    frames = [(title, _table_frame(table)) for title, table in blocks]
+
+    widths = []
+    for title, frame in frames:
+        frame_widths = _column_widths(frame)
+        if title:
+            frame_widths[0] = max(frame_widths[0], len(title) + 4)
+        widths = [max(pair) for pair in itertools.zip_longest(widths, frame_widths, fillvalue=0)]
+    for i, width in enumerate(widths, start=1):
+        ws.column_dimensions[get_column_letter(i)].width = width
+
+    for n, (title, frame) in enumerate(frames):
+        if n > 0:
+            ws.append([])
+            ws.append([])
+        if title:
+            ws.append(_styled_row(ws, [title], header=True))
+        ws.append(_styled_row(ws, frame.columns, header=True))
+        # 결측값/무한대는 빈 셀로 씁니다. (pandas to_excel과 동일)
+        values = frame.astype(object).where(frame.notna() & ~frame.isin([np.inf, -np.inf]), None)
+        for row in values.itertuples(index=False, name=None):
+            ws.append(_styled_row(ws, row))
+
+
+def _save_companions(tables, config):
+    """
+    리포트의 표들을 REPORT_OUTPUT["companions"] 형식(parquet/csv)으로도 저장합니다.
+    Excel을 열지 않고 분석 도구에서 바로 읽을 수 있습니다.
+    """
+    formats = list(config.REPORT_OUTPUT.get("companions", []))
+    if not formats:
+        return
+    if "parquet" in formats and pyarrow is None:
+        logging.warning("pyarrow가 설치되어 있지 않아 리포트 표의 Parquet 사본은 저장하지 않습니다.")
+        formats.remove("parquet")
+
+    output_dir = config.REPORT_OUTPUT["companion_dir"]
+    os.makedirs(output_dir, exist_ok=True)
+    for name, table in tables.items():
+        frame = _table_frame(table)
+        if "parquet" in formats:
+            frame.to_parquet(output_dir / f"{name}.parquet", index=False)
+        if "csv" in formats:
+            frame.to_csv(output_dir / f"{name}.csv", index=False, encoding='utf-8-sig')
+    logging.info(f"✅ 리포트 표 사본({', '.join(formats)})이 '{output_dir}'에 저장되었습니다.")
+
+
+def _collect_records_from_csv(trip_folder_path):
+    """차종별 폴더의 Trip CSV 파일명을 분석하여 리포트 레코드를 만듭니다."""
     all_trip_files = []
     for root, _, files in os.walk(trip_folder_path):
         for file in files:
@@ -46,7 +117,7 @@ def generate_trip_report(config):
 
     if not all_trip_files:
         logging.warning(f"리포트할 Trip 파일이 '{trip_folder_path}'에 없습니다.")
-        return
+        return []
 
     records = []
     for car_model, file in all_trip_files:
@@ -85,12 +156,119 @@ def generate_trip_report(config):
         except IndexError:
             logging.warning(f"파일명 분석 중 오류 발생: {file}")
             continue
-            
-    if not records:
-        logging.warning("분석할 유효한 Trip 레코드가 없습니다.")
-        return
-        
-    df = pd.DataFrame(records)
+    return records
+
+
+def _collect_records_from_parquet(config):
+    """Parquet Trip 저장소의 파티션 정보로 리포트 레코드를 만듭니다."""
+    return [
+        {"차종": car_model, "단말기번호": device_no, "연월": year_month, "altitude_유무": has_altitude}
+        for car_model, device_no, year_month, has_altitude in trip_store.list_parquet_trips(config)
+    ]
+
+
+def _collect_records_from_catalog(catalog_df):
+    """Trip 카탈로그를 리포트 레코드 형식(한글 열 이름)으로 바꿉니다. 지표 열도 함께 유지합니다."""
+    return catalog_df.rename(columns={
+        "car_model": "차종", "device_id": "단말기번호", "year_month": "연월", "has_altitude": "altitude_유무",
+    })
+
+
+def _summarize_metrics(df):
+    """차종별 주행 지표 요약 (카탈로그가 있을 때만 생성)."""
+    summary = df.groupby('차종').agg(
+        총_주행거리_km=('distance_m', 'sum'),
+        총_소모에너지_kWh=('energy_kwh', 'sum'),
+        총_운행시간_h=('duration_s', 'sum'),
+        평균_SOC_감소=('soc_delta', 'mean'),
+        평균_외기온도=('mean_ext_temp', 'mean'),
+        평균_Altitude_비율=('altitude_coverage', 'mean'),
+    )
+    summary['총_주행거리_km'] /= 1000
+    summary['총_운행시간_h'] /= 3600
+    summary['전비(km/kWh)'] = summary['총_주행거리_km'] / summary['총_소모에너지_kWh']
+    return summary.round(2)
+
+
+def _efficiency_table(rollups_df, index_columns):
+    """합산 지표(trip_catalog.load_rollups)로 전비 표를 만듭니다. 합계를 먼저 더한 뒤 나누므로 Trip 수와 관계없이 가중 평균입니다."""
+    table = pd.DataFrame({
+        "주행거리_km": rollups_df["distance_m"] / 1000,
+        "주행시간_h": rollups_df["drive_s"] / 3600,
+        "정지시간_h": rollups_df["idle_s"] / 3600,
+        "측정_에너지_kWh": rollups_df["energy_data_kwh"],
+        "물리식_에너지_kWh": rollups_df["energy_phys_kwh"],
+        "Trip_수": rollups_df["trips"],
+        "단말기_수": rollups_df["devices"],
+    })
+    table["전비_측정(km/kWh)"] = table["주행거리_km"] / table["측정_에너지_kWh"]
+    table["전비_물리식(km/kWh)"] = table["주행거리_km"] / table["물리식_에너지_kWh"]
+    table["평균속도(km/h)"] = table["주행거리_km"] / table["주행시간_h"]
+    table.index = pd.MultiIndex.from_frame(rollups_df[list(index_columns)].rename(columns={
+        "car_model": "차종", "month": "연월", "temp_band": "외기온도_구간(°C)",
+    }))
+    return table.round(2)
+
+
+def _efficiency_sheets(config):
+    """Trip 카탈로그의 일자/온도 구간별 합산 지표로 월별/외기온도별 전비 시트를 만듭니다. 합산 지표가 없으면 빈 딕셔너리."""
+    sheets = {}
+    for sheet_name, group_by in (("월별_전비", ("car_model", "month")), ("외기온도별_전비", ("car_model", "temp_band"))):
+        rollups_df = trip_catalog.load_rollups(config, group_by)
+        if rollups_df is None or rollups_df.empty:
+            return {}
+        sheets[sheet_name] = _efficiency_table(rollups_df, group_by)
+    return sheets
+
+
+_VALIDATION_COLUMNS = {
+    "car_model": "차종", "trips": "Trip_수", "samples": "샘플_수",
+    "speed_bin_kmh": "속도_구간(km/h)", "temp_band": "외기온도_구간(°C)",
+    "energy_data_kwh": "측정_에너지_kWh", "energy_phys_kwh": "물리식_에너지_kWh", "energy_error_pct": "에너지_오차(%)",
+    "rmse_kw": "전력_RMSE(kW)", "bias_kw": "전력_편향(kW)",
+    "traction_error_pct": "구동_에너지_오차(%)", "regen_error_pct": "회생_에너지_오차(%)",
+    "trip_error_pct_mean": "Trip_오차_평균(%)", "trip_error_pct_abs_mean": "Trip_절대오차_평균(%)",
+    "trip_error_pct_abs_p90": "Trip_절대오차_P90(%)",
+}
+
+
+def _validation_tables(config):
+    """마지막 물리식 검증(validation.run_validation) 결과의 차종별 요약/구간별 표. 결과가 없으면 (None, None)."""
+    cars, bins = validation.load_results(config)
+    if cars is None:
+        return None, None
+    cars = cars.rename(columns=_VALIDATION_COLUMNS).set_index("차종").round(2)
+    bins = bins.rename(columns=_VALIDATION_COLUMNS).set_index(["차종", "속도_구간(km/h)", "외기온도_구간(°C)"]).round(2)
+    return cars, bins
+
+
+def generate_trip_report(config):
+    """
+    (최종 수정) 단말기별/월별 Trip 개수 리포트와 요약 리포트를 생성합니다.
+    워커가 기록한 Trip 카탈로그를 읽으며, 카탈로그가 없을 때만 Trip 저장소를 탐색합니다.
+    (CSV: 파일명 규칙 분석, Parquet: 파티션(차종/단말기/연월))
+    """
+    report_output_path = config.PATHS["output_report"]
+
+    catalog_df = trip_catalog.load_catalog(config)
+    metrics_summary = None
+    efficiency_sheets = {}
+    if catalog_df is not None and not catalog_df.empty:
+        df = _collect_records_from_catalog(catalog_df)
+        metrics_summary = _summarize_metrics(df)
+        efficiency_sheets = _efficiency_sheets(config)
+    else:
+        logging.warning("Trip 카탈로그가 없어 Trip 저장소를 직접 탐색합니다. (파이프라인을 다시 실행하면 카탈로그가 생성됩니다)")
+        if config.TRIP_OUTPUT.get("backend", "csv") == "parquet":
+            records = _collect_records_from_parquet(config)
+        else:
+            records = _collect_records_from_csv(config.PATHS["output_trip"])
+
+        if not records:
+            logging.warning("분석할 유효한 Trip 레코드가 없습니다.")
+            return
+
+        df = pd.DataFrame(records)
     
     # --- 1. 기존 리포트 (단말기별/월별) 생성 로직 ---
     report_df = df.groupby(["차종", "단말기번호", "연월"]).size().reset_index(name='Trip 수')
@@ -112,25 +290,33 @@ def generate_trip_report(config):
 
 
     # --- 3. Excel 파일로 저장 ---
+    # 쓰기 전용 통합 문서는 행을 바로 파일로 내보내므로 단말기/월 수가 늘어도 메모리와 시간이 선형으로만 늘어납니다.
+    sheets = {
+        '단말기별_Trip_현황': [(None, pivot_df)],
+        'Trip_요약': [("차종별 Trip 분석", summary_by_car), ("차종별/월별 Trip 분석", summary_by_month)],
+    }
+    tables = {'단말기별_Trip_현황': pivot_df, '차종별_Trip_요약': summary_by_car, '차종별_월별_Trip': summary_by_month}
+    # 카탈로그의 Trip별 지표로 만든 차종별 주행 요약
+    if metrics_summary is not None:
+        sheets['주행지표_요약'] = [(None, metrics_summary)]
+        tables['주행지표_요약'] = metrics_summary
+    # 일자/외기온도 구간별 합산 지표로 만든 전비 시트 (Trip 파일을 다시 읽지 않음)
+    for sheet_name, table in efficiency_sheets.items():
+        sheets[sheet_name] = [(None, table)]
+        tables[sheet_name] = table
+    # 물리식 검증 결과가 있으면 차종별 요약과 속도 x 외기온도 구간별 오차를 한 시트에 씀
+    validation_cars, validation_bins = _validation_tables(config)
+    if validation_cars is not None:
+        sheets['물리식_검증'] = [("차종별 물리식 검증", validation_cars), ("속도/외기온도 구간별 오차", validation_bins)]
+        tables['물리식_검증_차종별'] = validation_cars
+        tables['물리식_검증_구간별'] = validation_bins
+
     output_excel_file = report_output_path / 'Trip_report.xlsx'
-    with pd.ExcelWriter(output_excel_file, engine='openpyxl') as writer:
-        # 첫 번째 시트: 기존 리포트 저장
-        pivot_df.to_excel(writer, sheet_name='단말기별_Trip_현황', merge_cells=False)
-        _apply_excel_styles(writer.sheets['단말기별_Trip_현황'])
-        
-        # 두 번째 시트: 신규 요약 리포트 저장
-        # 제목을 추가하기 위해 startrow=1 부터 데이터프레임 작성
-        summary_by_car.to_excel(writer, sheet_name='Trip_요약', startrow=1)
-        ws_summary = writer.sheets['Trip_요약']
-        ws_summary['A1'] = "차종별 Trip 분석"
-
-        # 두 번째 테이블을 아래에 이어서 작성 (3칸 띄우기)
-        start_row_for_month_summary = len(summary_by_car) + 5
-        summary_by_month.to_excel(writer, sheet_name='Trip_요약', startrow=start_row_for_month_summary)
-        ws_summary.cell(row=start_row_for_month_summary, column=1, value="차종별/월별 Trip 분석")
-
-        # 새로 추가된 'Trip_요약' 시트에도 스타일 적용
-        _apply_excel_styles(ws_summary)
-
-
-    logging.info(f"🎉 종합 리포트가 '{output_excel_file}'에 성공적으로 저장되었습니다.")
\ No newline at end of file
+    wb = Workbook(write_only=True)
+    _register_styles(wb)
+    for sheet_name, blocks in sheets.items():
+        _write_sheet(wb, sheet_name, blocks)
+    wb.save(output_excel_file)
+    logging.info(f"🎉 종합 리포트가 '{output_excel_file}'에 성공적으로 저장되었습니다.")
+
+    _save_companions(tables, config)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import logging
+import os
+import uuid
+from datetime import datetime
+from pathlib import Path
+
+# 실행 저널: 파이프라인 실행마다 시작/단말기 완료/종료를 한 줄씩(JSON Lines) 기록합니다.
+# 실행이 중간에 멈추면 종료 기록이 없으므로, 이어서 실행(--resume)할 때 완료된 단말기를 건너뛸 수 있습니다.
+JOURNAL_VERSION = 1
+
+_CODE_DIR = Path(__file__).resolve().parent
+
+
+def code_fingerprint():
+    """파이프라인 코드(Source/*.py, main.py)의 해시값. 코드가 바뀌면 이전 실행의 완료 기록을 쓰지 않습니다."""
+    digest = hashlib.sha1()
+    for path in sorted(_CODE_DIR.glob('*.py')) + [_CODE_DIR.parent / 'main.py']:
+        if path.exists():
+            digest.update(path.name.encode('utf-8'))
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def device_fingerprint(config_fingerprint, code_fp):
+    """단말기 결과를 결정하는 설정 지문(run_state.config_fingerprint)과 코드 지문을 합친 값."""
+    return hashlib.sha1(f"{config_fingerprint}|{code_fp}".encode('utf-8')).hexdigest()
+
+
+def journal_path_for(config, node=None):
+    """실행 저널 경로. 여러 노드로 나누어 실행하면 노드마다 따로 기록합니다."""
+    journal_path = config.PATHS["run_journal"]
+    return journal_path.with_name(f"{journal_path.stem}.{node}{journal_path.suffix}") if node else journal_path
+
+
+def _append(journal_path, event):
+    # 한 줄씩 바로 디스크에 기록하여, 전원이 꺼져도 이미 완료된 단말기 기록은 남도록 합니다.
+    with open(journal_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(event, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def start_run(journal_path, selected_cars, incremental, device_ids=None, distributed=None):
+    """
+    새 실행 저널을 시작합니다. (이전 실행의 저널은 덮어씀)
+    이어서 실행할 때 같은 범위로 다시 실행할 수 있도록 단말기 선택과 분산 실행 설정도 함께 기록합니다.
+    """
+    journal_path.parent.mkdir(parents=True, exist_ok=True)
+    journal_path.unlink(missing_ok=True)
+    _append(journal_path, {
+        "event": "start", "version": JOURNAL_VERSION, "run_id": uuid.uuid4().hex,
+        "started": datetime.now().isoformat(timespec='seconds'),
+        "selected_cars": list(selected_cars), "incremental": incremental,
+        "device_ids": list(device_ids) if device_ids is not None else None, "distributed": distributed,
+    })
+
+
+def record_device(journal_path, car_model, device_id, status, fingerprint):
+    """단말기 하나의 처리 결과를 기록합니다. (SUCCESS/SKIPPED만 이어서 실행할 때 건너뜀)"""
+    _append(journal_path, {
+        "event": "device", "car_model": car_model, "device_id": device_id, "status": status,
+        "fingerprint": fingerprint, "finished": datetime.now().isoformat(timespec='seconds'),
+    })
+
+
+def finish_run(journal_path):
+    _append(journal_path, {"event": "end", "finished": datetime.now().isoformat(timespec='seconds')})
+
+
+def load_interrupted_run(journal_path):
+    """
+    마지막 실행이 종료 기록 없이 멈췄으면 그 실행 정보를 반환합니다. 없거나 정상 종료되었으면 None.
+    반환값: {"run_id", "selected_cars", "incremental", "device_ids", "distributed", "completed": {(차종, 단말기): 지문}}
+    """
+    if not journal_path.exists():
+        return None
+    run = None
+    with open(journal_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except json.JSONDecodeError:
+                # 기록 도중 멈춘 마지막 줄
+                logging.warning(f"실행 저널의 손상된 줄을 건너뜁니다: {line.strip()[:80]}")
+                continue
+            if event["event"] == "start":
+                if event.get("version") != JOURNAL_VERSION:
+                    return None
+                run = {"run_id": event["run_id"], "selected_cars": event["selected_cars"],
+                       "incremental": event["incremental"], "device_ids": event.get("device_ids"),
+                       "distributed": event.get("distributed"), "completed": {}}
+            elif event["event"] == "device" and run is not None:
+                key = (event["car_model"], event["device_id"])
+                if event["status"] in ("SUCCESS", "SKIPPED"):
+                    run["completed"][key] = event["fingerprint"]
+                else:
+                    run["completed"].pop(key, None)
+            elif event["event"] == "end":
+                run = None
+    return run
@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+from Source import scheduler, trip_store
+
+STATE_VERSION = 1
+
+
+def _state_path(car_model, device_id, config):
+    return config.PATHS["state"] / car_model / f"{device_id}.json"
+
+
+def config_fingerprint(car_model, config):
+    """Trip 결과에 영향을 주는 설정(Trip 검증 조건, 차량 파라미터, 물리식 정밀도/경사 저항)의 해시값."""
+    payload = {
+        "thresholds": config.TRIP_THRESHOLDS,
+        "params": config.VEHICLE_PARAMS.get(car_model),
+        "inertia": config.INERTIA_FACTOR,
+        "physics": {key: config.PHYSICS_OPTIONS.get(key) for key in ("dtype", "grade")},
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def file_fingerprints(device_files):
+    """매니페스트 레코드로부터 {경로: {크기, 수정시각, 연월}} 지문을 만듭니다."""
+    fingerprints = {}
+    for kind in ("bms", "gps"):
+        for r in device_files[kind]:
+            fingerprints[r["path"]] = {"kind": kind, "size": r["size"], "mtime": r["mtime"], "month": r["month"]}
+    return fingerprints
+
+
+def load_device_state(car_model, device_id, config):
+    """단말기의 마지막 성공 실행 상태를 읽습니다. 없으면 None."""
+    try:
+        with open(_state_path(car_model, device_id, config), 'r', encoding='utf-8') as f:
+            state = json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"[{device_id}] 실행 상태 파일을 읽을 수 없어 전체 재처리합니다. 오류: {e}")
+        return None
+    if state.get("version") != STATE_VERSION:
+        return None
+    for trip in state["trips"]:
+        for key in ("start", "end", "next_cut"):
+            trip[key] = pd.Timestamp(trip[key]) if trip[key] is not None else None
+    return state
+
+
+def save_device_state(car_model, device_id, device_files, trips, fingerprint, config):
+    """성공한 실행의 원본 파일 지문과 저장된 Trip 목록을 기록합니다."""
+    state_path = _state_path(car_model, device_id, config)
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    state = {
+        "version": STATE_VERSION,
+        "car_model": car_model,
+        "device_id": device_id,
+        "config_fingerprint": fingerprint,
+        "files": file_fingerprints(device_files),
+        "trips": [
+            # 일자/온도 구간별 합산 지표(rollups)는 Trip 카탈로그에만 기록합니다.
+            {**{key: value for key, value in trip.items() if key != "rollups"},
+             **{key: trip[key].isoformat() if trip[key] is not None else None for key in ("start", "end", "next_cut")}}
+            for trip in sorted(trips, key=lambda t: t["trip_no"])
+        ],
+    }
+    tmp_path = state_path.with_name(state_path.name + '.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp_path, state_path)
+
+
+def plan_device_run(state, device_files, fingerprint):
+    """
+    이전 실행 상태와 현재 원본 파일을 비교하여 처리 방식을 결정합니다.
+    반환값:
+        {"mode": "skip"}                        변경 없음
+        {"mode": "full", "kept_trips": []}     처음부터 재처리
+        {"mode": "incremental", "resume_time", "load_from_month", "kept_trips", "trip_counter_start"}
+    """
+    full = {"mode": "full", "kept_trips": []}
+    if state is None or state.get("config_fingerprint") != fingerprint:
+        return full
+
+    current = file_fingerprints(device_files)
+    previous = state["files"]
+    if set(previous) - set(current):
+        # 삭제된 원본 파일이 있으면 기존 Trip을 신뢰할 수 없으므로 전체 재처리
+        return full
+
+    changed = [path for path, fp in current.items()
+               if path not in previous or (previous[path]["size"], previous[path]["mtime"]) != (fp["size"], fp["mtime"])]
+    if not changed:
+        return {"mode": "skip"}
+
+    changed_months = [current[path]["month"] for path in changed]
+    if None in changed_months:
+        return full
+    changed_from = pd.Timestamp(f"{min(changed_months)}-01")
+
+    # 변경 시작 시각 이전에 다음 구간이 시작된(=완전히 닫힌) Trip은 그대로 유지
+    kept_trips = [t for t in state["trips"] if t["next_cut"] is not None and t["next_cut"] < changed_from]
+    if not kept_trips:
+        return full
+
+    resume_time = kept_trips[-1]["next_cut"]
+    # time_diff/acceleration 계산을 위해 재개 시각 직전 한 달을 문맥으로 함께 읽습니다.
+    load_from_month = (resume_time.to_period('M') - 1).strftime('%Y-%m')
+    return {
+        "mode": "incremental",
+        "resume_time": resume_time,
+        "load_from_month": load_from_month,
+        "kept_trips": kept_trips,
+        "trip_counter_start": kept_trips[-1]["trip_no"] + 1,
+    }
+
+
+def select_files_from_month(device_files, from_month):
+    """지정한 연월 이후의 파일만 남깁니다. 연월을 알 수 없는 파일은 항상 포함합니다."""
+    return {
+        kind: [r for r in records if r["month"] is None or r["month"] >= from_month]
+        for kind, records in device_files.items()
+    }
+
+
+def remove_stale_trips(state, kept_trips, saved_trips):
+    """이전 실행에서 저장했지만 이번 실행 결과에 없는 Trip 파일을 삭제합니다."""
+    if state is None:
+        return
+    live_paths = {t["path"] for t in kept_trips} | {t["path"] for t in saved_trips}
+    for trip in state["trips"]:
+        if trip["path"] not in live_paths and os.path.exists(trip["path"]):
+            os.remove(trip["path"])
+            logging.info(f"🗑️ 더 이상 유효하지 않은 Trip 삭제: {trip['path']}")
+
+
+def remove_orphan_outputs(car_model, device_ids, config):
+    """
+    중단된 실행에서 완료되지 않은 단말기의 잔여 출력(임시 파일, 실행 상태에 없는 Trip 파일, 샤드 임시 폴더)을 삭제합니다.
+    실행 상태는 단말기가 성공적으로 끝났을 때만 기록되므로, 상태에 있는 Trip만 완료된 결과로 봅니다.
+    """
+    live_paths = set()
+    for device_id in device_ids:
+        state = load_device_state(car_model, device_id, config)
+        if state is not None:
+            live_paths.update(trip["path"] for trip in state["trips"])
+        scheduler.clear_staging(car_model, device_id, config)
+    removed = trip_store.remove_orphan_outputs(car_model, set(device_ids), live_paths, config)
+    if removed:
+        logging.info(f"🗑️ [{car_model}] 중단된 실행이 남긴 파일 {removed}개를 삭제했습니다.")
+    return removed
@@ -0,0 +1,144 @@
+import logging
+import math
+import shutil
+
+import pandas as pd
+
+
+def device_bytes(device_files):
+    """단말기 원본 BMS 파일 용량의 합 (작업 크기 추정에 사용)."""
+    return sum(r["size"] for r in device_files["bms"])
+
+
+def _month_bytes(device_files):
+    """연월별 원본 BMS 용량. 연월을 알 수 없는 파일이 있으면 None."""
+    sizes = {}
+    for r in device_files["bms"]:
+        if r["month"] is None:
+            return None
+        sizes[r["month"]] = sizes.get(r["month"], 0) + r["size"]
+    return sizes
+
+
+def plan_shards(device_files, settings, max_shards):
+    """
+    용량이 큰 단말기를 연속된 연월 구간(샤드)으로 나눕니다. 각 샤드의 원본 용량이 비슷하도록 자릅니다.
+    반환값: [(시작 연월, 끝 연월), ...] 또는 분할하지 않으면 None
+    """
+    total = device_bytes(device_files)
+    if settings["shard_min_bytes"] <= 0 or total < settings["shard_min_bytes"]:
+        return None
+    month_bytes = _month_bytes(device_files)
+    if month_bytes is None:
+        return None
+
+    months = sorted(month_bytes)
+    n_shards = min(len(months), max_shards, math.ceil(total / settings["target_shard_bytes"]))
+    if n_shards < 2:
+        return None
+
+    shards, current, accumulated = [], [], 0
+    for month in months:
+        current.append(month)
+        accumulated += month_bytes[month]
+        if len(shards) < n_shards - 1 and accumulated * n_shards >= total * (len(shards) + 1):
+            shards.append((current[0], current[-1]))
+            current = []
+    if current:
+        shards.append((current[0], current[-1]))
+    return shards
+
+
+def shard_files(device_files, from_month, to_month):
+    """
+    샤드가 읽을 파일: 샤드 구간과 앞뒤 한 달.
+    앞 달은 첫 행의 time_diff/acceleration 문맥으로, 뒤 달은 다음 달 파일에 섞인 구간 내 데이터를 위해 읽으며,
+    구간 밖의 행은 시각 기준으로 잘라냅니다.
+    """
+    lo = str(pd.Period(from_month, freq='M') - 1)
+    hi = str(pd.Period(to_month, freq='M') + 1)
+    return {
+        kind: [r for r in records if r["month"] is None or lo <= r["month"] <= hi]
+        for kind, records in device_files.items()
+    }
+
+
+def staging_root(car_model, device_id, config, shard_index=None):
+    root = config.SCHEDULER_SETTINGS["staging_dir"] / car_model / device_id
+    return root if shard_index is None else root / f"shard_{shard_index:03d}"
+
+
+def clear_staging(car_model, device_id, config):
+    shutil.rmtree(staging_root(car_model, device_id, config), ignore_errors=True)
+
+
+def build_tasks(devices, config, num_processes, allow_shards=True):
+    """
+    (차종, 단말기, 파일, 옵션) 목록을 워커 작업 목록으로 바꿉니다.
+    큰 단말기는 샤드 작업 여러 개로 나누고(allow_shards), 전체를 원본 용량이 큰 순서로 정렬합니다.
+    샤드 작업의 옵션에는 options["shard"] = {index, count, from_time, until_time, staging_root}가 들어갑니다.
+    반환값: (작업 목록, {(차종, 단말기): 샤드 수})
+    """
+    settings = config.SCHEDULER_SETTINGS
+    tasks = []
+    shard_counts = {}
+    for car_model, device_id, device_files, options in devices:
+        shards = plan_shards(device_files, settings, num_processes) if allow_shards else None
+        if shards is None:
+            tasks.append((car_model, device_id, device_files, dict(options, task_bytes=device_bytes(device_files))))
+            continue
+
+        clear_staging(car_model, device_id, config)
+        shard_counts[(car_model, device_id)] = len(shards)
+        logging.info(f"[{device_id}] 원본 용량이 커서 {len(shards)}개 샤드로 나누어 처리합니다: "
+                     + ", ".join(f"{lo}~{hi}" for lo, hi in shards))
+        for index, (from_month, to_month) in enumerate(shards):
+            files = shard_files(device_files, from_month, to_month)
+            shard = {
+                "index": index,
+                "count": len(shards),
+                # 첫 샤드/마지막 샤드는 구간 밖(앞/뒤)의 데이터까지 모두 맡습니다.
+                "from_time": pd.Timestamp(f"{from_month}-01") if index > 0 else None,
+                "until_time": (pd.Period(to_month, freq='M') + 1).start_time if index < len(shards) - 1 else None,
+                "staging_root": staging_root(car_model, device_id, config, index),
+            }
+            task_bytes = sum(r["size"] for r in files["bms"] if r["month"] is not None and from_month <= r["month"] <= to_month)
+            tasks.append((car_model, device_id, files, dict(options, shard=shard, task_bytes=task_bytes)))
+
+    # 가장 큰 작업부터 배분해야 마지막에 큰 단말기 하나만 남아 나머지 코어가 노는 일이 줄어듭니다.
+    tasks.sort(key=lambda task: task[3]["task_bytes"], reverse=True)
+    return tasks, shard_counts
+
+
+def log_worker_startup(results, pool_started, new_pool):
+    """
+    워커 기동 시간을 기록합니다. 새로 만든 풀이면 풀 생성부터 각 워커의 초기화(모듈 import, 설정 읽기) 완료까지,
+    재사용한 풀이면 재사용 사실만 기록합니다.
+    """
+    if not new_pool:
+        logging.info("워커 풀 재사용: 워커 기동 시간 없음")
+        return
+    by_pid = {r["pid"]: r for r in results if r.get("worker_ready") is not None}
+    if not by_pid:
+        return
+    ready = [r["worker_ready"] - pool_started for r in by_pid.values()]
+    init = [r["worker_init_s"] for r in by_pid.values()]
+    logging.info(f"워커 기동: {len(by_pid)}개 준비까지 최대 {max(ready):.2f}초 "
+                 f"(워커 초기화 평균 {sum(init) / len(init):.2f}초, 최대 {max(init):.2f}초)")
+
+
+def log_worker_utilization(results, wall_seconds, num_processes):
+    """워커(프로세스)별 처리 작업 수, 작업 시간, 가동률(작업 시간 / 전체 경과 시간)을 기록합니다."""
+    if not results or wall_seconds <= 0:
+        return
+    by_pid = {}
+    for r in results:
+        busy = by_pid.setdefault(r["pid"], {"tasks": 0, "busy": 0.0})
+        busy["tasks"] += 1
+        busy["busy"] += r["finished"] - r["started"]
+
+    logging.info(f"워커 가동률 (전체 경과 {wall_seconds:.1f}초):")
+    for pid, busy in sorted(by_pid.items(), key=lambda item: -item[1]["busy"]):
+        logging.info(f"  - PID {pid}: 작업 {busy['tasks']}건, 작업 시간 {busy['busy']:.1f}초, 가동률 {busy['busy'] / wall_seconds * 100:.1f}%")
+    total_busy = sum(busy["busy"] for busy in by_pid.values())
+    logging.info(f"  전체 가동률 ({num_processes}개 프로세스 기준): {total_busy / (wall_seconds * num_processes) * 100:.1f}%")
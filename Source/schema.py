@@ -0,0 +1,90 @@
+import logging
+import pandas as pd
+
+# 스키마가 바뀌면 올려서 이전 파싱 캐시를 무효화합니다.
+SCHEMA_VERSION = 1
+
+# --- 원본 열 선언 (Raw Column Schema) ---
+# 선언된 열만 읽으며(usecols), 지정된 dtype으로 바로 파싱합니다.
+# 'int8' 열은 float32로 읽은 뒤 결측치가 없을 때만 int8로 줄입니다.
+BMS_SCHEMA = {
+    'time': 'str',
+    'emobility_spd': 'float32',
+    'pack_volt': 'float32',
+    'pack_current': 'float32',
+    'chrg_cable_conn': 'int8',
+    'ext_temp': 'float32',
+    'int_temp': 'float32',
+    'soc': 'float32',
+    'soh': 'float32',
+    'altitude': 'float32',
+    'lat': 'float64',   # 위경도는 float32로 줄이면 약 1m 오차가 생기므로 유지
+    'lng': 'float64',
+}
+
+GPS_SCHEMA = {
+    'time': 'str',
+    'altitude': 'float32',
+    'lat': 'float64',
+    'lng': 'float64',
+}
+
+# 파일별로 앞부분 샘플을 보고 한 번만 결정하는 시간 형식 후보 (앞에서부터 우선)
+BMS_TIME_FORMATS = ['%y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S']
+GPS_TIME_FORMATS = ['%Y-%m-%d %H:%M:%S', '%y-%m-%d %H:%M:%S']
+
+_TIME_SAMPLE_SIZE = 50
+
+
+def read_dtypes(schema, downcast=True):
+    """pd.read_csv에 넘길 dtype 매핑. downcast=False면 숫자 열을 float64로 읽습니다."""
+    dtypes = {}
+    for col, dtype in schema.items():
+        if dtype == 'int8':
+            dtype = 'float32'
+        if not downcast and dtype == 'float32':
+            dtype = 'float64'
+        dtypes[col] = dtype
+    return dtypes
+
+
+def finalize_dtypes(df, schema, downcast=True):
+    """
+    읽은 데이터프레임을 스키마 dtype으로 맞춥니다.
+    숫자 열에 문자열이 섞여 object로 읽힌 경우 숫자로 강제 변환(coerce)합니다.
+    """
+    target = read_dtypes(schema, downcast)
+    for col in df.columns:
+        if col not in schema or col == 'time':
+            continue
+        if df[col].dtype != target[col]:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype(target[col])
+        if downcast and schema[col] == 'int8' and df[col].notna().all():
+            df[col] = df[col].astype('int8')
+    return df
+
+
+def detect_time_format(time_col, formats):
+    """앞부분 샘플로 시간 형식을 결정합니다. 맞는 형식이 없으면 None을 반환합니다."""
+    sample = time_col.dropna().head(_TIME_SAMPLE_SIZE)
+    if sample.empty:
+        return None
+    for fmt in formats:
+        try:
+            pd.to_datetime(sample, format=fmt, errors='raise')
+            return fmt
+        except (ValueError, TypeError):
+            continue
+    return None
+
+
+def parse_time(time_col, formats, label):
+    """
+    샘플로 결정한 형식으로 전체 열을 한 번만 변환합니다.
+    형식에 맞지 않는 값은 NaT가 되며, 샘플에서 형식을 찾지 못한 경우에만 형식 추론으로 변환합니다.
+    """
+    fmt = detect_time_format(time_col, formats)
+    if fmt is None:
+        logging.warning(f"[{label}] 정의된 시간 형식으로 변환 실패. 'coerce' 옵션으로 마지막 시도.")
+        return pd.to_datetime(time_col, errors='coerce')
+    return pd.to_datetime(time_col, format=fmt, errors='coerce')
@@ -0,0 +1,187 @@
+import logging
+
+import numpy as np
+import pandas as pd
+
+# 실제 원본과 같은 열 이름. 파이프라인이 읽지 않는 열도 함께 써서 usecols/스키마 처리 비용까지 재현합니다.
+BMS_COLUMNS = [
+    'time', 'emobility_spd', 'pack_volt', 'pack_current', 'chrg_cable_conn',
+    'ext_temp', 'int_temp', 'soc', 'soh', 'cell_volt_max', 'cell_volt_min', 'mod_temp_max',
+]
+# 단말기마다 번갈아 사용하는 BMS 시간 형식 (원본에 두 형식이 섞여 있음). GPS는 4자리 연도만 사용합니다.
+BMS_TIME_FORMATS = ['%y-%m-%d %H:%M:%S', '%Y-%m-%d %H:%M:%S']
+
+_BATTERY_KWH = 64.0
+_VEHICLE_MASS = 1900.0
+
+
+def make_fleet(n_devices, car_models=("NiroEV", "Ioniq5", "EV6")):
+    """차종별로 고르게 나눈 가상 단말기 목록 {차종: [단말기 ID, ...]}."""
+    fleet = {car: [] for car in car_models}
+    for i in range(n_devices):
+        car = car_models[i % len(car_models)]
+        fleet[car].append(f"SYN{car.upper()}{i:04d}")
+    return {car: ids for car, ids in fleet.items() if ids}
+
+
+def month_range(start_month, n_months):
+    start = pd.Period(start_month, freq='M')
+    return [str(start + i) for i in range(n_months)]
+
+
+def _format_times(times, fmt):
+    """datetime64 배열을 fmt('%Y-...' 또는 '%y-...') 문자열로 바꿉니다. strftime 대신 고정 폭 바이트 배열을 자릅니다."""
+    raw = np.datetime_as_string(times.astype('datetime64[s]'), unit='s').astype('S19')
+    chars = raw.view('S1').reshape(-1, 19).copy()
+    chars[:, 10] = b' '
+    if fmt.startswith('%y'):
+        chars = chars[:, 2:]
+    chars = np.ascontiguousarray(chars)
+    return chars.view(f'S{chars.shape[1]}').ravel().astype(str)
+
+
+def _drive_speed(n, rng):
+    """출발/도착 가감속, 신호 정차가 있는 주행 속도 프로파일 (km/h)."""
+    target = np.repeat(rng.uniform(20, 100, size=n // 120 + 1), 120)[:n]
+    noise = np.cumsum(rng.normal(0, 0.8, n))
+    kernel = np.ones(60) / 60
+    speed = np.convolve(target + noise - np.linspace(0, noise[-1], n), kernel, mode='same')
+    # 신호 정차
+    for stop_at in rng.integers(0, n, size=max(1, n // 900)):
+        speed[stop_at:stop_at + rng.integers(20, 90)] = 0
+    ramp = np.clip(np.minimum(np.arange(n), np.arange(n)[::-1]) / 30, 0, 1)
+    return np.clip(speed * ramp, 0, 130)
+
+
+def _segments_for_day(day_start, rng, charge_probability):
+    """하루의 주행/충전 구간 목록 [(시작 시각, 길이(초), 충전 여부), ...]."""
+    segments = []
+    t = day_start + pd.Timedelta(hours=float(rng.uniform(6, 9)))
+    for _ in range(rng.integers(1, 4)):
+        if t >= day_start + pd.Timedelta(hours=21):
+            break
+        duration = int(rng.uniform(10, 70) * 60)
+        segments.append((t, duration, False))
+        t += pd.Timedelta(seconds=duration) + pd.Timedelta(hours=float(rng.uniform(0.5, 5)))
+    if rng.random() < charge_probability:
+        segments.append((day_start + pd.Timedelta(hours=23), int(rng.uniform(1, 3) * 3600), True))
+    return segments
+
+
+def _segment_frame(start, duration, charging, hz, rng, ext_temp):
+    step = 1.0 / hz
+    n = max(2, int(duration * hz))
+    times = start.to_datetime64() + (np.arange(n) * step * 1e9).astype('timedelta64[ns]')
+    if charging:
+        speed = np.zeros(n)
+        current = -rng.uniform(40, 120) + rng.normal(0, 2, n)
+    else:
+        speed = _drive_speed(n, rng)
+        v = speed / 3.6
+        accel = np.gradient(v, step)
+        power = (_VEHICLE_MASS * accel * v + 0.35 * v**3 + 0.011 * _VEHICLE_MASS * 9.81 * v) / 0.9 + 600
+        current = power / 370 + rng.normal(0, 3, n)
+
+    keep = np.ones(n, dtype=bool)
+    if not charging:
+        # 통신 끊김: 대부분 짧은 결측(같은 Trip), 가끔 10분 이상 끊겨 Trip이 나뉨
+        if rng.random() < 0.2:
+            gap_start = rng.integers(0, n)
+            keep[gap_start:gap_start + int(rng.uniform(60, 400) * hz)] = False
+        if rng.random() < 0.05:
+            gap_start = rng.integers(0, n)
+            keep[gap_start:gap_start + int(rng.uniform(620, 900) * hz)] = False
+
+    return pd.DataFrame({
+        'time': times[keep],
+        'emobility_spd': speed[keep].round(1),
+        'pack_current': current[keep].round(1),
+        'chrg_cable_conn': np.full(keep.sum(), int(charging)),
+        'ext_temp': np.full(keep.sum(), round(ext_temp + rng.normal(0, 2), 1)),
+    })
+
+
+def generate_device_month(device_id, month, hz, rng, with_altitude, time_format):
+    """
+    단말기 하루 1~3회 주행과 야간 충전으로 구성된 한 달치 BMS 데이터를 만듭니다.
+    반환값: (BMS 데이터프레임, GPS 데이터프레임 또는 None)
+    """
+    period = pd.Period(month, freq='M')
+    # 월평균 외기온도 (1월 -2도, 7월 26도 전후)
+    ext_temp = 12 - 14 * np.cos((period.month - 1) / 12 * 2 * np.pi)
+    frames = []
+    for day in range(period.days_in_month):
+        day_start = period.start_time + pd.Timedelta(days=day)
+        for start, duration, charging in _segments_for_day(day_start, rng, charge_probability=0.3):
+            frames.append(_segment_frame(start, duration, charging, hz, rng, ext_temp))
+    bms = pd.concat(frames, ignore_index=True).sort_values('time', kind='stable').reset_index(drop=True)
+    n = len(bms)
+
+    # SOC는 소모/충전 에너지를 누적하여 계산 (10~100% 범위)
+    step_hours = np.diff(bms['time'].to_numpy(), prepend=bms['time'].to_numpy()[0]).astype('timedelta64[ms]').astype(np.float64) / 3.6e6
+    step_hours = np.minimum(step_hours, 1.0 / hz / 3600)
+    energy_kwh = bms['pack_current'].to_numpy() * 370 * step_hours / 1000
+    soc = np.clip(rng.uniform(60, 95) - np.cumsum(energy_kwh) / _BATTERY_KWH * 100, 10, 100)
+
+    bms['pack_volt'] = (330 + 0.7 * soc + rng.normal(0, 0.5, n)).round(1)
+    bms['soc'] = soc.round(1)
+    bms['soh'] = round(float(rng.uniform(92, 100)), 1)
+    bms['int_temp'] = (22 + rng.normal(0, 1, n)).round(1)
+    bms['cell_volt_max'] = (bms['pack_volt'] / 96 + 0.01).round(3)
+    bms['cell_volt_min'] = (bms['pack_volt'] / 96 - 0.01).round(3)
+    bms['mod_temp_max'] = (bms['ext_temp'] + 8).round(1)
+
+    gps = None
+    if with_altitude:
+        # 지형 고도 (완만한 언덕). BMS 파일에는 일부 시각에만 기록되고 나머지는 GPS 파일에서 채워집니다.
+        seconds = (bms['time'] - period.start_time).dt.total_seconds().to_numpy()
+        altitude = 80 + 60 * np.sin(seconds / 5000) + 20 * np.sin(seconds / 700)
+        bms['altitude'] = np.where(rng.random(n) < 0.3, altitude.round(1), np.nan)
+        gps_rows = rng.random(n) < 0.8
+        gps = pd.DataFrame({
+            'time': _format_times(bms['time'].to_numpy()[gps_rows], '%Y-%m-%d %H:%M:%S'),
+            'altitude': altitude[gps_rows].round(1),
+            'lat': (37.5 + seconds[gps_rows] / 1e7).round(6),
+            'lng': (127.0 + seconds[gps_rows] / 1e7).round(6),
+        })
+
+    bms['time'] = _format_times(bms['time'].to_numpy(), time_format)
+    columns = BMS_COLUMNS + (['altitude'] if with_altitude else [])
+    return bms[columns], gps
+
+
+def generate_dataset(config, fleet, months, hz=1.0, altitude_share=0.5, seed=0):
+    """
+    설정의 원본 경로(PATHS["raw_bms_data"], PATHS["raw_gps_data"])에 원본과 같은 폴더 구조로 가상 데이터를 만듭니다.
+        <raw_bms_data>/<단말기>/bms_[altitude_]<단말기>_<YYYY-MM>.csv
+        <raw_gps_data>/<단말기>/<YYYY-MM>/gps_<단말기>_<YYYY-MM>.csv
+    altitude_share: altitude 파일 이름 규칙(+ GPS 파일)을 사용하는 단말기 비율
+    반환값: {"files", "bytes", "rows"}
+    """
+    bms_root = config.PATHS["raw_bms_data"]
+    gps_root = config.PATHS["raw_gps_data"]
+    rng = np.random.default_rng(seed)
+    summary = {"files": 0, "bytes": 0, "rows": 0}
+
+    device_ids = [device_id for ids in fleet.values() for device_id in ids]
+    for index, device_id in enumerate(device_ids):
+        with_altitude = index < round(len(device_ids) * altitude_share)
+        time_format = BMS_TIME_FORMATS[index % len(BMS_TIME_FORMATS)]
+        for month in months:
+            bms, gps = generate_device_month(device_id, month, hz, rng, with_altitude, time_format)
+            bms_path = bms_root / device_id / f"bms_{'altitude_' if with_altitude else ''}{device_id}_{month}.csv"
+            bms_path.parent.mkdir(parents=True, exist_ok=True)
+            bms.to_csv(bms_path, index=False)
+            summary["files"] += 1
+            summary["bytes"] += bms_path.stat().st_size
+            summary["rows"] += len(bms)
+            if gps is not None:
+                gps_path = gps_root / device_id / month / f"gps_{device_id}_{month}.csv"
+                gps_path.parent.mkdir(parents=True, exist_ok=True)
+                gps.to_csv(gps_path, index=False)
+                summary["files"] += 1
+                summary["bytes"] += gps_path.stat().st_size
+
+    logging.info(f"✅ 가상 데이터 생성: 단말기 {len(device_ids)}대 x {len(months)}개월, "
+                 f"파일 {summary['files']}개, {summary['bytes'] / 1024**2:.1f}MB, BMS {summary['rows']:,}행")
+    return summary
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows에는 resource 모듈이 없어 최대 메모리(peak RSS)를 기록하지 않습니다.
+    resource = None
+
+# 단계 이름 (리포트에 표시되는 순서)
+STAGES = ["discovery", "csv_read", "preprocess", "gps_merge", "physics", "segmentation", "rollup", "write", "io_wait"]
+
+# 워커 프로세스에서 현재 처리 중인 단말기의 기록기. 단말기 작업 밖에서는 None이며 stage()는 아무것도 기록하지 않습니다.
+_current = None
+
+
+class _StageCounter:
+    """stage() 블록 안에서 행 수/바이트 수를 채우는 카운터."""
+
+    __slots__ = ("rows_in", "rows_out", "bytes")
+
+    def __init__(self, rows_in=0):
+        self.rows_in = rows_in
+        self.rows_out = 0
+        self.bytes = 0
+
+
+class DeviceTelemetry:
+    """
+    단말기(또는 샤드) 작업 하나의 단계별 소요 시간, 입출력 행 수, 읽은/쓴 바이트 수를 모읍니다.
+    단계가 중첩되면(예: GPS 병합 안의 CSV 읽기) 바깥 단계에는 안쪽 단계를 뺀 시간만 더합니다.
+    미리 읽기/백그라운드 저장 스레드의 단계는 스레드별로 중첩을 따지며, 처리 스레드와 겹친 시간도 그대로 더합니다.
+    """
+
+    def __init__(self, car_model, device_id, shard=None):
+        self.car_model = car_model
+        self.device_id = device_id
+        self.shard = shard
+        self.started = time.time()
+        self.stages = {}
+        self._local = threading.local()  # 스레드별 [(단계 이름, 시작 시각, 안쪽 단계 소요 시간)]
+        self._lock = threading.Lock()
+
+    def _stack(self):
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def enter(self, name):
+        self._stack().append([name, time.perf_counter(), 0.0])
+
+    def exit(self, counter):
+        stack = self._stack()
+        name, started, inner = stack.pop()
+        elapsed = time.perf_counter() - started
+        if stack:
+            stack[-1][2] += elapsed
+        with self._lock:
+            totals = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0, "rows_in": 0, "rows_out": 0, "bytes": 0})
+            totals["seconds"] += elapsed - inner
+            totals["calls"] += 1
+            totals["rows_in"] += counter.rows_in
+            totals["rows_out"] += counter.rows_out
+            totals["bytes"] += counter.bytes
+
+    def to_record(self):
+        return {
+            "car_model": self.car_model,
+            "device_id": self.device_id,
+            "shard": self.shard,
+            "pid": os.getpid(),
+            "elapsed_s": round(time.time() - self.started, 3),
+            "peak_rss_mb": peak_rss_mb(),
+            "stages": {name: dict(totals, seconds=round(totals["seconds"], 4)) for name, totals in self.stages.items()},
+        }
+
+
+def peak_rss_mb():
+    """현재 프로세스의 최대 메모리 사용량(MB). 워커가 여러 작업을 처리하면 지금까지의 최댓값입니다."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux는 KB, macOS는 바이트 단위
+    return round(peak / 1024 / (1024 if sys.platform == "darwin" else 1), 1)
+
+
+def start_device(car_model, device_id, shard=None):
+    global _current
+    _current = DeviceTelemetry(car_model, device_id, shard)
+    return _current
+
+
+def finish_device():
+    """현재 단말기의 기록을 끝내고 JSON으로 저장할 수 있는 레코드를 반환합니다."""
+    global _current
+    record = _current.to_record() if _current is not None else None
+    _current = None
+    return record
+
+
+@contextmanager
+def stage(name, rows_in=0):
+    """
+    단계 하나의 소요 시간을 잽니다. 블록 안에서 counter.rows_out / counter.bytes를 채웁니다.
+        with telemetry.stage("preprocess", rows_in=len(df)) as counter:
+            ...
+            counter.rows_out = len(result)
+    """
+    counter = _StageCounter(rows_in)
+    recorder = _current
+    if recorder is None:
+        yield counter
+        return
+    recorder.enter(name)
+    try:
+        yield counter
+    finally:
+        recorder.exit(counter)
+
+
+def open_run_log(config, node=None):
+    """이번 실행의 텔레메트리 JSON Lines 파일 경로. 비활성화되어 있으면 None. (여러 노드 실행은 파일 이름에 노드 포함)"""
+    if not config.TELEMETRY.get("enabled", True):
+        return None
+    log_dir = config.TELEMETRY["dir"]
+    log_dir.mkdir(parents=True, exist_ok=True)
+    return log_dir / f"run_{datetime.now():%Y%m%d_%H%M%S}{f'_{node}' if node else ''}.jsonl"
+
+
+def append_record(log_path, record):
+    if log_path is None or record is None:
+        return
+    with open(log_path, 'a', encoding='utf-8') as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def log_run_summary(records, top_n=5):
+    """가장 오래 걸린 단말기와 단계별 합계(시간 비중, 처리 행 수, 읽은 바이트)를 기록합니다."""
+    records = [r for r in records if r is not None]
+    if not records:
+        return
+
+    # 샤드로 나뉜 단말기는 샤드 작업 시간을 합산합니다.
+    by_device = {}
+    for r in records:
+        key = (r["car_model"], r["device_id"])
+        device = by_device.setdefault(key, {"elapsed_s": 0.0, "peak_rss_mb": None, "stages": {}})
+        device["elapsed_s"] += r["elapsed_s"]
+        if r["peak_rss_mb"] is not None:
+            device["peak_rss_mb"] = max(device["peak_rss_mb"] or 0, r["peak_rss_mb"])
+        for name, totals in r["stages"].items():
+            device["stages"][name] = device["stages"].get(name, 0.0) + totals["seconds"]
+
+    logging.info(f"가장 오래 걸린 단말기 (상위 {top_n}개):")
+    for (car_model, device_id), device in sorted(by_device.items(), key=lambda item: -item[1]["elapsed_s"])[:top_n]:
+        slowest_stage = max(device["stages"].items(), key=lambda item: item[1], default=("-", 0.0))
+        rss = f", 최대 메모리 {device['peak_rss_mb']:.0f}MB" if device["peak_rss_mb"] is not None else ""
+        logging.info(f"  - {car_model} {device_id}: {device['elapsed_s']:.1f}초 "
+                     f"(가장 긴 단계: {slowest_stage[0]} {slowest_stage[1]:.1f}초{rss})")
+
+    stage_totals = {}
+    for r in records:
+        for name, totals in r["stages"].items():
+            merged = stage_totals.setdefault(name, {"seconds": 0.0, "rows_in": 0, "rows_out": 0, "bytes": 0})
+            for key in merged:
+                merged[key] += totals[key]
+    total_seconds = sum(t["seconds"] for t in stage_totals.values()) or 1.0
+
+    logging.info("단계별 합계:")
+    for name in sorted(stage_totals, key=lambda n: STAGES.index(n) if n in STAGES else len(STAGES)):
+        t = stage_totals[name]
+        throughput = f", {t['bytes'] / 1024**2 / t['seconds']:.1f}MB/s" if t["bytes"] and t["seconds"] > 0 else ""
+        logging.info(f"  - {name}: {t['seconds']:.1f}초 ({t['seconds'] / total_seconds * 100:.1f}%), "
+                     f"행 {t['rows_in']:,} → {t['rows_out']:,}, {t['bytes'] / 1024**2:.1f}MB{throughput}")
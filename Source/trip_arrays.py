@@ -0,0 +1,218 @@
+"""
+차종별 전체 Trip을 학습용 메모리 맵 배열 저장소로 묶습니다.
+
+    python -m Source.trip_arrays --car NiroEV --car EV6
+
+<TRIP_ARRAYS["dir"]>/<차종>/
+    <채널>.npy     채널별 1차원 배열 (모든 Trip을 Trip 카탈로그 순서로 이어 붙임, TRIP_ARRAYS["dtype"])
+    time.npy       샘플 시각 (datetime64[ns])
+    offsets.npy    Trip i의 샘플은 [offsets[i], offsets[i + 1]) 구간 (int64, 길이 Trip 수 + 1)
+    index.json     채널 목록, dtype, Trip별 trip_id/단말기/번호
+
+읽을 때는 TripArrays(또는 open_car_arrays)로 열며, Trip 하나나 윈도 하나는 복사 없는 배열 뷰로 반환됩니다.
+"""
+import argparse
+import contextlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from Source import config, trip_catalog
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 백엔드로 저장된 Trip을 읽을 때만 필요합니다.
+    pq = None
+
+ARRAYS_VERSION = 1
+
+
+def _read_trip_file(task):
+    """Trip 파일 하나(CSV: Trip 1개, Parquet 파트: Trip 여러 개)를 {trip_id: {채널: 배열}}로 읽습니다. 읽지 못하면 None."""
+    path, backend, trip_id, channels, dtype = task
+    try:
+        if backend == "parquet":
+            names = set(pq.read_schema(path).names)
+            df = pq.read_table(path, columns=['trip_id', 'time'] + [c for c in channels if c in names]).to_pandas()
+            groups = {key: group for key, group in df.groupby('trip_id', sort=False, observed=True)}
+        else:
+            wanted = set(channels) | {'time'}
+            groups = {trip_id: pd.read_csv(path, usecols=lambda col: col in wanted, encoding='utf-8-sig')}
+    except (OSError, ValueError) as e:
+        logging.warning(f"Trip 파일을 읽을 수 없어 배열 저장소에서 제외합니다: {path}. 오류: {e}")
+        return None
+    trips = {}
+    for key, df in groups.items():
+        arrays = {"time": pd.to_datetime(df['time']).to_numpy(dtype='datetime64[ns]')}
+        for channel in channels:
+            # 고도가 없는 Trip처럼 열이 없는 채널은 NaN으로 채웁니다.
+            arrays[channel] = df[channel].to_numpy(dtype=dtype) if channel in df.columns else np.full(len(df), np.nan, dtype=dtype)
+        trips[key] = arrays
+    return trips
+
+
+def export_car_arrays(config, car_model, processes=None, pool=None):
+    """
+    Trip 카탈로그에 기록된 차종의 Trip을 모두 읽어 배열 저장소를 새로 만듭니다.
+    카탈로그의 Trip별 행 수로 전체 크기를 먼저 정해 메모리 맵을 할당하고, 읽은 Trip을 제자리에 바로 씁니다.
+    pool: Trip 파일을 읽을 때 재사용할 프로세스 풀 (메인 메뉴의 워커 풀). 없으면 processes개로 새로 만들고 끝나면 닫습니다.
+    반환값: 저장소 폴더 경로 (Trip이 없으면 None)
+    """
+    settings = config.TRIP_ARRAYS
+    catalog_df = trip_catalog.load_catalog(config, [car_model])
+    if catalog_df is None or catalog_df.empty:
+        logging.warning(f"[{car_model}] Trip 카탈로그에 기록된 Trip이 없습니다. 먼저 파이프라인을 실행하세요.")
+        return None
+    if (catalog_df['backend'] == "parquet").any() and pq is None:
+        logging.error("Parquet Trip 저장소를 읽으려면 pyarrow가 필요합니다. (pip install pyarrow)")
+        return None
+
+    channels, dtype = list(settings["channels"]), np.dtype(settings["dtype"])
+    offsets = np.zeros(len(catalog_df) + 1, dtype=np.int64)
+    np.cumsum(catalog_df['n_rows'].to_numpy(dtype=np.int64), out=offsets[1:])
+    position = {trip_id: i for i, trip_id in enumerate(catalog_df['trip_id'])}
+
+    car_dir = settings["dir"] / car_model
+    tmp_dir = car_dir.with_name(car_dir.name + '.tmp')
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    tmp_dir.mkdir(parents=True)
+    total_rows = int(offsets[-1])
+    arrays = {name: np.lib.format.open_memmap(tmp_dir / f"{name}.npy", mode='w+', shape=(total_rows,),
+                                               dtype='datetime64[ns]' if name == "time" else dtype)
+              for name in ["time"] + channels}
+
+    # Parquet 파트 하나에는 여러 Trip이 들어 있으므로 파일 단위로 한 번씩만 읽습니다.
+    files = catalog_df.drop_duplicates('path')
+    tasks = [(row.path, row.backend, row.trip_id, channels, dtype) for row in files.itertuples(index=False)]
+    filled = np.zeros(len(catalog_df), dtype=bool)
+    with Pool(processes=processes or os.cpu_count()) if pool is None else contextlib.nullcontext(pool) as pool:
+        for trips in pool.imap(_read_trip_file, tasks, chunksize=16):
+            for trip_id, trip_arrays in (trips or {}).items():
+                i = position.get(trip_id)
+                if i is None:
+                    continue
+                lo, hi = offsets[i], offsets[i + 1]
+                if len(trip_arrays["time"]) != hi - lo:
+                    raise ValueError(f"Trip 파일의 행 수가 카탈로그와 다릅니다: {trip_id} "
+                                     f"({len(trip_arrays['time'])}행, 카탈로그 {hi - lo}행). 파이프라인을 다시 실행하세요.")
+                for name, values in trip_arrays.items():
+                    arrays[name][lo:hi] = values
+                filled[i] = True
+    if not filled.all():
+        raise ValueError(f"[{car_model}] 읽지 못한 Trip이 {int((~filled).sum())}개 있어 배열 저장소를 만들지 않습니다.")
+    for array in arrays.values():
+        array.flush()
+    del arrays  # Windows에서는 열린 메모리 맵이 있으면 폴더 이름을 바꿀 수 없습니다.
+
+    np.save(tmp_dir / "offsets.npy", offsets)
+    index = {
+        "version": ARRAYS_VERSION,
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "car_model": car_model,
+        "channels": channels,
+        "dtype": dtype.name,
+        "trips": catalog_df[['trip_id', 'device_id', 'trip_no', 'start_time', 'has_altitude']].to_dict(orient='list'),
+    }
+    (tmp_dir / "index.json").write_text(json.dumps(index, ensure_ascii=False, default=str), encoding='utf-8')
+    shutil.rmtree(car_dir, ignore_errors=True)
+    os.replace(tmp_dir, car_dir)
+    logging.info(f"✅ [{car_model}] Trip 배열 저장소 생성: Trip {len(catalog_df)}개, {total_rows:,}행 → {car_dir}")
+    return car_dir
+
+
+def export_arrays(config, car_models, processes=None, pool=None):
+    """선택한 차종의 배열 저장소를 만듭니다. pool은 export_car_arrays와 같습니다. 반환값: {차종: 저장소 폴더 경로}"""
+    exported = {}
+    for car_model in car_models:
+        car_dir = export_car_arrays(config, car_model, processes, pool)
+        if car_dir is not None:
+            exported[car_model] = car_dir
+    return exported
+
+
+class TripArrays:
+    """
+    export_car_arrays()로 만든 저장소를 읽기 전용 메모리 맵으로 엽니다.
+        arrays = TripArrays(path)
+        trip = arrays.trip(0)                       # {채널: 배열 뷰}
+        starts = arrays.window_starts(600, stride=60)
+        batch = arrays.windows(starts[:256], 600)   # {채널: (256, 600) 배열}
+    """
+
+    def __init__(self, car_dir):
+        index = json.loads((car_dir / "index.json").read_text(encoding='utf-8'))
+        if index.get("version") != ARRAYS_VERSION:
+            raise ValueError(f"배열 저장소 버전이 다릅니다: {car_dir}. 다시 만드세요.")
+        self.car_model = index["car_model"]
+        self.channels = index["channels"]
+        self.trips = pd.DataFrame(index["trips"])
+        self.offsets = np.load(car_dir / "offsets.npy")
+        self._arrays = {name: np.load(car_dir / f"{name}.npy", mmap_mode='r') for name in ["time"] + self.channels}
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _select(self, channels):
+        return self._arrays if channels is None else {name: self._arrays[name] for name in channels}
+
+    def trip(self, i, channels=None):
+        """Trip i의 채널별 배열 뷰 (복사 없음)."""
+        lo, hi = self.offsets[i], self.offsets[i + 1]
+        return {name: array[lo:hi] for name, array in self._select(channels).items()}
+
+    def window_starts(self, length, stride=1):
+        """Trip 경계를 넘지 않는 길이 length 윈도의 시작 위치(전체 배열 기준)."""
+        lengths = np.diff(self.offsets)
+        counts = np.where(lengths >= length, (lengths - length) // stride + 1, 0)
+        trip_of_window = np.repeat(np.arange(len(counts)), counts)
+        first_of_trip = np.cumsum(counts) - counts
+        step = np.arange(len(trip_of_window)) - first_of_trip[trip_of_window]
+        return self.offsets[trip_of_window] + step * stride
+
+    def windows(self, starts, length, channels=None):
+        """
+        윈도 묶음 {채널: (len(starts), length) 배열}. 윈도 하나(starts가 정수)는 복사 없는 뷰로,
+        여러 윈도는 메모리 맵에서 필요한 구간만 한 번에 모아 반환합니다.
+        """
+        if np.isscalar(starts):
+            return {name: array[starts:starts + length] for name, array in self._select(channels).items()}
+        return {name: np.lib.stride_tricks.sliding_window_view(array, length)[starts]
+                for name, array in self._select(channels).items()}
+
+    def sample_windows(self, batch_size, length, rng=None, channels=None, stride=1):
+        """Trip 경계를 넘지 않는 윈도를 무작위로 batch_size개 뽑습니다."""
+        rng = rng or np.random.default_rng()
+        starts = self.window_starts(length, stride)
+        return self.windows(np.sort(rng.choice(starts, size=batch_size)), length, channels)
+
+
+def open_car_arrays(config, car_model):
+    return TripArrays(config.TRIP_ARRAYS["dir"] / car_model)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="차종별 Trip을 학습용 메모리 맵 배열 저장소로 묶습니다.")
+    parser.add_argument("--car", action="append", dest="cars", default=None,
+                        help="묶을 차종 (여러 번 지정 가능, 기본: 카탈로그의 모든 차종)")
+    parser.add_argument("--processes", type=int, default=None, help="Trip 파일을 읽을 프로세스 수 (기본: CPU 코어 수)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    car_models = args.cars
+    if car_models is None:
+        catalog_df = trip_catalog.load_catalog(config)
+        car_models = sorted(catalog_df['car_model'].unique()) if catalog_df is not None else []
+    return export_arrays(config, car_models, args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+import logging
+import sqlite3
+
+import pandas as pd
+
+# Trip 카탈로그: 워커가 Trip을 저장할 때 계산한 지표를 한 곳(SQLite)에 모아 둡니다.
+# 리포트와 이후 분석은 Trip 폴더를 탐색하지 않고 이 카탈로그만 조회합니다.
+CATALOG_COLUMNS = [
+    "trip_id", "car_model", "device_id", "year_month", "trip_no", "path", "backend",
+    "start_time", "end_time", "n_rows", "duration_s", "distance_m", "energy_kwh",
+    "soc_start", "soc_end", "soc_delta", "mean_ext_temp", "altitude_coverage", "has_altitude",
+]
+
+_CREATE_TABLE = """
+CREATE TABLE IF NOT EXISTS trips (
+    trip_id TEXT PRIMARY KEY,
+    car_model TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    year_month TEXT NOT NULL,
+    trip_no INTEGER NOT NULL,
+    path TEXT,
+    backend TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    n_rows INTEGER,
+    duration_s REAL,
+    distance_m REAL,
+    energy_kwh REAL,
+    soc_start REAL,
+    soc_end REAL,
+    soc_delta REAL,
+    mean_ext_temp REAL,
+    altitude_coverage REAL,
+    has_altitude INTEGER
+)
+"""
+_CREATE_INDEX = "CREATE INDEX IF NOT EXISTS idx_trips_device ON trips (car_model, device_id, trip_no)"
+# 단말기별로 이번 카탈로그에서 다시 기록한 Trip 번호의 시작점. 노드 카탈로그를 합칠 때 교체 범위로 사용합니다.
+_CREATE_DEVICE_RUNS = """
+CREATE TABLE IF NOT EXISTS device_runs (
+    car_model TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    first_trip_no INTEGER NOT NULL,
+    PRIMARY KEY (car_model, device_id)
+)
+"""
+# Trip별 일자 x 외기온도 구간 합산 지표 (trip_parser._segment_rollups). Trip과 같은 범위로 교체됩니다.
+ROLLUP_COLUMNS = [
+    "trip_id", "car_model", "device_id", "trip_no", "day", "temp_band",
+    "samples", "distance_m", "drive_s", "idle_s", "energy_data_kwh", "energy_phys_kwh",
+]
+_CREATE_ROLLUPS = """
+CREATE TABLE IF NOT EXISTS trip_rollups (
+    trip_id TEXT NOT NULL,
+    car_model TEXT NOT NULL,
+    device_id TEXT NOT NULL,
+    trip_no INTEGER NOT NULL,
+    day TEXT NOT NULL,
+    temp_band REAL,
+    samples INTEGER,
+    distance_m REAL,
+    drive_s REAL,
+    idle_s REAL,
+    energy_data_kwh REAL,
+    energy_phys_kwh REAL
+)
+"""
+_CREATE_ROLLUPS_INDEX = "CREATE INDEX IF NOT EXISTS idx_rollups_device ON trip_rollups (car_model, device_id, trip_no)"
+# load_rollups에서 묶을 수 있는 열 (month는 day의 연월)
+ROLLUP_KEYS = ("car_model", "device_id", "day", "month", "temp_band")
+
+# 여러 워커가 동시에 기록하므로 잠금이 풀릴 때까지 기다리는 시간(초)
+_LOCK_TIMEOUT = 60
+
+
+def _connect(config):
+    catalog_path = config.PATHS["trip_catalog"]
+    catalog_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(catalog_path, timeout=_LOCK_TIMEOUT)
+    conn.execute(_CREATE_TABLE)
+    conn.execute(_CREATE_INDEX)
+    conn.execute(_CREATE_DEVICE_RUNS)
+    conn.execute(_CREATE_ROLLUPS)
+    conn.execute(_CREATE_ROLLUPS_INDEX)
+    return conn
+
+
+def _to_row(trip, backend):
+    row = {**trip, "backend": backend,
+           "start_time": trip["start"].isoformat(), "end_time": trip["end"].isoformat()}
+    row["has_altitude"] = int(bool(row["has_altitude"]))
+    return tuple(row[col] for col in CATALOG_COLUMNS)
+
+
+def _rollup_rows(trip):
+    return [
+        tuple({**trip, **rollup}[col] for col in ROLLUP_COLUMNS)
+        for rollup in trip.get("rollups", [])
+    ]
+
+
+def _delete_device_range(conn, car_model, device_id, first_trip_no):
+    for table in ("trips", "trip_rollups"):
+        conn.execute(
+            f"DELETE FROM {table} WHERE car_model = ? AND device_id = ? AND trip_no >= ?",
+            (car_model, device_id, first_trip_no),
+        )
+
+
+def replace_device_trips(car_model, device_id, first_trip_no, trips, config):
+    """
+    단말기의 Trip 번호 first_trip_no 이후 기록을 이번 실행 결과(trips)로 교체합니다.
+    증분 실행에서 유지된 이전 Trip(번호 < first_trip_no)은 그대로 둡니다.
+    """
+    backend = config.TRIP_OUTPUT.get("backend", "csv")
+    placeholders = ", ".join("?" * len(CATALOG_COLUMNS))
+    with _connect(config) as conn:
+        _delete_device_range(conn, car_model, device_id, first_trip_no)
+        conn.executemany(
+            f"INSERT OR REPLACE INTO trips ({', '.join(CATALOG_COLUMNS)}) VALUES ({placeholders})",
+            [_to_row(trip, backend) for trip in trips],
+        )
+        conn.executemany(
+            f"INSERT INTO trip_rollups ({', '.join(ROLLUP_COLUMNS)}) VALUES ({', '.join('?' * len(ROLLUP_COLUMNS))})",
+            [row for trip in trips for row in _rollup_rows(trip)],
+        )
+        conn.execute(
+            "INSERT INTO device_runs (car_model, device_id, first_trip_no) VALUES (?, ?, ?) "
+            "ON CONFLICT (car_model, device_id) DO UPDATE SET first_trip_no = MIN(first_trip_no, excluded.first_trip_no)",
+            (car_model, device_id, first_trip_no),
+        )
+    conn.close()
+
+
+def node_catalog_path(config, node):
+    """여러 노드가 나누어 실행할 때 노드별로 기록하는 카탈로그 경로 (공유 드라이브의 SQLite 동시 쓰기를 피함)."""
+    catalog_path = config.PATHS["trip_catalog"]
+    return catalog_path.with_name(f"{catalog_path.stem}.{node}{catalog_path.suffix}")
+
+
+def merge_node_catalogs(config):
+    """
+    노드별 카탈로그를 기본 카탈로그로 합치고, 합친 노드 카탈로그는 삭제합니다.
+    단말기마다 노드에서 다시 기록한 범위(device_runs.first_trip_no 이후)만 교체하므로 증분 실행 결과도 그대로 합쳐집니다.
+    반환값: 합친 노드 카탈로그 수
+    """
+    catalog_path = config.PATHS["trip_catalog"]
+    node_paths = sorted(catalog_path.parent.glob(f"{catalog_path.stem}.*{catalog_path.suffix}"))
+    if not node_paths:
+        return 0
+    columns = ', '.join(CATALOG_COLUMNS)
+    conn = _connect(config)
+    try:
+        for node_path in node_paths:
+            conn.execute("ATTACH DATABASE ? AS node", (str(node_path),))
+            try:
+                with conn:
+                    device_runs = conn.execute("SELECT car_model, device_id, first_trip_no FROM node.device_runs").fetchall()
+                    for car_model, device_id, first_trip_no in device_runs:
+                        _delete_device_range(conn, car_model, device_id, first_trip_no)
+                    conn.execute(f"INSERT OR REPLACE INTO trips ({columns}) SELECT {columns} FROM node.trips")
+                    rollup_columns = ', '.join(ROLLUP_COLUMNS)
+                    conn.execute(f"INSERT INTO trip_rollups ({rollup_columns}) SELECT {rollup_columns} FROM node.trip_rollups")
+            finally:
+                conn.execute("DETACH DATABASE node")
+            node_path.unlink()
+            logging.info(f"✅ 노드 카탈로그 병합: {node_path.name} (단말기 {len(device_runs)}개)")
+    finally:
+        conn.close()
+    return len(node_paths)
+
+
+def load_catalog(config, car_models=None):
+    """카탈로그 전체(또는 선택한 차종)를 데이터프레임으로 읽습니다. 카탈로그가 없으면 None."""
+    catalog_path = config.PATHS["trip_catalog"]
+    if not catalog_path.exists():
+        return None
+    query = "SELECT * FROM trips"
+    params = []
+    if car_models is not None:
+        query += f" WHERE car_model IN ({', '.join('?' * len(car_models))})"
+        params = list(car_models)
+    conn = sqlite3.connect(catalog_path, timeout=_LOCK_TIMEOUT)
+    try:
+        df = pd.read_sql_query(query + " ORDER BY car_model, device_id, trip_no", conn, params=params)
+    except (sqlite3.DatabaseError, pd.errors.DatabaseError) as e:
+        logging.warning(f"Trip 카탈로그를 읽을 수 없습니다: {catalog_path}. 오류: {e}")
+        return None
+    finally:
+        conn.close()
+    df["has_altitude"] = df["has_altitude"].astype(bool)
+    df["start_time"] = pd.to_datetime(df["start_time"])
+    df["end_time"] = pd.to_datetime(df["end_time"])
+    return df
+
+
+def load_rollups(config, group_by=("car_model", "device_id", "day"), car_models=None):
+    """
+    trip_rollups를 group_by 열 단위로 합산하여 데이터프레임으로 반환합니다. 카탈로그가 없으면 None.
+    group_by: ROLLUP_KEYS 중에서 선택 (예: ("car_model", "month") 차종별 월별, ("car_model", "temp_band") 외기온도 구간별)
+    합산 열: samples, distance_m, drive_s, idle_s, energy_data_kwh, energy_phys_kwh, trips(Trip 수), devices(단말기 수)
+    """
+    unknown = [key for key in group_by if key not in ROLLUP_KEYS]
+    if unknown:
+        raise ValueError(f"지원하지 않는 집계 기준입니다: {unknown} (가능: {ROLLUP_KEYS})")
+    catalog_path = config.PATHS["trip_catalog"]
+    if not catalog_path.exists():
+        return None
+
+    keys = ', '.join(group_by)
+    query = (
+        f"SELECT {keys}, SUM(samples) AS samples, SUM(distance_m) AS distance_m, SUM(drive_s) AS drive_s, "
+        "SUM(idle_s) AS idle_s, SUM(energy_data_kwh) AS energy_data_kwh, SUM(energy_phys_kwh) AS energy_phys_kwh, "
+        "COUNT(DISTINCT trip_id) AS trips, COUNT(DISTINCT device_id) AS devices "
+        "FROM (SELECT *, substr(day, 1, 7) AS month FROM trip_rollups"
+    )
+    params = []
+    if car_models is not None:
+        query += f" WHERE car_model IN ({', '.join('?' * len(car_models))})"
+        params = list(car_models)
+    query += f") GROUP BY {keys} ORDER BY {keys}"
+
+    conn = _connect(config)
+    try:
+        return pd.read_sql_query(query, conn, params=params)
+    except (sqlite3.DatabaseError, pd.errors.DatabaseError) as e:
+        logging.warning(f"Trip 카탈로그의 합산 지표를 읽을 수 없습니다: {catalog_path}. 오류: {e}")
+        return None
+    finally:
+        conn.close()
@@ -1,122 +1,362 @@
 import pandas as pd
 import numpy as np
-import logging
-import os
+from Source import trip_store, telemetry
 
-def _check_trip_conditions(trip_df, config):
+# Trip 분할 기준: 샘플 간격이 이 시간(초)을 넘으면 새 Trip
+TRIP_GAP_SECONDS = 600
+# 이 속도(m/s) 미만이면 정지 상태로 보고 연속 정지 시간을 셉니다.
+IDLE_SPEED = 0.1
+
+def _segment_time_diff(time_ns, starts):
+    """구간 내 time_diff(초). 각 구간의 첫 행은 0입니다."""
+    time_diff = np.diff(time_ns, prepend=time_ns[0]) / 1e9
+    time_diff[starts] = 0.0
+    return time_diff
+
+
+def _evaluate_segments(df, trip_boundaries, config):
     """
-    Trip이 유효한지 검증하는 함수.
-    config 파일의 TRIP_THRESHOLDS를 사용하여 조건을 확인합니다.
+    모든 후보 구간의 검증 조건을 한 번에 계산합니다. (구간별 reduceat/bincount 집계)
+    config 파일의 TRIP_THRESHOLDS를 사용하며, 구간마다 복사본을 만들거나 Python 루프를 돌지 않습니다.
+    반환값: 구간별 지표 데이터프레임 (start_idx, end_idx, duration_s, distance_m, energy_kwh, max_idle_s, valid)
     """
     thresholds = config.TRIP_THRESHOLDS
-    
-    # 'chrg_cable_conn' 열이 존재하고, 그 값이 1(충전 중)인 데이터가 하나라도 있으면 유효하지 않은 Trip으로 판단
-    if 'chrg_cable_conn' in trip_df.columns and (trip_df['chrg_cable_conn'] == 1).any():
-        return False
+    bounds = np.asarray(trip_boundaries, dtype=np.int64)
+    starts, ends = bounds[:-1], bounds[1:]
+    n_rows = len(df)
+    seg_id = np.repeat(np.arange(len(starts)), ends - starts)
+    is_seg_start = np.zeros(n_rows, dtype=bool)
+    is_seg_start[starts] = True
 
-    # 1. 최소 운행 시간 검증
-    duration_seconds = (trip_df['time'].iloc[-1] - trip_df['time'].iloc[0]).total_seconds()
-    if duration_seconds < thresholds["min_duration_seconds"]:
-        return False
+    time_ns = df['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    time_diff = _segment_time_diff(time_ns, starts)
 
-    # 2. 최소 주행 거리 검증
-    time_diff = trip_df['time'].diff().dt.total_seconds().fillna(0)
-    distance_meters = (trip_df['speed'] * time_diff).sum()
-    if distance_meters < thresholds["min_distance_meters"]:
-        return False
-        
-    # 3. 최소 소모 에너지 검증
-    total_energy_kwh = (trip_df['Power_data'] * time_diff).sum() / 3600 / 1000
-    if total_energy_kwh < thresholds["min_energy_kwh"]:
-        return False
-        
-    # 4. 최대 허용 가속도 검증
-    if (trip_df['acceleration'].abs() > thresholds["max_abs_acceleration"]).any():
-        return False
-        
-    # 5. 최대 연속 정지 시간 검증
-    is_stopped = trip_df['speed'] < 0.1
-    stopped_time = 0
-    # iloc을 사용하여 time_diff에 안전하게 접근
-    time_diff_vals = time_diff.to_numpy()
-    for i, stopped in enumerate(is_stopped):
-        if stopped:
-            stopped_time += time_diff_vals[i]
-            if stopped_time >= thresholds["max_idle_duration_seconds"]:
-                return False
-        else:
-            stopped_time = 0
+    speed = df['speed'].to_numpy(dtype=np.float64)
+    power = df['Power_data'].to_numpy(dtype=np.float64)
+
+    # 1. 운행 시간 / 2. 주행 거리 / 3. 소모 에너지 (결측치는 0으로 합산 - pandas sum과 동일)
+    duration = (time_ns[ends - 1] - time_ns[starts]) / 1e9
+    distance = np.add.reduceat(np.nan_to_num(speed * time_diff), starts)
+    energy_kwh = np.add.reduceat(np.nan_to_num(power * time_diff), starts) / 3600 / 1000
+
+    # 4. 허용 가속도 초과 여부
+    acc_exceeded = np.abs(df['acceleration'].to_numpy(dtype=np.float64)) > thresholds["max_abs_acceleration"]
+    any_acc_exceeded = np.maximum.reduceat(acc_exceeded.astype(np.int8), starts).astype(bool)
+
+    # 충전 중인 데이터 포함 여부
+    if 'chrg_cable_conn' in df.columns:
+        charging = df['chrg_cable_conn'].to_numpy(dtype=np.float64) == 1
+        any_charging = np.maximum.reduceat(charging.astype(np.int8), starts).astype(bool)
+    else:
+        any_charging = np.zeros(len(starts), dtype=bool)
 
-    return True
+    # 5. 가장 긴 연속 정지 시간: 정지 구간(run)별 time_diff 합계의 구간 내 최댓값
+    is_stopped = speed < IDLE_SPEED
+    prev_stopped = np.concatenate(([False], is_stopped[:-1]))
+    run_start = is_stopped & (is_seg_start | ~prev_stopped)
+    run_id = np.cumsum(run_start) - 1
+    run_totals = np.bincount(run_id[is_stopped], weights=time_diff[is_stopped], minlength=int(run_start.sum()))
+    max_idle = np.zeros(len(starts))
+    np.maximum.at(max_idle, seg_id[run_start], run_totals)
 
+    valid = (
+        ~any_charging
+        & (duration >= thresholds["min_duration_seconds"])
+        & (distance >= thresholds["min_distance_meters"])
+        & (energy_kwh >= thresholds["min_energy_kwh"])
+        & ~any_acc_exceeded
+        & (max_idle < thresholds["max_idle_duration_seconds"])
+    )
+    return pd.DataFrame({
+        "start_idx": starts, "end_idx": ends,
+        "duration_s": duration, "distance_m": distance, "energy_kwh": energy_kwh,
+        "max_idle_s": max_idle, "valid": valid,
+    })
 
-def parse_and_save_trips(df, car_model, device_id, config):
+
+def _segment_rollups(df, segments, config):
     """
-    전체 데이터프레임을 받아 Trip으로 분할하고,
-    유효한 Trip을 차종별 폴더에 지정된 파일명으로 저장합니다.
+    유효 구간(Trip)별로 일자 x 외기온도 구간 단위의 합산 지표를 계산합니다. (Trip 카탈로그의 trip_rollups)
+    모든 값이 더할 수 있는 양이므로 단말기/차종/일자/월/온도 구간 단위로 그대로 합쳐 집계합니다.
+    반환값: {구간 위치: [{"day", "temp_band", "samples", "distance_m", "drive_s", "idle_s",
+                          "energy_data_kwh", "energy_phys_kwh"}, ...]}
+        temp_band는 외기온도 구간의 하한(°C, ROLLUPS["temp_band_width"] 단위)이며 온도가 없으면 None
     """
-    if df.empty:
-        return
+    starts = segments["start_idx"].to_numpy()
+    ends = segments["end_idx"].to_numpy()
+    seg_id = np.repeat(np.arange(len(starts)), ends - starts)
+    keep = segments["valid"].to_numpy()[seg_id]
+    if not keep.any():
+        return {}
+
+    time_ns = df['time'].to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    time_diff = _segment_time_diff(time_ns, starts)
+    speed = df['speed'].to_numpy(dtype=np.float64)
+    is_stopped = speed < IDLE_SPEED
+    width = config.ROLLUPS.get("temp_band_width", 5)
+    if 'ext_temp' in df.columns:
+        temp_band = np.floor(df['ext_temp'].to_numpy(dtype=np.float64) / width) * width
+    else:
+        temp_band = np.full(len(df), np.nan)
 
+    frame = pd.DataFrame({
+        "seg": seg_id, "day": time_ns.astype('datetime64[ns]').astype('datetime64[D]'), "temp_band": temp_band,
+        "samples": 1,
+        "distance_m": np.nan_to_num(speed * time_diff),
+        "drive_s": np.where(is_stopped, 0.0, time_diff),
+        "idle_s": np.where(is_stopped, time_diff, 0.0),
+        "energy_data_kwh": np.nan_to_num(df['Power_data'].to_numpy(dtype=np.float64) * time_diff) / 3600 / 1000,
+    })
+    if 'Power_phys' in df.columns:
+        frame["energy_phys_kwh"] = np.nan_to_num(df['Power_phys'].to_numpy(dtype=np.float64) * time_diff) / 3600 / 1000
+    sums = frame[keep].groupby(["seg", "day", "temp_band"], dropna=False).sum().reset_index()
+    sums["day"] = sums["day"].dt.strftime('%Y-%m-%d')
+    sums["temp_band"] = sums["temp_band"].astype(object).where(sums["temp_band"].notna(), None)
+    if "energy_phys_kwh" not in sums.columns:
+        sums["energy_phys_kwh"] = None
+
+    rollups = {}
+    for seg, rows in sums.groupby("seg"):
+        rollups[seg] = rows.drop(columns="seg").to_dict('records')
+    return rollups
+
+
+def _first_last_mean(values):
+    """결측치를 제외한 첫 값, 마지막 값, 평균. 값이 없으면 None."""
+    values = values[~np.isnan(values)]
+    if len(values) == 0:
+        return None, None, None
+    return float(values[0]), float(values[-1]), float(values.mean())
+
+
+def _trip_metrics(trip_df, segment):
+    """Trip 카탈로그용 지표. 검증 단계의 구간 지표(segment)에 SOC/온도/고도 정보를 더합니다."""
+    n_rows = len(trip_df)
+    soc_start, soc_end, _ = _first_last_mean(trip_df['soc'].to_numpy(dtype=np.float64)) if 'soc' in trip_df.columns else (None, None, None)
+    _, _, mean_ext_temp = _first_last_mean(trip_df['ext_temp'].to_numpy(dtype=np.float64)) if 'ext_temp' in trip_df.columns else (None, None, None)
+    altitude_coverage = float(trip_df['altitude'].notna().sum() / n_rows) if 'altitude' in trip_df.columns else 0.0
+    return {
+        "n_rows": n_rows,
+        "duration_s": float(segment.duration_s),
+        "distance_m": float(segment.distance_m),
+        "energy_kwh": float(segment.energy_kwh),
+        "soc_start": soc_start,
+        "soc_end": soc_end,
+        "soc_delta": soc_end - soc_start if soc_start is not None else None,
+        "mean_ext_temp": mean_ext_temp,
+        "altitude_coverage": altitude_coverage,
+        "has_altitude": altitude_coverage > 0,
+    }
+
+
+def _check_trip_conditions(trip_df, config):
+    """
+    Trip이 유효한지 검증하는 함수.
+    config 파일의 TRIP_THRESHOLDS를 사용하여 조건을 확인합니다.
+    """
+    if trip_df.empty:
+        return False
+    return bool(_evaluate_segments(trip_df, [0, len(trip_df)], config)["valid"].iloc[0])
+
+
+def _find_trip_boundaries(df):
+    """Trip 분할 지점(구간 시작 위치) 목록을 반환합니다. 마지막 원소는 len(df)입니다."""
     # 1. 시간 간격이 600초(10분) 이상 벌어질 때
-    time_gaps = df['time'].diff().dt.total_seconds() > 600
+    time_gaps = df['time'].diff().dt.total_seconds() > TRIP_GAP_SECONDS
     
     # 2. 충전 케이블 상태가 변경될 때 (0->1 또는 1->0)
     charge_status_changes = df['chrg_cable_conn'].diff().ne(0)
     
-    # 두 조건을 만족하는 모든 지점의 인덱스를 찾음
-    cut_indices = df.index[time_gaps | charge_status_changes].tolist()
-    trip_boundaries = sorted(list(set([0] + cut_indices + [len(df)])))
+    # 두 조건을 만족하는 모든 지점의 위치를 찾음
+    cut_positions = np.flatnonzero((time_gaps | charge_status_changes).to_numpy())
+    return np.unique(np.concatenate(([0], cut_positions, [len(df)]))).tolist()
+
+
+def split_open_tail(df):
+    """
+    데이터프레임을 (닫힌 구간들, 마지막 구간)으로 나눕니다.
+    마지막 구간은 다음 데이터에서 이어질 수 있으므로 스트리밍 처리 시 다음 청크로 넘깁니다.
+    """
+    if df.empty:
+        return df, df
+    last_start = _find_trip_boundaries(df)[-2]
+    return df.iloc[:last_start], df.iloc[last_start:].reset_index(drop=True)
+
+
+def parse_and_save_trips(df, car_model, device_id, config, trip_counter_start=1, next_cut_after_end=None, writer=None):
+    """
+    전체 데이터프레임을 받아 Trip으로 분할하고,
+    유효한 Trip을 설정된 저장소(차종별 CSV 폴더 또는 Parquet 데이터셋)에 저장합니다.
+    trip_counter_start: 첫 번째로 저장되는 Trip의 번호 (증분 실행 시 이전 실행의 번호를 이어감)
+    next_cut_after_end: df 바로 다음에 시작하는 구간의 시각 (스트리밍 처리에서 넘겨받은 구간이 있을 때)
+    writer: trip_store의 Trip 저장기. 없으면 새로 만들고 끝나면 닫습니다.
+    반환값: 저장된 Trip 정보 목록
+        [{"trip_id", "trip_no", "start", "end", "next_cut", "path", 지표(_trip_metrics)...}, ...]
+        next_cut은 Trip 다음 구간이 시작되는 시각이며, 데이터 끝에서 끝난 Trip은 None입니다.
+    """
+    saved_trips = []
+    if df.empty:
+        return saved_trips
+
+    owns_writer = writer is None
+    if owns_writer:
+        writer = trip_store.open_trip_writer(car_model, device_id, config, trip_counter_start)
+
+    with telemetry.stage("segmentation", rows_in=len(df)) as counter:
+        trip_boundaries = _find_trip_boundaries(df)
+
+        # 모든 구간을 한 번에 검증하고, 통과한 구간만 잘라서 저장합니다.
+        segments = _evaluate_segments(df, trip_boundaries, config)
+        valid_segments = segments[segments["valid"]]
+        counter.rows_out = int((valid_segments["end_idx"] - valid_segments["start_idx"]).sum())
+
+    rollups = None
+    if config.ROLLUPS.get("enabled", True):
+        # Trip 데이터가 메모리에 있을 때 일자/온도 구간별 합산 지표를 함께 계산합니다.
+        with telemetry.stage("rollup", rows_in=counter.rows_out) as rollup_counter:
+            rollups = _segment_rollups(df, segments, config)
+            rollup_counter.rows_out = sum(len(rows) for rows in rollups.values())
+
+    trip_counter = trip_counter_start
+    for seg, segment in zip(valid_segments.index, valid_segments.itertuples(index=False)):
+        start_idx, end_idx = segment.start_idx, segment.end_idx
+        current_trip = df.iloc[start_idx:end_idx]
+
+        year_month = current_trip['time'].iloc[0].strftime('%Y-%m')
+        trip_record = {
+            "trip_id": trip_store.make_trip_id(device_id, year_month, trip_counter),
+            "car_model": car_model,
+            "device_id": device_id,
+            "year_month": year_month,
+            "trip_no": trip_counter,
+            "start": current_trip['time'].iloc[0],
+            "end": current_trip['time'].iloc[-1],
+            "next_cut": df['time'].iloc[end_idx] if end_idx < len(df) else next_cut_after_end,
+            "path": None,
+            # 검증 단계에서 계산한 지표는 버리지 않고 Trip 카탈로그에 기록합니다.
+            **_trip_metrics(current_trip, segment),
+        }
+        if rollups is not None:
+            trip_record["rollups"] = rollups[seg]
+        writer.write(current_trip, trip_record)
+        saved_trips.append(trip_record)
+        trip_counter += 1
+
+    if owns_writer:
+        writer.close()
+    return saved_trips
+
+
+def _split_closed_head(head, chunk):
+    """
+    샤드 첫 구간(head)에 청크를 이어 붙이고, 첫 구간이 닫혔으면 (첫 구간, 나머지)를 반환합니다.
+    아직 닫히지 않았으면 (이어 붙인 데이터, None)을 반환합니다.
+    """
+    if head is not None:
+        chunk = pd.concat([head, chunk], ignore_index=True)
+    boundaries = _find_trip_boundaries(chunk)
+    if len(boundaries) <= 2:
+        return chunk, None
+    return chunk.iloc[:boundaries[1]].reset_index(drop=True), chunk.iloc[boundaries[1]:].reset_index(drop=True)
+
 
+def _parse_stream(chunks, car_model, device_id, config, trip_counter_start, writer, hold_head, hold_tail):
+    """
+    청크 스트림을 Trip으로 분할/저장합니다.
+    hold_head/hold_tail이면 첫 구간/마지막 구간을 저장하지 않고 반환합니다. (샤드 경계 처리용)
+    반환값: (저장된 Trip 목록, 첫 구간, 첫 구간 다음 구간의 시작 시각, 마지막 구간)
+        첫 구간이 끝나지 않은 채 스트림이 끝나면 첫 구간 다음 시작 시각은 None입니다.
+    """
+    saved_trips = []
+    trip_counter = trip_counter_start
+    head, head_next_cut = None, None
+    head_closed = not hold_head
+    open_tail = None
+
+    for chunk in chunks:
+        if not head_closed:
+            head, chunk = _split_closed_head(head, chunk)
+            if chunk is None:
+                continue
+            head_closed = True
+            head_next_cut = chunk['time'].iloc[0]
+        if open_tail is not None and not open_tail.empty:
+            chunk = pd.concat([open_tail, chunk], ignore_index=True)
+        closed, open_tail = split_open_tail(chunk)
+        next_cut = open_tail['time'].iloc[0] if not open_tail.empty else None
+        saved = parse_and_save_trips(closed, car_model, device_id, config, trip_counter, next_cut, writer)
+        saved_trips.extend(saved)
+        trip_counter += len(saved)
+
+    if open_tail is not None and not hold_tail:
+        saved_trips.extend(parse_and_save_trips(open_tail, car_model, device_id, config, trip_counter, writer=writer))
+        open_tail = None
+    return saved_trips, head, head_next_cut, open_tail
+
+
+def parse_and_save_trip_stream(chunks, car_model, device_id, config, trip_counter_start=1):
+    """
+    시간 순서로 들어오는 데이터 청크를 이어 붙이며 Trip을 분할/저장합니다.
+    각 청크의 마지막 구간(청크 경계를 넘어 이어질 수 있는 Trip)만 다음 청크로 넘기므로,
+    메모리에는 한 청크와 진행 중인 Trip 하나만 유지됩니다.
+    반환값: parse_and_save_trips와 같은 형식의 저장된 Trip 정보 목록
+    """
+    # 단말기 하나에 저장기 하나: Parquet 백엔드는 여러 청크의 Trip을 모아서 한 번에 기록
+    writer = trip_store.open_trip_writer(car_model, device_id, config, trip_counter_start)
+    try:
+        saved_trips, _, _, _ = _parse_stream(chunks, car_model, device_id, config, trip_counter_start, writer, False, False)
+    except BaseException:
+        # 백그라운드 저장기는 오류가 나도 닫아서 저장 스레드를 끝냅니다. (저장 스레드의 오류로 원래 예외를 가리지 않음)
+        writer.close(raise_error=False)
+        raise
+    writer.close()
+    return saved_trips
+
+
+def parse_shard_trip_stream(chunks, car_model, device_id, config, writer, hold_head):
+    """
+    단말기 샤드(연월 구간)의 청크를 Trip으로 분할하여 샤드 임시 번호(1부터)로 저장합니다.
+    샤드 경계에 걸칠 수 있는 첫 구간(hold_head=True일 때)과 마지막 구간은 저장하지 않고 반환하며,
+    부모 프로세스가 이웃 샤드의 구간과 이어 붙여 처리합니다. (stitch_shard_trips)
+    반환값: {"trips", "head", "head_next_cut", "tail"}
+        샤드 전체가 한 구간이면 head에 전체 데이터가 담기고 head_next_cut과 tail은 None입니다.
+    """
+    saved_trips, head, head_next_cut, tail = _parse_stream(chunks, car_model, device_id, config, 1, writer, hold_head, True)
+    if tail is not None and tail.empty:
+        tail = None
+    return {"trips": saved_trips, "head": head, "head_next_cut": head_next_cut, "tail": tail}
+
+
+def stitch_shard_trips(shard_results, car_model, device_id, config, writer, on_shard_trips):
+    """
+    샤드 결과를 시간 순서로 이어 붙여 최종 Trip 번호를 매깁니다. (부모 프로세스에서 실행)
+    이전 샤드의 마지막 구간과 다음 샤드의 첫 구간을 합쳐 다시 분할/저장하고,
+    샤드가 저장한 Trip은 on_shard_trips(샤드 결과, 첫 최종 번호)로 넘겨 번호를 다시 매깁니다.
+    반환값: 최종 번호가 매겨진 전체 Trip 목록 (Trip 번호 순)
+    """
+    all_trips = []
     trip_counter = 1
-    for i in range(len(trip_boundaries) - 1):
-        start_idx = trip_boundaries[i]
-        end_idx = trip_boundaries[i+1]
-        
-        current_trip = df.iloc[start_idx:end_idx].copy().reset_index(drop=True)
-
-        if current_trip.empty:
-            continue
-            
-        # Trip의 첫 번째 데이터 포인트의 충전 상태를 확인
-        if current_trip['chrg_cable_conn'].iloc[0] == 1:
-            continue
-        
-        if _check_trip_conditions(current_trip, config):
-            year_month = current_trip['time'].iloc[0].strftime('%Y-%m')
-            
-            output_folder_for_car = config.PATHS["output_trip"] / car_model
-            output_folder_for_car.mkdir(parents=True, exist_ok=True)
-
-            columns_to_save = [
-                'time', 'speed', 'acceleration', 
-                'ext_temp', 'int_temp',
-                'soc', 'soh', 
-                'pack_volt', 'pack_current', 
-                'Power_data', 'Power_phys'
-            ]
-
-            file_prefix = "Trip_"
-
-            if 'altitude' in current_trip.columns and current_trip['altitude'].notna().any():
-                file_prefix = "Trip_altitude_"
-                columns_to_save = [
-                'time', 'speed', 'acceleration', 
-                'ext_temp', 'int_temp',
-                'soc', 'soh', 'altitude',
-                'pack_volt', 'pack_current', 
-                'Power_data', 'Power_phys'
-                ]
-                
-            file_name = f"{file_prefix}{device_id}_{year_month}_trip_{trip_counter}.csv"
-
-            output_path = output_folder_for_car / file_name
-            
-            final_columns = [col for col in columns_to_save if col in current_trip.columns]
-            
-            current_trip_to_save = current_trip[final_columns]
-            current_trip_to_save.to_csv(output_path, index=False, encoding='utf-8-sig')
-
-            logging.info(f"✅ Trip 저장 성공: {output_path}")
-            
-            trip_counter += 1
\ No newline at end of file
+    carry = None
+
+    def _flush_carry(next_cut):
+        nonlocal trip_counter
+        if carry is None or carry.empty:
+            return
+        saved = parse_and_save_trips(carry, car_model, device_id, config, trip_counter, next_cut, writer)
+        all_trips.extend(saved)
+        trip_counter += len(saved)
+
+    for result in shard_results:
+        if result["head"] is None and result["tail"] is None and not result["trips"]:
+            continue  # 데이터가 없는 샤드
+        if result["head"] is not None:
+            carry = result["head"] if carry is None else pd.concat([carry, result["head"]], ignore_index=True)
+            if result["head_next_cut"] is None:
+                continue  # 샤드 전체가 한 구간: 다음 샤드로 계속 이어짐
+        _flush_carry(result["head_next_cut"])
+        all_trips.extend(on_shard_trips(result, trip_counter))
+        trip_counter += len(result["trips"])
+        carry = result["tail"]
+
+    _flush_carry(None)
+    return sorted(all_trips, key=lambda t: t["trip_no"])
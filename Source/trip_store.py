@@ -0,0 +1,367 @@
+import logging
+import os
+import queue
+import re
+import threading
+
+import pandas as pd
+
+from Source import io_overlap, telemetry
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 백엔드를 사용할 때만 필요합니다.
+    pa = None
+    pc = None
+    pq = None
+
+# Trip 파일에 저장하는 열 (기존 CSV 형식과 동일한 순서)
+TRIP_COLUMNS = [
+    'time', 'speed', 'acceleration',
+    'ext_temp', 'int_temp',
+    'soc', 'soh',
+    'pack_volt', 'pack_current',
+    'Power_data', 'Power_phys'
+]
+TRIP_COLUMNS_WITH_ALTITUDE = [
+    'time', 'speed', 'acceleration',
+    'ext_temp', 'int_temp',
+    'soc', 'soh', 'altitude',
+    'pack_volt', 'pack_current',
+    'Power_data', 'Power_phys'
+]
+
+_PART_PATTERN = re.compile(r'part-(\d+)-(\d+)\.parquet$')
+# legacy_file_name() 규칙의 Trip CSV (그룹 1: 단말기, 그룹 2: 임시 파일 확장자)
+_TRIP_FILE_PATTERN = re.compile(r'^Trip_(?:altitude_)?(.+)_\d{4}-\d{2}_trip_\d+\.csv(\.tmp)?$')
+
+
+def make_trip_id(device_id, year_month, trip_no):
+    """저장 방식과 관계없이 Trip을 식별하는 ID (카탈로그/Parquet 공통)."""
+    return f"{device_id}_{year_month}_trip_{trip_no}"
+
+
+def _parquet_device_dir(store_root, car_model, device_id):
+    return store_root / f"car_model={car_model}" / f"device_id={device_id}"
+
+
+def _write_parquet_atomic(table, part_path, compression):
+    part_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = part_path.with_name(part_path.name + '.tmp')
+    pq.write_table(table, tmp_path, compression=compression)
+    os.replace(tmp_path, part_path)
+
+
+def legacy_file_name(device_id, year_month, trip_no, with_altitude):
+    """기존 Trip CSV 파일명 규칙: Trip_[altitude_]{단말기}_{연월}_trip_{번호}.csv"""
+    file_prefix = "Trip_altitude_" if with_altitude else "Trip_"
+    return f"{file_prefix}{device_id}_{year_month}_trip_{trip_no}.csv"
+
+
+class CsvTripWriter:
+    """Trip 하나를 CSV 파일 하나로 저장하는 기존 방식."""
+
+    def __init__(self, car_model, device_id, config, root=None):
+        self.device_id = device_id
+        self.output_folder = (root or config.PATHS["output_trip"]) / car_model
+        self.output_folder.mkdir(parents=True, exist_ok=True)
+
+    def write(self, trip_df, trip_record):
+        """Trip을 저장하고 trip_record["path"]에 저장 위치를 기록합니다."""
+        with_altitude = trip_record["has_altitude"]
+        output_path = self.output_folder / legacy_file_name(
+            self.device_id, trip_record["year_month"], trip_record["trip_no"], with_altitude
+        )
+
+        columns_to_save = TRIP_COLUMNS_WITH_ALTITUDE if with_altitude else TRIP_COLUMNS
+        final_columns = [col for col in columns_to_save if col in trip_df.columns]
+        with telemetry.stage("write", rows_in=len(trip_df)) as counter:
+            # 임시 파일에 쓴 뒤 이름을 바꿔, 중단되더라도 일부만 기록된 Trip_*.csv가 남지 않게 합니다.
+            tmp_path = output_path.with_name(output_path.name + '.tmp')
+            trip_df[final_columns].to_csv(tmp_path, index=False, encoding='utf-8-sig')
+            os.replace(tmp_path, output_path)
+            counter.rows_out = len(trip_df)
+            counter.bytes = os.path.getsize(output_path)
+
+        logging.info(f"✅ Trip 저장 성공: {output_path}")
+        trip_record["path"] = str(output_path)
+
+    def close(self, raise_error=True):
+        pass
+
+
+class ParquetTripWriter:
+    """
+    Trip을 차종/단말기/연월로 파티션된 Parquet 데이터셋에 저장합니다.
+        <output_trip_parquet>/car_model=<차종>/device_id=<단말기>/month=<YYYY-MM>/part-<첫번호>-<끝번호>.parquet
+    Trip을 메모리에 모았다가 batch_rows 단위로 한 번에 기록하여 작은 파일이 대량으로 생기지 않게 합니다.
+    """
+
+    def __init__(self, car_model, device_id, config, first_trip_no=1, root=None):
+        if pq is None:
+            raise ImportError("Parquet Trip 저장소를 사용하려면 pyarrow가 필요합니다. (pip install pyarrow)")
+        self.device_id = device_id
+        self.device_dir = _parquet_device_dir(root or config.PATHS["output_trip_parquet"], car_model, device_id)
+        self.compression = config.TRIP_OUTPUT.get("compression", "zstd")
+        self.batch_rows = config.TRIP_OUTPUT.get("batch_rows", 500_000)
+        self._buffer = []          # [(연월, trip_no, 데이터프레임, trip_record)]
+        self._buffered_rows = 0
+        # 이번 실행에서 다시 만들 Trip(번호 >= first_trip_no)은 이전 결과에서 먼저 제거합니다.
+        self._purge_from(first_trip_no)
+
+    def _purge_from(self, first_trip_no):
+        if not self.device_dir.exists():
+            return
+        for month_dir in self.device_dir.iterdir():
+            for part_path in month_dir.glob('part-*.parquet'):
+                match = _PART_PATTERN.search(part_path.name)
+                if match is None:
+                    continue
+                lo, hi = int(match.group(1)), int(match.group(2))
+                if lo >= first_trip_no:
+                    part_path.unlink()
+                elif hi >= first_trip_no:
+                    # 유지할 Trip과 다시 만들 Trip이 섞인 파일은 유지할 Trip만 남겨 같은 이름으로 다시 기록
+                    table = pq.read_table(part_path)
+                    mask = pc.less(table['trip_no'], first_trip_no)
+                    self._write_table(table.filter(mask), part_path)
+
+    def _write_table(self, table, part_path):
+        _write_parquet_atomic(table, part_path, self.compression)
+
+    def write(self, trip_df, trip_record):
+        """Trip을 버퍼에 추가합니다. trip_record["path"]는 실제로 기록될 때 채워집니다."""
+        trip_no = trip_record["trip_no"]
+        trip = trip_df[[col for col in TRIP_COLUMNS_WITH_ALTITUDE if col in trip_df.columns]].reset_index(drop=True)
+        trip.insert(0, 'trip_no', pd.Series(trip_no, index=trip.index, dtype='int32'))
+        trip.insert(0, 'trip_id', trip_record["trip_id"])
+        trip['has_altitude'] = trip_record["has_altitude"]
+        self._buffer.append((trip_record["year_month"], trip_no, trip, trip_record))
+        self._buffered_rows += len(trip)
+        if self._buffered_rows >= self.batch_rows:
+            self.flush()
+
+    def flush(self):
+        """버퍼의 Trip을 연월 파티션별로 하나의 파일에 기록합니다."""
+        by_month = {}
+        for year_month, trip_no, trip, trip_record in self._buffer:
+            by_month.setdefault(year_month, []).append((trip_no, trip, trip_record))
+
+        for year_month, trips in by_month.items():
+            trip_nos = [trip_no for trip_no, _, _ in trips]
+            part_path = self.device_dir / f"month={year_month}" / f"part-{min(trip_nos):06d}-{max(trip_nos):06d}.parquet"
+            month_df = pd.concat([trip for _, trip, _ in trips], ignore_index=True)
+            with telemetry.stage("write", rows_in=len(month_df)) as counter:
+                self._write_table(pa.Table.from_pandas(month_df, preserve_index=False), part_path)
+                counter.rows_out = len(month_df)
+                counter.bytes = part_path.stat().st_size
+            for _, _, trip_record in trips:
+                trip_record["path"] = str(part_path)
+            logging.info(f"✅ Trip {len(trips)}개 저장 성공: {part_path}")
+
+        self._buffer = []
+        self._buffered_rows = 0
+
+    def close(self, raise_error=True):
+        """버퍼의 Trip을 기록합니다. raise_error=False(오류로 중단 중)면 기록하지 않고 버립니다."""
+        if self._buffer and raise_error:
+            self.flush()
+        self._buffer = []
+        self._buffered_rows = 0
+
+
+class BackgroundTripWriter:
+    """
+    다른 저장기(CSV/Parquet)의 write를 백그라운드 스레드 하나에서 순서대로 실행하여, 저장하는 동안 다음 구간을 계산합니다.
+    대기열이 write_queue_depth개를 넘거나 저장 대기 중인 Trip 크기가 입출력 메모리 한도를 넘으면 write가 기다립니다.
+    trip_record["path"]는 close()가 끝난 뒤에 확정됩니다. 저장 중 오류는 다음 write/close에서 다시 발생합니다.
+    """
+
+    def __init__(self, writer, depth, budget):
+        self._writer = writer
+        self._share = budget.share()
+        self._queue = queue.Queue(maxsize=depth)
+        self._error = None
+        self._thread = threading.Thread(target=self._run, name="trip-writer", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            trip_df, trip_record, nbytes = item
+            try:
+                if self._error is None:
+                    self._writer.write(trip_df, trip_record)
+            except Exception as e:
+                self._error = e
+            finally:
+                self._share.release(nbytes)
+
+    def _raise_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def write(self, trip_df, trip_record):
+        self._raise_error()
+        nbytes = int(trip_df.memory_usage(index=False).sum())
+        with telemetry.stage("io_wait"):
+            self._share.acquire(nbytes)
+            self._queue.put((trip_df, trip_record, nbytes))
+
+    def close(self, raise_error=True):
+        """
+        대기 중인 Trip을 모두 저장하고 원래 저장기를 닫습니다.
+        raise_error=False: 호출한 쪽의 예외가 이미 전파 중일 때 사용합니다. 저장 스레드의 오류를 다시 던져
+        원래 예외를 가리지 않도록, 저장 스레드만 끝내고 원래 저장기의 남은 버퍼는 버립니다.
+        """
+        with telemetry.stage("io_wait"):
+            self._queue.put(None)
+            self._thread.join()
+        if raise_error:
+            self._raise_error()
+        self._writer.close(raise_error=raise_error)
+
+
+def open_trip_writer(car_model, device_id, config, first_trip_no=1, root=None):
+    """
+    설정(TRIP_OUTPUT["backend"])에 맞는 Trip 저장기를 만듭니다.
+    root: 저장 위치를 바꿀 때 사용 (샤드의 임시 저장 폴더). 없으면 설정의 Trip 출력 경로.
+    IO_OVERLAP["write_queue_depth"]가 0보다 크면 백그라운드 스레드에서 저장합니다.
+    """
+    backend = config.TRIP_OUTPUT.get("backend", "csv")
+    if backend == "parquet":
+        writer = ParquetTripWriter(car_model, device_id, config, first_trip_no, root)
+    else:
+        writer = CsvTripWriter(car_model, device_id, config, root)
+    settings = config.IO_OVERLAP
+    if settings.get("enabled", True) and settings.get("write_queue_depth", 0) > 0:
+        return BackgroundTripWriter(writer, settings["write_queue_depth"], io_overlap.shared_budget(config))
+    return writer
+
+
+def promote_staged_trips(trips, first_trip_no, car_model, device_id, config):
+    """
+    샤드가 임시 번호(1부터)로 저장한 Trip을 최종 번호(first_trip_no부터)로 바꿔 Trip 출력 경로로 옮기고,
+    trip_record의 trip_no/trip_id/path를 갱신합니다. CSV는 파일 이름만 바꾸며, Parquet은 파일을 다시 기록합니다.
+    """
+    renumber = {trip["trip_no"]: first_trip_no + i for i, trip in enumerate(trips)}
+    if config.TRIP_OUTPUT.get("backend", "csv") == "parquet":
+        device_dir = _parquet_device_dir(config.PATHS["output_trip_parquet"], car_model, device_id)
+        by_part = {}
+        for trip in trips:
+            by_part.setdefault(trip["path"], []).append(trip)
+        for staged_path, part_trips in by_part.items():
+            # 임시 파일 하나에는 한 연월의 Trip만 들어 있습니다.
+            year_month = part_trips[0]["year_month"]
+            table = pq.read_table(staged_path)
+            trip_nos = [renumber[n] for n in table['trip_no'].to_pylist()]
+            trip_ids = [make_trip_id(device_id, year_month, n) for n in trip_nos]
+            table = table.set_column(table.schema.get_field_index('trip_no'), 'trip_no', pa.array(trip_nos, pa.int32()))
+            table = table.set_column(table.schema.get_field_index('trip_id'), 'trip_id', pa.array(trip_ids, pa.string()))
+            part_path = device_dir / f"month={year_month}" / f"part-{min(trip_nos):06d}-{max(trip_nos):06d}.parquet"
+            _write_parquet_atomic(table, part_path, config.TRIP_OUTPUT.get("compression", "zstd"))
+            os.remove(staged_path)
+            for trip in part_trips:
+                trip["path"] = str(part_path)
+    else:
+        output_folder = config.PATHS["output_trip"] / car_model
+        output_folder.mkdir(parents=True, exist_ok=True)
+        for trip in trips:
+            output_path = output_folder / legacy_file_name(
+                device_id, trip["year_month"], renumber[trip["trip_no"]], trip["has_altitude"]
+            )
+            os.replace(trip["path"], output_path)
+            trip["path"] = str(output_path)
+
+    for trip in trips:
+        trip["trip_no"] = renumber[trip["trip_no"]]
+        trip["trip_id"] = make_trip_id(device_id, trip["year_month"], trip["trip_no"])
+    return trips
+
+
+def remove_orphan_outputs(car_model, device_ids, live_paths, config):
+    """
+    중단된 실행이 남긴 단말기 출력을 정리합니다.
+        - 기록 도중 남은 임시 파일(*.tmp)
+        - 실행 상태에 기록되지 않은(=완료되지 않은 실행에서 저장된) Trip CSV 파일
+    Parquet 저장소의 완료되지 않은 Trip은 단말기를 다시 처리할 때 ParquetTripWriter가 지웁니다.
+    device_ids: 정리할 단말기 ID 집합, live_paths: 실행 상태에 기록된 Trip 경로 집합
+    반환값: 삭제한 파일 수
+    """
+    removed = 0
+    output_folder = config.PATHS["output_trip"] / car_model
+    # Parquet 백엔드에서는 Trip 폴더의 CSV가 내보내기(export_legacy_csv) 결과이므로 건드리지 않습니다.
+    if config.TRIP_OUTPUT.get("backend", "csv") == "csv" and output_folder.exists():
+        # 차종 폴더는 한 번만 나열하고 파일 이름으로 단말기를 구분합니다.
+        with os.scandir(output_folder) as entries:
+            for entry in entries:
+                match = _TRIP_FILE_PATTERN.match(entry.name)
+                if match is None or match.group(1) not in device_ids:
+                    continue
+                if match.group(2) or entry.path not in live_paths:
+                    os.remove(entry.path)
+                    removed += 1
+    for device_id in device_ids:
+        device_dir = _parquet_device_dir(config.PATHS["output_trip_parquet"], car_model, device_id)
+        for tmp_path in device_dir.glob('month=*/*.tmp'):
+            tmp_path.unlink()
+            removed += 1
+    return removed
+
+
+def _iter_part_files(config, car_models=None):
+    """Parquet Trip 저장소의 (차종, 단말기, 연월, 파일 경로)를 순회합니다."""
+    store_root = config.PATHS["output_trip_parquet"]
+    if not store_root.exists():
+        return
+    for car_dir in sorted(store_root.glob('car_model=*')):
+        car_model = car_dir.name.split('=', 1)[1]
+        if car_models is not None and car_model not in car_models:
+            continue
+        for device_dir in sorted(car_dir.glob('device_id=*')):
+            device_id = device_dir.name.split('=', 1)[1]
+            for month_dir in sorted(device_dir.glob('month=*')):
+                year_month = month_dir.name.split('=', 1)[1]
+                for part_path in sorted(month_dir.glob('part-*.parquet')):
+                    yield car_model, device_id, year_month, part_path
+
+
+def list_parquet_trips(config):
+    """Parquet 저장소의 Trip 목록을 (차종, 단말기, 연월, altitude 여부)로 반환합니다. (Trip 데이터는 읽지 않음)"""
+    trips = []
+    for car_model, device_id, year_month, part_path in _iter_part_files(config):
+        table = pq.read_table(part_path, columns=['trip_id', 'has_altitude'])
+        summary = table.group_by('trip_id').aggregate([('has_altitude', 'max')])
+        for with_altitude in summary['has_altitude_max'].to_pylist():
+            trips.append((car_model, device_id, year_month, bool(with_altitude)))
+    return trips
+
+
+def export_legacy_csv(config, car_models=None):
+    """
+    Parquet Trip 저장소를 기존 CSV 레이아웃(<output_trip>/<차종>/Trip_..._trip_N.csv)으로 다시 만듭니다.
+    파일 하나씩 읽어 변환하므로 저장소 전체를 메모리에 올리지 않습니다.
+    """
+    if pq is None:
+        logging.error("Parquet Trip 저장소를 읽으려면 pyarrow가 필요합니다. (pip install pyarrow)")
+        return 0
+
+    exported = 0
+    for car_model, device_id, year_month, part_path in _iter_part_files(config, car_models):
+        output_folder = config.PATHS["output_trip"] / car_model
+        output_folder.mkdir(parents=True, exist_ok=True)
+        part_df = pq.read_table(part_path).to_pandas()
+        for trip_no, trip in part_df.groupby('trip_no', sort=True):
+            with_altitude = bool(trip['has_altitude'].iloc[0])
+            columns_to_save = TRIP_COLUMNS_WITH_ALTITUDE if with_altitude else TRIP_COLUMNS
+            file_name = legacy_file_name(device_id, year_month, trip_no, with_altitude)
+            trip[[col for col in columns_to_save if col in trip.columns]].to_csv(
+                output_folder / file_name, index=False, encoding='utf-8-sig'
+            )
+            exported += 1
+    logging.info(f"🎉 Parquet Trip 저장소에서 {exported}개의 Trip을 CSV로 내보냈습니다: {config.PATHS['output_trip']}")
+    return exported
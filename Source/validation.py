@@ -0,0 +1,291 @@
+"""
+저장된 Trip에서 물리식 전력(Power_phys)이 측정 전력(Power_data)을 얼마나 잘 따라가는지 검증합니다.
+
+    python -m Source.validation --car NiroEV --car EV6
+
+카탈로그에 기록된 Trip 파일을 묶음(VALIDATION_SETTINGS["files_per_task"])으로 나누어 프로세스 풀에서 읽고,
+묶음마다 벡터 연산(np.add.reduceat, groupby 합계)으로 아래 값만 계산해 돌려받습니다.
+    - Trip별 지표: 측정/물리식 에너지와 에너지 오차(%), 샘플 전력 오차의 RMSE/편향(kW), 구동(+)/회생(-) 에너지
+    - 속도 x 외기온도 구간별 합계: 샘플 수, 전력 오차의 합/제곱합, 측정/물리식 에너지
+구간 합계는 더하기만 하면 합쳐지므로 Trip이 수백만 개여도 메모리는 Trip별 지표 표 크기로 제한됩니다.
+결과는 VALIDATION_SETTINGS["output_dir"]에 저장되며, 차종별 요약과 구간별 표는 Trip 리포트의 시트로도 들어갑니다.
+"""
+import argparse
+import contextlib
+import logging
+import os
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+from Source import config, trip_catalog
+
+try:
+    import pyarrow.parquet as pq
+except ImportError:  # Parquet 백엔드로 저장된 Trip을 읽거나 Trip별 지표를 Parquet으로 저장할 때만 필요합니다.
+    pq = None
+
+SAMPLE_COLUMNS = ['time', 'speed', 'ext_temp', 'Power_data', 'Power_phys']
+BIN_KEYS = ["speed_bin_kmh", "temp_band"]
+_J_PER_KWH = 3.6e6
+# 구간 합계 조각이 이 개수를 넘으면 한 번 합쳐 메모리를 줄입니다.
+_BIN_COMPACT_EVERY = 256
+
+# 결과 파일 이름 (VALIDATION_SETTINGS["output_dir"] 아래)
+TRIPS_FILE = "validation_trips"
+CARS_FILE = "validation_cars.csv"
+BINS_FILE = "validation_bins.csv"
+
+
+def _error_pct(phys, data):
+    """(물리식 - 측정) / 측정 x 100. 측정값이 0이면 NaN."""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(data != 0, (phys - data) / data * 100, np.nan)
+
+
+def _trip_metrics(df, starts, trip_ids, settings):
+    """
+    Trip이 연속으로 이어진 데이터프레임에서 Trip별 지표와 속도 x 외기온도 구간별 합계를 계산합니다.
+    starts: 각 Trip의 첫 행 위치, trip_ids: Trip별 ID
+    측정/물리식 전력이 모두 있는 샘플만 사용하며, Trip 첫 행의 시간 간격은 0으로 봅니다.
+    반환값: (Trip별 지표 데이터프레임, 구간별 합계 데이터프레임)
+    """
+    time_ns = pd.to_datetime(df['time']).to_numpy(dtype='datetime64[ns]').astype(np.int64)
+    dt = np.diff(time_ns, prepend=time_ns[0]) / 1e9
+    dt[starts] = 0.0
+
+    p_data = df['Power_data'].to_numpy(dtype=np.float64)
+    p_phys = df['Power_phys'].to_numpy(dtype=np.float64)
+    valid = np.isfinite(p_data) & np.isfinite(p_phys)
+    dt = np.where(valid, dt, 0.0)
+    p_data = np.where(valid, p_data, 0.0)
+    p_phys = np.where(valid, p_phys, 0.0)
+    err = p_phys - p_data
+
+    def per_trip(values):
+        return np.add.reduceat(values, starts)
+
+    samples = per_trip(valid.astype(np.int64))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rmse_kw = np.sqrt(per_trip(err**2) / samples) / 1000
+        bias_kw = per_trip(err) / samples / 1000
+    energy_data = per_trip(p_data * dt) / _J_PER_KWH
+    energy_phys = per_trip(p_phys * dt) / _J_PER_KWH
+    trips = pd.DataFrame({
+        "trip_id": trip_ids,
+        "samples": samples,
+        "energy_data_kwh": energy_data,
+        "energy_phys_kwh": energy_phys,
+        "energy_error_pct": _error_pct(energy_phys, energy_data),
+        "rmse_kw": rmse_kw,
+        "bias_kw": bias_kw,
+        "traction_data_kwh": per_trip(np.maximum(p_data, 0) * dt) / _J_PER_KWH,
+        "traction_phys_kwh": per_trip(np.maximum(p_phys, 0) * dt) / _J_PER_KWH,
+        "regen_data_kwh": per_trip(np.minimum(p_data, 0) * dt) / _J_PER_KWH,
+        "regen_phys_kwh": per_trip(np.minimum(p_phys, 0) * dt) / _J_PER_KWH,
+    })
+
+    speed_width = settings["speed_bin_kmh"]
+    temp_width = settings["temp_band_width"]
+    bins = pd.DataFrame({
+        "speed_bin_kmh": np.floor(df['speed'].to_numpy(dtype=np.float64) * 3.6 / speed_width) * speed_width,
+        "temp_band": np.floor(df['ext_temp'].to_numpy(dtype=np.float64) / temp_width) * temp_width,
+        "samples": valid.astype(np.int64),
+        "err_sum_w": err,
+        "err_sq_sum_w2": err**2,
+        "energy_data_j": p_data * dt,
+        "energy_phys_j": p_phys * dt,
+    })[valid].groupby(BIN_KEYS).sum()
+    return trips, bins
+
+
+def _read_trip_file(path, backend, trip_id):
+    """Trip 파일 하나를 읽어 (데이터프레임, Trip 시작 위치, Trip ID 목록)을 반환합니다. 읽지 못하면 None."""
+    try:
+        if backend == "parquet":
+            df = pq.read_table(path, columns=['trip_id'] + SAMPLE_COLUMNS).to_pandas()
+            ids = df['trip_id'].to_numpy()
+            starts = np.flatnonzero(np.concatenate(([True], ids[1:] != ids[:-1])))
+            trip_ids = ids[starts]
+        else:
+            df = pd.read_csv(path, usecols=lambda col: col in SAMPLE_COLUMNS, encoding='utf-8-sig')
+            starts = np.array([0])
+            trip_ids = np.array([trip_id])
+    except (OSError, ValueError) as e:
+        logging.warning(f"Trip 파일을 읽을 수 없어 검증에서 제외합니다: {path}. 오류: {e}")
+        return None
+    if df.empty or any(col not in df.columns for col in SAMPLE_COLUMNS):
+        return None
+    return df, starts, trip_ids
+
+
+def _validate_batch(task):
+    """Trip 파일 묶음 하나의 (차종, Trip별 지표, 구간별 합계). 읽은 Trip이 없으면 지표/합계는 None."""
+    car_model, files, settings = task
+    trip_frames, bin_frames = [], []
+    for path, backend, trip_id in files:
+        loaded = _read_trip_file(path, backend, trip_id)
+        if loaded is None:
+            continue
+        trips, bins = _trip_metrics(*loaded, settings)
+        trip_frames.append(trips)
+        bin_frames.append(bins)
+    if not trip_frames:
+        return car_model, None, None
+    return car_model, pd.concat(trip_frames, ignore_index=True), pd.concat(bin_frames).groupby(BIN_KEYS).sum()
+
+
+def _tasks(catalog_df, settings):
+    """차종별 Trip 파일을 묶음 작업으로 나눕니다. Parquet 파트 파일은 Trip 여러 개를 담고 있어 한 번만 읽습니다."""
+    batch_settings = {k: settings[k] for k in ("speed_bin_kmh", "temp_band_width")}
+    size = settings["files_per_task"]
+    tasks = []
+    for car_model, car_df in catalog_df.dropna(subset=['path']).groupby('car_model'):
+        files = car_df[['path', 'backend', 'trip_id']].copy()
+        files.loc[files['backend'] == "parquet", 'trip_id'] = None
+        files = list(files.drop_duplicates(subset=['path']).itertuples(index=False, name=None))
+        tasks += [(car_model, files[lo:lo + size], batch_settings) for lo in range(0, len(files), size)]
+    return tasks
+
+
+def _bin_table(bins):
+    """구간별 합계를 차종 x 속도 x 외기온도 구간별 편향/RMSE(kW)와 에너지 오차(%) 표로 바꿉니다."""
+    table = pd.DataFrame({
+        "samples": bins["samples"],
+        "bias_kw": bins["err_sum_w"] / bins["samples"] / 1000,
+        "rmse_kw": np.sqrt(bins["err_sq_sum_w2"] / bins["samples"]) / 1000,
+        "energy_data_kwh": bins["energy_data_j"] / _J_PER_KWH,
+        "energy_phys_kwh": bins["energy_phys_j"] / _J_PER_KWH,
+    })
+    table["energy_error_pct"] = _error_pct(table["energy_phys_kwh"].to_numpy(), table["energy_data_kwh"].to_numpy())
+    return table.reset_index()
+
+
+def _car_summary(trips, min_trip_kwh):
+    """
+    Trip별 지표를 차종별로 요약합니다. RMSE/편향은 샘플 수로 가중한 전체 샘플 기준이며,
+    Trip별 에너지 오차의 평균/절대 평균/90% 분위수는 측정 에너지가 min_trip_kwh 이상인 Trip만 사용합니다.
+    """
+    weighted = trips.assign(
+        err_sq=trips["rmse_kw"].fillna(0)**2 * trips["samples"],
+        err_sum=trips["bias_kw"].fillna(0) * trips["samples"],
+        abs_error_pct=trips["energy_error_pct"].abs(),
+    )
+    totals = weighted.groupby("car_model").agg(
+        trips=("trip_id", "size"),
+        samples=("samples", "sum"),
+        energy_data_kwh=("energy_data_kwh", "sum"),
+        energy_phys_kwh=("energy_phys_kwh", "sum"),
+        traction_data_kwh=("traction_data_kwh", "sum"),
+        traction_phys_kwh=("traction_phys_kwh", "sum"),
+        regen_data_kwh=("regen_data_kwh", "sum"),
+        regen_phys_kwh=("regen_phys_kwh", "sum"),
+        err_sq=("err_sq", "sum"),
+        err_sum=("err_sum", "sum"),
+    )
+    usable = weighted[weighted["energy_data_kwh"] >= min_trip_kwh].groupby("car_model").agg(
+        trip_error_pct_mean=("energy_error_pct", "mean"),
+        trip_error_pct_abs_mean=("abs_error_pct", "mean"),
+        trip_error_pct_abs_p90=("abs_error_pct", lambda s: s.quantile(0.9)),
+    )
+    summary = pd.DataFrame({
+        "trips": totals["trips"],
+        "energy_data_kwh": totals["energy_data_kwh"],
+        "energy_phys_kwh": totals["energy_phys_kwh"],
+        "energy_error_pct": _error_pct(totals["energy_phys_kwh"].to_numpy(), totals["energy_data_kwh"].to_numpy()),
+        "rmse_kw": np.sqrt(totals["err_sq"] / totals["samples"]),
+        "bias_kw": totals["err_sum"] / totals["samples"],
+        "traction_error_pct": _error_pct(totals["traction_phys_kwh"].to_numpy(), totals["traction_data_kwh"].to_numpy()),
+        "regen_error_pct": _error_pct(totals["regen_phys_kwh"].to_numpy(), totals["regen_data_kwh"].to_numpy()),
+    }).join(usable)
+    return summary.reset_index()
+
+
+def _save_results(trips, cars, bins, output_dir):
+    """Trip별 지표(Parquet, pyarrow가 없으면 CSV)와 차종별 요약/구간별 표(CSV)를 임시 파일에 쓴 뒤 교체합니다."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    outputs = [(cars, output_dir / CARS_FILE), (bins, output_dir / BINS_FILE)]
+    if pq is not None:
+        outputs.append((trips, output_dir / f"{TRIPS_FILE}.parquet"))
+    else:
+        outputs.append((trips, output_dir / f"{TRIPS_FILE}.csv"))
+    for df, path in outputs:
+        tmp_path = path.with_name(path.name + '.tmp')
+        if path.suffix == '.parquet':
+            df.to_parquet(tmp_path, index=False)
+        else:
+            df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+        os.replace(tmp_path, path)
+
+
+def run_validation(config, car_models, processes=None, pool=None):
+    """
+    선택한 차종의 저장된 Trip을 모두 검증하고 결과를 저장합니다.
+    결과 파일은 마지막 실행에서 검증한 차종만 담습니다.
+    pool: 재사용할 프로세스 풀 (메인 메뉴의 워커 풀). 없으면 processes개로 새로 만들고 끝나면 닫습니다.
+    반환값: 차종별 요약 데이터프레임 또는 검증할 Trip이 없으면 None
+    """
+    settings = config.VALIDATION_SETTINGS
+    catalog_df = trip_catalog.load_catalog(config, car_models)
+    if catalog_df is None or catalog_df.empty:
+        logging.warning("Trip 카탈로그에 기록된 Trip이 없습니다. 먼저 파이프라인을 실행하세요.")
+        return None
+    if (catalog_df['backend'] == "parquet").any() and pq is None:
+        logging.error("Parquet Trip 저장소를 읽으려면 pyarrow가 필요합니다. (pip install pyarrow)")
+        return None
+
+    tasks = _tasks(catalog_df, settings)
+    trip_frames, bin_frames = [], []
+    with Pool(processes=processes or os.cpu_count()) if pool is None else contextlib.nullcontext(pool) as pool:
+        for car_model, trips, bins in pool.imap_unordered(_validate_batch, tasks):
+            if trips is None:
+                continue
+            trip_frames.append(trips.assign(car_model=car_model))
+            bin_frames.append(pd.concat({car_model: bins}, names=["car_model"]))
+            if len(bin_frames) >= _BIN_COMPACT_EVERY:
+                bin_frames = [pd.concat(bin_frames).groupby(["car_model"] + BIN_KEYS).sum()]
+    if not trip_frames:
+        logging.warning("검증할 수 있는 Trip 파일이 없습니다.")
+        return None
+
+    trips = pd.concat(trip_frames, ignore_index=True)
+    trips = catalog_df[['trip_id', 'device_id', 'start_time']].merge(trips, on='trip_id')
+    trips = trips[['trip_id', 'car_model'] + [c for c in trips.columns if c not in ('trip_id', 'car_model')]]
+    bins = _bin_table(pd.concat(bin_frames).groupby(["car_model"] + BIN_KEYS).sum())
+    cars = _car_summary(trips, settings["min_trip_kwh"])
+
+    _save_results(trips, cars, bins, settings["output_dir"])
+    for row in cars.itertuples(index=False):
+        logging.info(f"✅ [{row.car_model}] Trip {row.trips:,}개: 에너지 오차 {row.energy_error_pct:+.1f}%, "
+                     f"전력 RMSE {row.rmse_kw:.2f}kW (편향 {row.bias_kw:+.2f}kW), "
+                     f"구동 {row.traction_error_pct:+.1f}% / 회생 {row.regen_error_pct:+.1f}%")
+    logging.info(f"🎉 물리식 검증 결과 저장: {settings['output_dir']}")
+    return cars
+
+
+def load_results(config):
+    """마지막 검증 실행의 (차종별 요약, 구간별 표). 결과가 없으면 (None, None)."""
+    output_dir = config.VALIDATION_SETTINGS["output_dir"]
+    cars_path, bins_path = output_dir / CARS_FILE, output_dir / BINS_FILE
+    if not cars_path.exists() or not bins_path.exists():
+        return None, None
+    return pd.read_csv(cars_path, encoding='utf-8-sig'), pd.read_csv(bins_path, encoding='utf-8-sig')
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="저장된 Trip의 물리식 전력을 측정 전력과 비교하여 검증합니다.")
+    parser.add_argument("--car", action="append", dest="cars", default=None,
+                        help="검증할 차종 (여러 번 지정 가능, 기본: 카탈로그의 모든 차종)")
+    parser.add_argument("--processes", type=int, default=None, help="Trip 파일을 읽을 프로세스 수 (기본: CPU 코어 수)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    return run_validation(config, args.cars, args.processes)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,31 @@ script_dir = os.path.dirname(os.path.abspath(__file__))
 # Construct the path to the JSON file
 json_path = os.path.join(script_dir, 'vehicle_data.json')
 
-try:
-    with open(json_path, 'r') as f:
-        vehicle_dict = json.load(f)
-except FileNotFoundError:
-    # Try to load the example file if the main one is not found
-    example_path = os.path.join(script_dir, 'vehicle_data.example.json')
+
+def _load_vehicle_dict():
     try:
-        with open(example_path, 'r') as f:
-            print(f"Warning: '{os.path.basename(json_path)}' not found. Loading example data from '{os.path.basename(example_path)}'.")
-            vehicle_dict = json.load(f)
+        with open(json_path, 'r') as f:
+            return json.load(f)
     except FileNotFoundError:
-        print(f"Error: Neither '{os.path.basename(json_path)}' nor '{os.path.basename(example_path)}' were found.")
-        vehicle_dict = {}
-except json.JSONDecodeError:
-    print(f"Error: Could not decode JSON from the file {json_path}.")
-    print("Please check the file for syntax errors.")
-    vehicle_dict = {}
+        # Try to load the example file if the main one is not found
+        example_path = os.path.join(script_dir, 'vehicle_data.example.json')
+        try:
+            with open(example_path, 'r') as f:
+                print(f"Warning: '{os.path.basename(json_path)}' not found. Loading example data from '{os.path.basename(example_path)}'.")
+                return json.load(f)
+        except FileNotFoundError:
+            print(f"Error: Neither '{os.path.basename(json_path)}' nor '{os.path.basename(example_path)}' were found.")
+            return {}
+    except json.JSONDecodeError:
+        print(f"Error: Could not decode JSON from the file {json_path}.")
+        print("Please check the file for syntax errors.")
+        return {}
+
+
+def __getattr__(name):
+    # vehicle_dict is read on first access rather than at import time, so spawned
+    # worker processes that never look at the vehicle list skip the JSON read.
+    if name == "vehicle_dict":
+        globals()["vehicle_dict"] = _load_vehicle_dict()
+        return globals()["vehicle_dict"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
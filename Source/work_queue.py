@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import socket
+import time
+import zlib
+from datetime import datetime
+
+# 공유 드라이브의 파일 잠금 기반 작업 큐: 여러 노드가 한 차량군을 나누어 처리할 때 단말기를 중복 처리하지 않도록 합니다.
+#     <queue_dir>/<큐 이름>/<차종>__<단말기>.claim   처리 중 (O_CREAT | O_EXCL로 만든 노드만 처리)
+#     <queue_dir>/<큐 이름>/<차종>__<단말기>.done    처리 완료 (상태 기록)
+# 같은 큐 이름을 쓰는 노드끼리 단말기를 나누며, 보통 야간 실행 날짜를 큐 이름으로 사용합니다.
+
+# 만료된 처리 중 표시를 회수하는 동안 잡는 잠금의 최대 유지 시간(초)
+_RECLAIM_LOCK_SECONDS = 60
+
+
+def parse_shard_spec(spec):
+    """'3/8' 형식의 샤드 지정(8개 중 3번째)을 (3, 8)로 바꿉니다."""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise ValueError(f"샤드 지정은 'k/n' 형식이어야 합니다: {spec}") from None
+    if not 1 <= index <= count:
+        raise ValueError(f"샤드 번호는 1~{count} 사이여야 합니다: {spec}")
+    return index, count
+
+
+def in_shard(device_id, shard):
+    """단말기 ID의 해시로 정적 샤드를 나눕니다. 매니페스트나 노드와 관계없이 항상 같은 샤드에 배정됩니다."""
+    index, count = shard
+    return zlib.crc32(device_id.encode('utf-8')) % count == index - 1
+
+
+def node_id():
+    """기본 노드 이름 (호스트 이름)."""
+    return socket.gethostname()
+
+
+def queue_dir(config, queue_name):
+    return config.WORK_QUEUE["dir"] / queue_name
+
+
+def _task_path(qdir, car_model, device_id, suffix):
+    return qdir / f"{car_model}__{device_id}.{suffix}"
+
+
+def _pid_alive(pid):
+    if os.name == 'nt':
+        # Windows에서는 os.kill(pid, 0)로 생존 여부를 확인할 수 없어 만료 시간으로만 판단합니다.
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _is_stale(claim_path, stale_seconds):
+    """
+    처리 중 표시가 버려졌는지 판단합니다.
+    같은 호스트에서 만든 표시는 프로세스가 없으면 바로, 다른 호스트의 표시는 stale_seconds가 지나면 만료로 봅니다.
+    """
+    try:
+        with open(claim_path, 'r', encoding='utf-8') as f:
+            claim = json.load(f)
+        age = time.time() - claim_path.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    except (OSError, json.JSONDecodeError):
+        # 기록 도중 멈춘 표시
+        claim, age = {}, time.time() - claim_path.stat().st_mtime
+    if claim.get("host") == socket.gethostname() and claim.get("pid") and not _pid_alive(claim["pid"]):
+        return True
+    return age > stale_seconds
+
+
+def _create_claim(claim_path, node):
+    try:
+        fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({"node": node, "host": socket.gethostname(), "pid": os.getpid(),
+                   "claimed": datetime.now().isoformat(timespec='seconds')}, f)
+    return True
+
+
+def try_claim(queue, car_model, device_id):
+    """
+    단말기를 이 노드가 처리하도록 표시합니다. 이미 완료되었거나 다른 노드가 처리 중이면 False.
+    queue: {"dir", "node", "stale_seconds"}
+    """
+    qdir = queue["dir"]
+    qdir.mkdir(parents=True, exist_ok=True)
+    if _task_path(qdir, car_model, device_id, "done").exists():
+        return False
+    claim_path = _task_path(qdir, car_model, device_id, "claim")
+    if _create_claim(claim_path, queue["node"]):
+        return True
+    if not _is_stale(claim_path, queue["stale_seconds"]):
+        return False
+    # 만료된 표시의 회수는 회수 잠금(O_EXCL)을 잡은 노드 하나만 합니다.
+    # 잠금 없이 지우면 다른 노드가 방금 새로 만든 표시를 지울 수 있습니다.
+    reclaim_path = claim_path.with_name(claim_path.name + ".reclaim")
+    try:
+        os.close(os.open(reclaim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        # 회수 도중 멈춘 노드의 잠금은 일정 시간이 지나면 치웁니다.
+        try:
+            if time.time() - reclaim_path.stat().st_mtime > _RECLAIM_LOCK_SECONDS:
+                reclaim_path.unlink(missing_ok=True)
+        except FileNotFoundError:
+            pass
+        return False
+    try:
+        if not _is_stale(claim_path, queue["stale_seconds"]):
+            return False
+        claim_path.unlink(missing_ok=True)
+        logging.warning(f"[{device_id}] 만료된 처리 중 표시를 회수합니다.")
+        return _create_claim(claim_path, queue["node"])
+    finally:
+        reclaim_path.unlink(missing_ok=True)
+
+
+def mark_done(queue, car_model, device_id, status):
+    """단말기 처리 완료를 기록하고 처리 중 표시를 지웁니다."""
+    qdir = queue["dir"]
+    done_path = _task_path(qdir, car_model, device_id, "done")
+    tmp_path = done_path.with_name(f"{done_path.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump({"node": queue["node"], "status": status, "finished": datetime.now().isoformat(timespec='seconds')}, f)
+    os.replace(tmp_path, done_path)
+    _task_path(qdir, car_model, device_id, "claim").unlink(missing_ok=True)
+
+
+def summarize_queue(qdir):
+    """큐 폴더의 단말기 상태별 개수 {"done", "claimed"}."""
+    if not qdir.exists():
+        return {"done": 0, "claimed": 0}
+    return {"done": len(list(qdir.glob('*.done'))), "claimed": len(list(qdir.glob('*.claim')))}
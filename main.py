@@ -1,16 +1,28 @@
+import argparse
+import atexit
 import logging
 import multiprocessing
 import os
-from tqdm import tqdm
-from Source import config, data_loader, physics_power, trip_parser, report_generator
-from Source.vehicle_config import vehicle_dict
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+# 메뉴를 띄우기 전에는 pandas/openpyxl/tqdm을 불러오지 않는 가벼운 모듈만 import 합니다.
+# 데이터 처리/리포트 모듈은 쓰는 함수 안에서 import 하며, 워커는 _init_worker에서 한 번만 불러옵니다.
+from Source import config, file_manifest, run_journal, telemetry, vehicle_config, work_queue
 
 # 로깅 기본 설정
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(processName)s - %(levelname)s - %(message)s')
 
+# 메뉴 작업 사이에 재사용하는 워커 풀 (_get_pool)과 풀을 만든 설정
+_pool = None
+_pool_key = None
+# 워커 프로세스에서 _init_worker가 한 번 읽어 두는 값
+_worker_state = {}
+
 def select_vehicles():
     """사용자로부터 처리할 차종을 선택받습니다."""
     print("처리할 차종을 선택하세요 (여러 개 선택 시 쉼표(,)로 구분).")
+    vehicle_dict = vehicle_config.vehicle_dict
     car_options = {i + 1: car for i, car in enumerate(vehicle_dict.keys())}
     for i, car in car_options.items():
         print(f"{i}: {car}")
@@ -32,68 +44,433 @@ def select_vehicles():
         except (ValueError, KeyError):
             logging.error("잘못된 입력입니다. 숫자를 쉼표로 구분하여 입력해주세요.")
 
+def _power_chunks(chunks, params, resume_time, stats, until_time=None):
+    """
+    각 청크에 물리식 전력을 계산하여 반환합니다.
+    증분 실행이면 문맥으로 읽은 구간(재개 시각 이전)은 잘라내고, 이전 실행의 마지막으로 닫힌 Trip 다음 구간부터 넘깁니다.
+    샤드 작업이면 샤드 구간 끝(until_time) 이후의 행도 잘라냅니다.
+    """
+    from Source import physics_power
+    for df in chunks:
+        with telemetry.stage("physics", rows_in=len(df)) as counter:
+            df_power = physics_power.add_physics_power(df, params) if params else df
+            counter.rows_out = len(df_power)
+        if resume_time is not None:
+            df_power = df_power[df_power['time'] >= resume_time].reset_index(drop=True)
+        if until_time is not None:
+            df_power = df_power[df_power['time'] < until_time].reset_index(drop=True)
+        if not df_power.empty:
+            stats["rows"] += len(df_power)
+            yield df_power
+
+
+def _load_chunks(device_id, device_files, options):
+    from Source import data_loader
+    if options.get("streaming"):
+        # 대용량 단말기: 전체 이력을 합치지 않고 월 단위 청크로 순차 처리
+        return data_loader.iter_device_chunks(device_id, config, device_files)
+    df = data_loader.load_and_merge_device_data(device_id, config, device_files)
+    return [df] if df is not None and not df.empty else []
+
+
+def _vehicle_params(car_model):
+    params = _worker_state.get("vehicle_params", config.VEHICLE_PARAMS).get(car_model)
+    if not params:
+        logging.warning(f"[{car_model}] 차량 파라미터가 없어 물리식 계산을 건너뜁니다.")
+    return params
+
+
+def _process_whole_device(car_model, device_id, device_files, options):
+    from Source import run_state, trip_catalog, trip_parser
+    # 0. 증분 실행: 마지막 성공 실행 이후 바뀐 원본 파일이 있는 월부터만 처리
+    # 변경 판단과 실행 상태 기록에는 매니페스트 값 대신 지금 stat한 크기/수정시각을 사용합니다.
+    device_files = file_manifest.restat_device_files(device_files)
+    state = run_state.load_device_state(car_model, device_id, config)
+    fingerprint = run_state.config_fingerprint(car_model, config)
+    if options.get("incremental"):
+        plan = run_state.plan_device_run(state, device_files, fingerprint)
+    else:
+        plan = {"mode": "full", "kept_trips": []}
+
+    if plan["mode"] == "skip":
+        return {"status": "SKIPPED", "message": "No changes"}
+    files_to_load = device_files
+    if plan["mode"] == "incremental":
+        files_to_load = run_state.select_files_from_month(device_files, plan["load_from_month"])
+
+    # 1. 데이터 로딩 (단말기 단위)
+    # tqdm 진행바와의 출력이 겹치지 않도록 로깅 메시지는 간소화할 수 있습니다.
+    # logging.info(f"--- [{car_model} - {device_id}] 파이프라인 시작 ---")
+    chunks = _load_chunks(device_id, files_to_load, options)
+    params = _vehicle_params(car_model)
+
+    # 2. 물리식 전력 계산 / 3. Trip 분할 및 저장 (청크 단위로 이어서 처리)
+    stats = {"rows": 0}
+    resume_time = plan["resume_time"] if plan["mode"] == "incremental" else None
+    trip_counter_start = plan["trip_counter_start"] if plan["mode"] == "incremental" else 1
+    saved_trips = trip_parser.parse_and_save_trip_stream(
+        _power_chunks(chunks, params, resume_time, stats), car_model, device_id, config, trip_counter_start
+    )
+    if stats["rows"] == 0:
+        logging.warning(f"[{device_id}] 처리할 데이터가 없어 건너뜁니다.")
+        return {"status": "SKIPPED", "message": "No data"}
+
+    run_state.remove_stale_trips(state, plan["kept_trips"], saved_trips)
+    trip_catalog.replace_device_trips(car_model, device_id, trip_counter_start, saved_trips, config)
+    run_state.save_device_state(car_model, device_id, device_files, plan["kept_trips"] + saved_trips, fingerprint, config)
+    return {"status": "SUCCESS"}
+
+
+def _process_shard(car_model, device_id, device_files, options):
+    """
+    대용량 단말기의 샤드(연월 구간) 하나를 처리합니다.
+    Trip은 샤드 임시 폴더에 임시 번호로 저장하고, 경계에 걸친 첫/마지막 구간은 부모 프로세스로 넘깁니다.
+    """
+    from Source import trip_parser, trip_store
+    shard = options["shard"]
+    chunks = _load_chunks(device_id, device_files, options)
+    params = _vehicle_params(car_model)
+
+    stats = {"rows": 0}
+    writer = trip_store.open_trip_writer(car_model, device_id, config, 1, root=shard["staging_root"])
+    try:
+        shard_result = trip_parser.parse_shard_trip_stream(
+            _power_chunks(chunks, params, shard["from_time"], stats, shard["until_time"]),
+            car_model, device_id, config, writer, hold_head=shard["index"] > 0
+        )
+    except BaseException:
+        # 저장 스레드의 오류가 원래 예외를 가리지 않도록 닫기만 하고 다시 던집니다.
+        writer.close(raise_error=False)
+        raise
+    writer.close()
+    return {"status": "SHARD", "shard_result": shard_result, "rows": stats["rows"]}
+
+
 def process_device(args):
     """
-    단일 단말기에 대한 전체 데이터 처리 파이프라인.
+    단일 단말기(또는 단말기 샤드)에 대한 전체 데이터 처리 파이프라인.
     멀티프로세싱의 각 워커(worker) 프로세스가 이 함수를 실행합니다.
+    반환값: {"status", "car_model", "device_id", "shard", "pid", "started", "finished", ...}
+        status: SUCCESS / SKIPPED / FAILED, 샤드 작업은 SHARD (부모가 이어 붙인 뒤 단말기 결과를 정함),
+                작업 큐 실행에서 다른 노드가 이미 맡은 단말기는 CLAIMED
     """
-    car_model, device_id = args  # 인자 언패킹
+    car_model, device_id, device_files, options = args  # 인자 언패킹 (device_files: 매니페스트 조회 결과)
+    shard = options.get("shard")
+    queue = options.get("queue")
+    result = {
+        "car_model": car_model, "device_id": device_id,
+        "shard": shard["index"] if shard else None,
+        "pid": os.getpid(), "started": time.time(),
+        "worker_init_s": _worker_state.get("init_seconds"), "worker_ready": _worker_state.get("ready"),
+    }
+    telemetry.start_device(car_model, device_id, result["shard"])
     try:
-        # 1. 데이터 로딩 (단말기 단위)
-        # tqdm 진행바와의 출력이 겹치지 않도록 로깅 메시지는 간소화할 수 있습니다.
-        # logging.info(f"--- [{car_model} - {device_id}] 파이프라인 시작 ---")
-        df = data_loader.load_and_merge_device_data(device_id, config)
-        if df is None or df.empty:
+        if queue and not work_queue.try_claim(queue, car_model, device_id):
+            result.update(status="CLAIMED", message="다른 노드에서 처리 중이거나 완료됨")
+        elif shard:
+            result.update(_process_shard(car_model, device_id, device_files, options))
+        else:
+            result.update(_process_whole_device(car_model, device_id, device_files, options))
+    except Exception as e:
+        # 에러가 발생해도 다른 프로세스에 영향을 주지 않고 계속 진행됩니다.
+        logging.error(f"❌ [{car_model} - {device_id}] 처리 중 오류 발생: {e}", exc_info=False)
+        result.update(status="FAILED", message=str(e))
+    if queue and result["status"] != "CLAIMED":
+        # 실패한 단말기도 완료로 기록하여 다른 노드가 같은 오류를 반복하지 않도록 합니다. (재처리는 --resume)
+        work_queue.mark_done(queue, car_model, device_id, result["status"])
+    result["finished"] = time.time()
+    result["telemetry"] = dict(telemetry.finish_device(), status=result["status"])
+    return result
+
+
+def _finish_sharded_device(car_model, device_id, device_files, shard_results):
+    """
+    한 단말기의 모든 샤드 결과를 이어 붙여 최종 Trip 번호로 저장하고 실행 상태/카탈로그를 갱신합니다.
+    반환값: 단말기 단위 결과 {"status", "message", "telemetry"(병합 단계 기록)}
+    """
+    telemetry.start_device(car_model, device_id, shard="stitch")
+    result = _stitch_sharded_device(car_model, device_id, device_files, shard_results)
+    result["telemetry"] = dict(telemetry.finish_device(), status=result["status"])
+    return result
+
+
+def _stitch_sharded_device(car_model, device_id, device_files, shard_results):
+    from Source import run_state, scheduler, trip_catalog, trip_parser, trip_store
+    try:
+        failed = [r for r in shard_results if r["status"] == "FAILED"]
+        if failed:
+            return {"status": "FAILED", "message": f"샤드 {len(failed)}개 실패"}
+        if sum(r["rows"] for r in shard_results) == 0:
             logging.warning(f"[{device_id}] 처리할 데이터가 없어 건너뜁니다.")
-            return f"SKIPPED: {device_id} (No data)"
+            return {"status": "SKIPPED", "message": "No data"}
 
-        # 2. 물리식 전력 계산
-        params = config.VEHICLE_PARAMS.get(car_model)
-        if not params:
-            logging.warning(f"[{car_model}] 차량 파라미터가 없어 물리식 계산을 건너뜁니다.")
-            df_power = df
-        else:
-            df_power = physics_power.add_physics_power(df, params)
+        state = run_state.load_device_state(car_model, device_id, config)
+        fingerprint = run_state.config_fingerprint(car_model, config)
+        ordered = [r["shard_result"] for r in sorted(shard_results, key=lambda r: r["shard"])]
 
-        # 3. Trip 분할 및 저장
-        trip_parser.parse_and_save_trips(df_power, car_model, device_id, config)
-        
-        return f"SUCCESS: {device_id}"
+        writer = trip_store.open_trip_writer(car_model, device_id, config, 1)
+        try:
+            saved_trips = trip_parser.stitch_shard_trips(
+                ordered, car_model, device_id, config, writer,
+                lambda shard_result, first_trip_no: trip_store.promote_staged_trips(
+                    shard_result["trips"], first_trip_no, car_model, device_id, config
+                ),
+            )
+        except BaseException:
+            writer.close(raise_error=False)
+            raise
+        writer.close()
 
+        run_state.remove_stale_trips(state, [], saved_trips)
+        trip_catalog.replace_device_trips(car_model, device_id, 1, saved_trips, config)
+        run_state.save_device_state(car_model, device_id, device_files, saved_trips, fingerprint, config)
+        return {"status": "SUCCESS"}
     except Exception as e:
-        # 에러가 발생해도 다른 프로세스에 영향을 주지 않고 계속 진행됩니다.
-        logging.error(f"❌ [{car_model} - {device_id}] 처리 중 오류 발생: {e}", exc_info=False)
-        return f"FAILED: {device_id} ({e})"
+        logging.error(f"❌ [{car_model} - {device_id}] 샤드 병합 중 오류 발생: {e}", exc_info=False)
+        return {"status": "FAILED", "message": str(e)}
+    finally:
+        scheduler.clear_staging(car_model, device_id, config)
 
 
-def run_pipeline(selected_cars):
-    """선택된 차량에 대해 단말기 단위로 전체 데이터 처리 파이프라인을 병렬 실행합니다."""
+def _num_processes():
+    """사용할 CPU 코어 수 설정"""
+    return max(1, os.cpu_count() - 2)
+
+
+def _init_worker(path_overrides):
+    """
+    워커 프로세스 초기화 (워커마다 한 번): 노드별 경로(Trip 카탈로그)를 워커의 설정에도 반영하고,
+    처리 모듈 import와 차량 파라미터 읽기를 첫 작업 전에 끝내 둡니다.
+    spawn 방식(Windows 등)에서는 워커가 main을 다시 import 하므로, 리포트(openpyxl) 등 처리에 쓰지 않는 모듈은 불러오지 않습니다.
+    """
+    started = time.perf_counter()
+    config.PATHS.update(path_overrides)
+    from Source import data_loader, physics_power, run_state, trip_catalog, trip_parser, trip_store  # noqa: F401
+    _worker_state.update(
+        vehicle_params=dict(config.VEHICLE_PARAMS),
+        init_seconds=time.perf_counter() - started,
+        ready=time.time(),
+    )
+
+
+def _get_pool(num_processes, path_overrides):
+    """
+    워커 풀을 반환합니다. 같은 프로세스 수/노드별 경로로 만든 풀이 있으면 메뉴 작업 사이에 그대로 재사용하여
+    워커 기동(모듈 import, 초기화) 시간을 한 번만 씁니다. 반환값: (풀, 새로 만들었는지 여부)
+    """
+    global _pool, _pool_key
+    key = (num_processes, tuple(sorted((name, str(path)) for name, path in path_overrides.items())))
+    if _pool is not None and _pool_key == key:
+        return _pool, False
+    close_pool()
+    _pool = multiprocessing.Pool(processes=num_processes, initializer=_init_worker, initargs=(path_overrides,))
+    _pool_key = key
+    return _pool, True
+
+
+def close_pool(terminate=False):
+    """재사용 중인 워커 풀을 닫습니다. terminate=True면 진행 중인 작업을 기다리지 않고 종료합니다. (중단/오류 시)"""
+    global _pool, _pool_key
+    if _pool is None:
+        return
+    if terminate:
+        _pool.terminate()
+    else:
+        _pool.close()
+    _pool.join()
+    _pool, _pool_key = None, None
+
+
+# 메뉴/명령행 밖에서 run_pipeline을 호출한 경우에도 인터프리터 종료 전에 워커 풀을 정리합니다.
+atexit.register(close_pool)
+
+
+def run_pipeline(selected_cars, incremental=False, resume_run=None, device_ids=None, distributed=None, rescan=False):
+    """
+    선택된 차량에 대해 단말기 단위로 전체 데이터 처리 파이프라인을 병렬 실행합니다.
+    incremental=True면 마지막 성공 실행 이후 신규/변경된 월만 처리합니다.
+    작업은 원본 용량이 큰 순서로 배분하며, 전체 실행에서는 아주 큰 단말기를 연월 샤드로 나누어 병렬 처리합니다.
+    resume_run: run_journal.load_interrupted_run()의 결과. 주어지면 같은 설정/코드로 이미 완료된 단말기를 건너뛰고
+    나머지 단말기의 잔여 출력을 정리한 뒤 같은 실행 저널에 이어서 기록합니다.
+    device_ids: 처리할 단말기 ID 목록 (None이면 선택된 차종의 전체 단말기)
+    distributed: 여러 노드로 나누어 실행할 때의 설정 {"node", "shard": [k, n] 또는 None, "queue": 큐 이름 또는 None}
+        shard가 주어지면 단말기 ID 해시로 정한 k번째 몫만, queue가 주어지면 공유 작업 큐에서 맡은 단말기만 처리합니다.
+        Trip 카탈로그와 실행 저널은 노드별 파일에 기록하며, 모든 노드가 끝난 뒤 merge_outputs()로 합칩니다.
+    rescan: 매니페스트를 재사용하지 않고 원본 트리의 모든 파일 크기/수정시각을 다시 읽습니다.
+    """
+    from Source import trip_catalog
+    path_overrides = {}
+    if distributed:
+        path_overrides["trip_catalog"] = trip_catalog.node_catalog_path(config, distributed["node"])
+    # 노드별 경로는 이번 실행 동안만 사용합니다. (같은 프로세스에서 이어서 병합/리포트할 때는 공유 경로)
+    original_paths = {key: config.PATHS[key] for key in path_overrides}
+    config.PATHS.update(path_overrides)
+    try:
+        _run_pipeline(selected_cars, incremental, resume_run, device_ids, distributed, path_overrides, rescan)
+    finally:
+        config.PATHS.update(original_paths)
+
+
+def _run_pipeline(selected_cars, incremental, resume_run, device_ids, distributed, path_overrides, rescan):
+    from tqdm import tqdm
+    from Source import run_state, scheduler, trip_arrays
+    vehicle_dict = vehicle_config.vehicle_dict
     logging.info(f"선택된 차종: {', '.join(selected_cars)}")
+    options = {"incremental": incremental}
+    node = distributed["node"] if distributed else None
+    shard = tuple(distributed["shard"]) if distributed and distributed.get("shard") else None
+    queue_name = distributed.get("queue") if distributed else None
+    if distributed:
+        logging.info(f"분산 실행: 노드 {node}" + (f", 샤드 {shard[0]}/{shard[1]}" if shard else "")
+                     + (f", 작업 큐 '{queue_name}'" if queue_name else ""))
+    if queue_name:
+        options["queue"] = {
+            "dir": work_queue.queue_dir(config, queue_name), "node": node,
+            "stale_seconds": config.WORK_QUEUE["stale_claim_seconds"],
+        }
+
+    # 원본 트리를 단말기마다 glob 하지 않고, 한 번의 병렬 스캔으로 만든 매니페스트에서 조회합니다.
+    all_device_ids = [dev_id for dev_ids in vehicle_dict.values() for dev_id in dev_ids]
+    manifest = file_manifest.refresh_manifest(config, all_device_ids, full_rescan=rescan)
 
+    # 원본 용량이 큰 단말기는 월 단위 스트리밍으로 처리하여 워커 메모리를 제한합니다.
+    streaming_threshold = config.STREAMING_SETTINGS["min_device_bytes"]
     devices_to_process = []
+    device_files_by_key = {}
     for car in selected_cars:
-        devices_to_process.extend([(car, dev_id) for dev_id in vehicle_dict.get(car, [])])
+        for dev_id in vehicle_dict.get(car, []):
+            if device_ids is not None and dev_id not in device_ids:
+                continue
+            if shard is not None and not work_queue.in_shard(dev_id, shard):
+                continue
+            device_files = file_manifest.lookup_device_files(manifest, dev_id)
+            device_bytes = scheduler.device_bytes(device_files)
+            device_options = dict(options, streaming=config.STREAMING_SETTINGS["enabled"] and device_bytes >= streaming_threshold)
+            devices_to_process.append((car, dev_id, device_files, device_options))
+            device_files_by_key[(car, dev_id)] = device_files
     
+    # 단말기별 설정/코드 지문 (실행 저널에 완료 기록과 함께 남겨 이어서 실행할 때 비교)
+    code_fp = run_journal.code_fingerprint()
+    fingerprints = {
+        (car, dev_id): run_journal.device_fingerprint(run_state.config_fingerprint(car, config), code_fp)
+        for car, dev_id, _, _ in devices_to_process
+    }
+    if resume_run is not None:
+        completed = resume_run["completed"]
+        remaining = [d for d in devices_to_process if completed.get((d[0], d[1])) != fingerprints[(d[0], d[1])]]
+        logging.info(f"중단된 실행을 이어서 처리합니다: 완료된 단말기 {len(devices_to_process) - len(remaining)}개 건너뜀, "
+                     f"남은 단말기 {len(remaining)}개")
+        devices_to_process = remaining
+        for car in selected_cars:
+            run_state.remove_orphan_outputs(car, [dev_id for c, dev_id, _, _ in devices_to_process if c == car], config)
+    journal_path = run_journal.journal_path_for(config, node)
+    if resume_run is None:
+        run_journal.start_run(journal_path, selected_cars, incremental, device_ids, distributed)
+
     if not devices_to_process:
         logging.warning("처리할 단말기가 없습니다.")
+        run_journal.finish_run(journal_path)
         return
 
-    # 사용할 CPU 코어 수 설정 
-    num_processes = max(1, os.cpu_count() - 2)
-    logging.info(f"총 {len(devices_to_process)}개의 단말기를 {num_processes}개의 프로세스로 병렬 처리합니다.")
+    num_processes = _num_processes()
+    # 증분 실행은 처리 범위를 워커가 실행 상태를 보고 정하므로 샤드로 나누지 않습니다.
+    # 작업 큐 실행은 단말기 단위로 노드에 배정하므로 한 단말기를 연월 샤드로 나누지 않습니다.
+    allow_shards = not incremental and "queue" not in options
+    tasks, shard_counts = scheduler.build_tasks(devices_to_process, config, num_processes, allow_shards=allow_shards)
+    # 샤드로 나눈 단말기의 실행 상태는 부모가 기록하므로, 샤드가 원본을 읽기 전에 지금 크기/수정시각을 잡아 둡니다.
+    for key in shard_counts:
+        device_files_by_key[key] = file_manifest.restat_device_files(device_files_by_key[key])
+    logging.info(f"총 {len(devices_to_process)}개의 단말기({len(tasks)}개 작업)를 {num_processes}개의 프로세스로 병렬 처리합니다.")
 
-    # with 문을 사용하여 Pool 객체를 안전하게 관리합니다.
-    with multiprocessing.Pool(processes=num_processes) as pool:
+    results = []          # 단말기 단위 결과
+    task_timings = []     # 작업(단말기/샤드) 단위 실행 시간 - 워커 가동률 계산용
+    telemetry_records = []
+    telemetry_log = telemetry.open_run_log(config, node)
+    pending_shards = {}
+    pool_started = time.time()
+    # 워커 풀은 메뉴 작업 사이에 재사용합니다. 중단/오류가 나면 워커를 종료하고 다음 실행에서 새로 만듭니다.
+    pool, new_pool = _get_pool(num_processes, path_overrides)
+    try:
         # imap_unordered: 작업을 분배하고 완료되는 순서대로 결과를 반환 (효율적)
+        # chunksize=1: 큰 작업부터 정렬된 순서를 그대로 유지하여 한 번에 하나씩 배분
         # tqdm: 진행 상황을 시각적으로 보여주는 라이브러리
-        results = list(tqdm(pool.imap_unordered(process_device, devices_to_process), total=len(devices_to_process), desc="단말기 처리 중"))
+        for result in tqdm(pool.imap_unordered(process_device, tasks, chunksize=1), total=len(tasks), desc="단말기 처리 중"):
+            task_timings.append({key: result[key] for key in ("pid", "started", "finished", "worker_init_s", "worker_ready")})
+            telemetry_records.append(result["telemetry"])
+            telemetry.append_record(telemetry_log, result["telemetry"])
+            key = (result["car_model"], result["device_id"])
+            if result["shard"] is None:
+                results.append(result)
+                run_journal.record_device(journal_path, *key, result["status"], fingerprints[key])
+                continue
+            # 샤드가 모두 끝난 단말기는 부모 프로세스에서 경계 Trip을 이어 붙이고 번호를 확정합니다.
+            pending_shards.setdefault(key, []).append(result)
+            if len(pending_shards[key]) == shard_counts[key]:
+                shard_results = pending_shards.pop(key)
+                device_result = _finish_sharded_device(*key, device_files_by_key[key], shard_results)
+                telemetry_records.append(device_result["telemetry"])
+                telemetry.append_record(telemetry_log, device_result["telemetry"])
+                results.append({"car_model": key[0], "device_id": key[1], **device_result})
+                run_journal.record_device(journal_path, *key, device_result["status"], fingerprints[key])
+    except BaseException:
+        close_pool(terminate=True)
+        raise
+    wall_seconds = time.time() - pool_started
+    run_journal.finish_run(journal_path)
 
     logging.info("모든 병렬 처리가 완료되었습니다.")
     # 처리 결과 요약
-    success_count = sum(1 for r in results if r.startswith("SUCCESS"))
-    skipped_count = sum(1 for r in results if r.startswith("SKIPPED"))
-    failed_count = sum(1 for r in results if r.startswith("FAILED"))
-    logging.info(f"처리 결과: 성공 {success_count}건, 건너뜀 {skipped_count}건, 실패 {failed_count}건")
+    success_count = sum(1 for r in results if r["status"] == "SUCCESS")
+    skipped_count = sum(1 for r in results if r["status"] == "SKIPPED")
+    failed_count = sum(1 for r in results if r["status"] == "FAILED")
+    claimed_count = sum(1 for r in results if r["status"] == "CLAIMED")
+    logging.info(f"처리 결과: 성공 {success_count}건, 건너뜀 {skipped_count}건, 실패 {failed_count}건"
+                 + (f", 다른 노드 처리 {claimed_count}건" if "queue" in options else ""))
+    for r in results:
+        if r["status"] == "FAILED":
+            logging.info(f"  - 실패: {r['car_model']} {r['device_id']} ({r.get('message')})")
+    scheduler.log_worker_startup(task_timings, pool_started, new_pool)
+    scheduler.log_worker_utilization(task_timings, wall_seconds, num_processes)
+    telemetry.log_run_summary(telemetry_records, config.TELEMETRY.get("summary_top_n", 5))
+    if telemetry_log is not None:
+        logging.info(f"단계별 실행 기록: {telemetry_log}")
+    if "queue" in options:
+        counts = work_queue.summarize_queue(options["queue"]["dir"])
+        logging.info(f"작업 큐 '{queue_name}': 완료 {counts['done']}개, 처리 중 {counts['claimed']}개")
+    # 학습용 배열 저장소는 전체 카탈로그가 필요하므로, 분산 실행에서는 노드 카탈로그를 합칠 때 만듭니다.
+    if config.TRIP_ARRAYS.get("enabled", False) and distributed is None:
+        trip_arrays.export_arrays(config, selected_cars, pool=pool)
+
+
+def resume_pipeline(node=None, rescan=False):
+    """실행 저널에 종료 기록 없이 멈춘 마지막 실행을 같은 차종/방식(분산 실행이면 같은 노드 설정)으로 이어서 처리합니다."""
+    interrupted = run_journal.load_interrupted_run(run_journal.journal_path_for(config, node))
+    if interrupted is None:
+        logging.info("이어서 처리할 중단된 실행이 없습니다.")
+        return
+    run_pipeline(interrupted["selected_cars"], incremental=interrupted["incremental"], resume_run=interrupted,
+                 device_ids=interrupted["device_ids"], distributed=interrupted["distributed"], rescan=rescan)
+
+
+def merge_outputs():
+    """
+    분산 실행한 노드들의 Trip 카탈로그를 공유 카탈로그로 합치고 리포트를 생성합니다.
+    Trip 파일과 실행 상태는 단말기별로 나뉘어 공유 폴더에 바로 저장되므로 따로 합칠 필요가 없습니다.
+    """
+    from Source import report_generator, trip_arrays, trip_catalog
+    merged = trip_catalog.merge_node_catalogs(config)
+    logging.info(f"노드 카탈로그 {merged}개를 합쳤습니다.")
+    if config.TRIP_ARRAYS.get("enabled", False):
+        catalog_df = trip_catalog.load_catalog(config)
+        if catalog_df is not None:
+            trip_arrays.export_arrays(config, sorted(catalog_df['car_model'].unique()))
+    report_generator.generate_trip_report(config)
+
+
+def _ask_rescan():
+    """원본 파일 전체 재스캔 여부를 묻습니다. (이전 달 파일을 같은 경로에 다시 추출한 경우 필요)"""
+    answer = input("원본 파일을 전체 재스캔할까요? 이전 달 파일을 다시 추출했다면 y (y/N): ")
+    return answer.strip().lower() == 'y'
 
 
 def main_menu():
@@ -104,27 +481,126 @@ def main_menu():
         print("="*50)
         print("1: 전체 파이프라인 실행 (병렬 처리)")
         print("2: Trip 생성 결과 리포트 생성 (Excel)")
+        print("3: 증분 파이프라인 실행 (신규/변경 월만 처리)")
+        print("4: Parquet Trip 저장소를 기존 CSV 형식으로 내보내기")
+        print("5: 저장된 Trip으로 물리식 파라미터 보정")
+        print("6: 중단된 실행 이어서 처리 (완료된 단말기 건너뜀)")
+        print("7: 학습용 Trip 배열 저장소 만들기 (메모리 맵)")
+        print("8: 실시간 Trip 분할 (새 데이터 감시, Ctrl+C로 종료)")
+        print("9: 물리식 전력 검증 (측정 전력 대비 오차 분석)")
         print("0: 프로그램 종료")
         print("="*50)
         
         choice = input("실행할 작업 번호를 입력하세요: ")
 
-        if choice == '1':
+        if choice in ('1', '3'):
             selected = select_vehicles()
             if selected:
                 # Trip 저장 폴더 미리 생성
                 for car_name in selected:
                     (config.PATHS["output_trip"] / car_name).mkdir(parents=True, exist_ok=True)
-                run_pipeline(selected)
+                run_pipeline(selected, incremental=(choice == '3'), rescan=_ask_rescan())
         elif choice == '2':
+            from Source import report_generator
             logging.info("Trip 생성 결과 리포트를 생성합니다...")
             report_generator.generate_trip_report(config)
+        elif choice == '4':
+            selected = select_vehicles()
+            if selected:
+                from Source import trip_store
+                trip_store.export_legacy_csv(config, selected)
+        elif choice == '5':
+            selected = select_vehicles()
+            if selected:
+                from Source import calibration
+                calibration.run_calibration(config, selected, pool=_get_pool(_num_processes(), {})[0])
+        elif choice == '6':
+            resume_pipeline(rescan=_ask_rescan())
+        elif choice == '7':
+            selected = select_vehicles()
+            if selected:
+                from Source import trip_arrays
+                trip_arrays.export_arrays(config, selected, pool=_get_pool(_num_processes(), {})[0])
+        elif choice == '8':
+            selected = select_vehicles()
+            if selected:
+                from Source import live_segmenter
+                live_segmenter.watch(selected, config)
+        elif choice == '9':
+            selected = select_vehicles()
+            if selected:
+                from Source import validation
+                validation.run_validation(config, selected, pool=_get_pool(_num_processes(), {})[0])
         elif choice == '0':
             logging.info("프로그램을 종료합니다.")
+            close_pool()
             break
         else:
             logging.warning("잘못된 번호입니다. 다시 입력해주세요.")
 
+def _parse_args():
+    parser = argparse.ArgumentParser(
+        description="EV 데이터 처리 파이프라인 (옵션 없이 실행하면 대화형 메뉴)",
+        epilog="예) 8개 노드 중 3번째: python main.py --cars all --shard 3/8 / "
+               "작업 큐로 나누기: 각 노드에서 python main.py --cars all --queue 2024-06-01, 끝난 뒤 python main.py --merge",
+    )
+    parser.add_argument("--cars", nargs='+', metavar="CAR", help="처리할 차종 ('all'이면 전체)")
+    parser.add_argument("--devices", nargs='+', metavar="DEVICE_ID", help="처리할 단말기 ID (차종을 생략하면 단말기의 차종을 자동 선택)")
+    parser.add_argument("--incremental", action="store_true", help="신규/변경 월만 처리합니다.")
+    parser.add_argument("--shard", metavar="K/N", help="단말기 ID 해시로 N개로 나눈 것 중 K번째만 처리합니다.")
+    parser.add_argument("--queue", nargs='?', const=time.strftime('%Y-%m-%d'), metavar="NAME",
+                        help="공유 작업 큐로 단말기를 노드끼리 나누어 처리합니다. (기본 큐 이름: 오늘 날짜)")
+    parser.add_argument("--node-id", default=None, help="분산 실행의 노드 이름 (기본: 호스트 이름)")
+    parser.add_argument("--merge", action="store_true", help="노드별 Trip 카탈로그를 합치고 리포트를 생성합니다.")
+    parser.add_argument("--report", action="store_true", help="Trip 생성 결과 리포트를 생성합니다.")
+    parser.add_argument("--resume", action="store_true", help="중단된 마지막 실행을 메뉴 없이 이어서 처리합니다.")
+    parser.add_argument("--rescan", action="store_true",
+                        help="매니페스트를 재사용하지 않고 원본 파일 전체의 크기/수정시각을 다시 읽습니다.")
+    return parser, parser.parse_args()
+
+
+def run_cli(parser, args):
+    """메뉴 없이 명령행 옵션으로 실행합니다. (스케줄러/여러 노드의 야간 실행용)"""
+    vehicle_dict = vehicle_config.vehicle_dict
+    node = args.node_id or work_queue.node_id()
+    distributed_mode = args.shard is not None or args.queue is not None
+    if args.resume:
+        resume_pipeline(node if args.node_id or distributed_mode else None, rescan=args.rescan)
+    elif args.cars or args.devices:
+        if args.cars and 'all' not in args.cars:
+            unknown = [car for car in args.cars if car not in vehicle_dict]
+            if unknown:
+                parser.error(f"알 수 없는 차종: {', '.join(unknown)}")
+            selected = args.cars
+        else:
+            selected = list(vehicle_dict.keys())
+        if args.devices:
+            selected = [car for car in selected if set(vehicle_dict[car]) & set(args.devices)]
+            if not selected:
+                parser.error("선택한 차종에 해당 단말기가 없습니다.")
+        distributed = None
+        if distributed_mode:
+            try:
+                shard = list(work_queue.parse_shard_spec(args.shard)) if args.shard else None
+            except ValueError as e:
+                parser.error(str(e))
+            distributed = {"node": node, "shard": shard, "queue": args.queue}
+        run_pipeline(selected, incremental=args.incremental, device_ids=args.devices, distributed=distributed,
+                     rescan=args.rescan)
+    close_pool()
+    if args.merge:
+        merge_outputs()
+    elif args.report:
+        from Source import report_generator
+        logging.info("Trip 생성 결과 리포트를 생성합니다...")
+        report_generator.generate_trip_report(config)
+
+
 if __name__ == "__main__":
     multiprocessing.freeze_support() 
-    main_menu()
\ No newline at end of file
+    parser, args = _parse_args()
+    logging.info(f"시작 준비 {time.perf_counter() - _IMPORT_STARTED:.2f}초 (main 모듈 import 포함)")
+    if any((args.cars, args.devices, args.merge, args.report, args.resume)):
+        run_cli(parser, args)
+    else:
+        main_menu()
\ No newline at end of file